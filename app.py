@@ -13,7 +13,10 @@ from stacks.data_sandbox_s3 import S3Stack
 from stacks.data_sandbox_service_roles import AppstreamServiceRolesStack
 from stacks.data_sandbox_appstream import AppstreamStack
 from stacks.data_sandbox_start_fleet import AppstreamStartFleetStack
+from stacks.data_sandbox_session_reaper import AppstreamSessionReaperStack
 from stacks.data_sandbox_notebook import NotebookStack
+from stacks.data_sandbox_notebook_idle_stop import NotebookIdleStopStack
+from stacks.data_sandbox_studio import StudioStack
 from stacks.data_sandbox_saml import SamlStack
 
 env = core.Environment(account=os.environ["CDK_DEFAULT_ACCOUNT"], region=os.environ["CDK_DEFAULT_REGION"])
@@ -31,7 +34,16 @@ s3stack = S3Stack(DataSandbox, 's3-stack')
 appstreamservicerolesstack = AppstreamServiceRolesStack(DataSandbox, "appstream-service-roles-stack")
 appstreamstack = AppstreamStack(DataSandbox, 'appstream-stack', vpc=vpcstack.vpc, s3stack=s3stack.data_sandbox_bucket)
 appstreamstartfleetstack = AppstreamStartFleetStack(DataSandbox, 'appstream-start-fleet-stack', appstreamrole=appstreamstack.appstream_role)
+# the fleet, its scaling target and the fleet start need the AppStream service roles to exist
+appstreamstack.add_dependency(appstreamservicerolesstack)
+appstreamstartfleetstack.add_dependency(appstreamservicerolesstack)
+appstreamsessionreaperstack = AppstreamSessionReaperStack(DataSandbox, 'appstream-session-reaper-stack')
+appstreamsessionreaperstack.add_dependency(appstreamstack)
 notebookstack = NotebookStack(DataSandbox, 'notebook-stack', vpc=vpcstack.vpc, s3stack=s3stack.data_sandbox_bucket, appstreamsg=appstreamstack.appstream_security_group)
+notebookidlestopstack = NotebookIdleStopStack(DataSandbox, 'notebook-idle-stop-stack')
+notebookidlestopstack.add_dependency(notebookstack)
+if app.node.try_get_context('sandbox_backend') == 'studio':
+    studiostack = StudioStack(DataSandbox, 'studio-stack', vpc=vpcstack.vpc, s3stack=s3stack.data_sandbox_bucket, appstreamsg=appstreamstack.appstream_security_group)
 samlstack = SamlStack(DataSandbox, 'saml-stack')
 
 app.synth()
\ No newline at end of file
@@ -7,12 +7,50 @@ $SSM3 = $SSM2 | ConvertFrom-Json
 
 $ScriptBucket = $SSM3.'bucket-name'
 $S3Path = "s3://$ScriptBucket"
-$UserProfile = $env:USERPROFILE
 
-$S3ScriptLocation = 'appstream-scripts/sagemaker-notebook.ps1'
+# Scripts are cached in the home folder, which persists between sessions, and are only
+# downloaded again when their sha256 differs from the one published in the parameter
 
-$ScriptLocalLocation = "$UserProfile\Documents\sagemaker-notebook.ps1"
+$ScriptsPrefix = $SSM3.'scripts-prefix'
+$ScriptHashes = $SSM3.'scripts'
+$HomeFolder = "C:\Users\PhotonUser\My Files\Home Folder"
 
-$CopyScriptFile = aws s3 cp "$($S3Path)/$($S3ScriptLocation)" $ScriptLocalLocation --profile appstream_machine_role
+# The home folder is mounted shortly after the session starts. Without it the scripts
+# are cached in Documents for this session only, and downloaded on every launch
 
-Start-Process PowerShell.exe $ScriptLocalLocation
\ No newline at end of file
+$HomeDeadline = (Get-Date).AddSeconds(60)
+While ( -not (Test-Path $HomeFolder) -and (Get-Date) -lt $HomeDeadline ) { Sleep 1 }
+
+If ( Test-Path $HomeFolder )
+{
+    $ScriptCache = "$HomeFolder\.datasandbox\scripts"
+} else {
+    $ScriptCache = "C:\Users\PhotonUser\Documents\.datasandbox\scripts"
+}
+
+$Folder = New-Item -ItemType Directory -Force -Path $ScriptCache
+
+foreach ( $ScriptName in @('sagemaker-notebook.ps1', 'session-url-poller.ps1') )
+{
+    $ScriptLocalLocation = "$ScriptCache\$ScriptName"
+    $ExpectedHash = $ScriptHashes.$ScriptName
+    $LocalHash = $null
+    if ( Test-Path $ScriptLocalLocation )
+    {
+        $LocalHash = (Get-FileHash -Algorithm SHA256 $ScriptLocalLocation).Hash
+    }
+    if ( $ExpectedHash -and $LocalHash -eq $ExpectedHash )
+    {
+        continue
+    }
+    if ( $ScriptsPrefix )
+    {
+        $S3ScriptLocation = "$ScriptsPrefix/$ScriptName"
+    } else {
+        # parameter written before scripts were versioned
+        $S3ScriptLocation = "appstream-scripts/$ScriptName"
+    }
+    $CopyScriptFile = aws s3 cp "$($S3Path)/$($S3ScriptLocation)" $ScriptLocalLocation --profile appstream_machine_role
+}
+
+Start-Process PowerShell.exe "& '$ScriptCache\sagemaker-notebook.ps1'"
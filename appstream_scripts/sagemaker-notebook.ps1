@@ -34,17 +34,14 @@ $HashTrim = $Hash.Trim()
 
 $PrefixName = "$($prefixStatic)$($HashTrim)".ToLower()
 
-# Create the initial message to trigger the security lambda function
+# The request path carries stack, fleet and session so the lambda does not need to read the file
 
-$Str =@"
-{"user":"$UserName", "sessionId": "$SessionId", "bucketName": "$BucketName", "prefixName": "$PrefixName", "stackName": "$StackName", "fleetName" : "$FleetName"}
-"@
-
-$JsonPath = "$($HomeLocationRequests)session.json"
+$RequestFolder = "$($HomeLocationRequests)session-requests\$StackName\$FleetName\$SessionId"
+$JsonPath = "$($RequestFolder)\session.json"
 
 # Stalls the script if it's a first time user, so that the home folder can be set up
 
-$FolderSetUp  = Test-Path $JsonPath
+$FolderSetUp  = Test-Path $HomeLocationRequests
 
 If ( $FolderSetUp -eq $false )
 {
@@ -52,34 +49,72 @@ If ( $FolderSetUp -eq $false )
     Do {
         $SetUp = $false
         Try {
-             $Json = $Str | Out-File $JsonPath
-        } Catch { $SetUp = $True }
+             $Folder = New-Item -ItemType Directory -Force -Path $RequestFolder -ErrorAction Stop
+        } Catch { $SetUp = $True; Sleep 1 }
     } While ( $SetUp )
 }
 
-$Json = $Str | Out-File $JsonPath
+# The lambda also writes the response to a per session SSM parameter, which is read
+# through the VPC endpoint without waiting for the home folder to sync
+
+$ParameterName = "/datasandbox/session-url/$SessionId"
+$NotebookStartingMsg = "Your SageMaker notebook is starting, please keep waiting."
+$NotebookUnavailableMsg = "Your SageMaker notebook is unavailable, please contact your administrator."
+
+. "$PSScriptRoot\session-url-poller.ps1"
+
+$Folder = New-Item -ItemType Directory -Force -Path $RequestFolder
 Write-Host "Opening your SageMaker Instance...Please wait a moment."
 
-# Add for each loop to run it 300 times with one second sleeps. This corresponds to boto3 SageMaker pre-signed URL expiration
+# A stopped notebook is started by the lambda, which answers that it is starting.
+# The request is then repeated until the notebook is up or StartDeadline passes.
+
+$StartDeadline = (Get-Date).AddMinutes(15)
+$Attempt = 0
+Do {
+    $Attempt++
+
+    # A response left over from an earlier launch or attempt must not be picked up. The
+    # parameter is only written when absent, so it is removed before every request, also
+    # when an earlier launch in this session was answered through the home folder
+
+    Remove-Item $HomeLocationURIs -ErrorAction SilentlyContinue
+    aws ssm delete-parameter --name $ParameterName --region $Env:AWS_Region --profile appstream_machine_role 2>$null | Out-Null
+
+    # the attempt number makes every request a new object, so each one triggers the lambda
+    $Str =@"
+{"user":"$UserName", "sessionId": "$SessionId", "bucketName": "$BucketName", "prefixName": "$PrefixName", "stackName": "$StackName", "fleetName" : "$FleetName", "attempt": $Attempt}
+"@
+    $Json = $Str | Out-File $JsonPath
+
+    # Wait with adaptive backoff until the pre-signed URL expires
+
+    $ResponseContent = Wait-SessionUrl -HomeFile $HomeLocationURIs -ParameterName $ParameterName -DeadlineSeconds 300
+
+    if ( $ResponseContent -ne $NotebookStartingMsg ) { break }
+
+    Write-Host "Your SageMaker notebook is starting, this takes a few minutes. Please keep this window open."
+    Start-Sleep -Seconds 30
+} While ( (Get-Date) -lt $StartDeadline )
 
-foreach ( $i in 1..300 )
+if ( $ResponseContent -eq "You are running an invalid session, please log back in." )
 {
-    if ( Test-Path $HomeLocationURIs )
-    {
-        $ResponseContent = Get-Content $HomeLocationURIs
-        if ( $ResponseContent -eq "You are running an invalid session, please log back in." )
-        {
-            $Output = "Invalid session, please close the session and log back in"
-            echo $ResponseContent
-            Break
-        } else {
-            start-process 'C:\Program Files (x86)\Mozilla Firefox\firefox.exe' $ResponseContent
-            $Output = "SageMaker opened successfully"
-            Break
-        }
-        Break
-    }
-    Sleep 1
+    $Output = "Invalid session, please close the session and log back in"
+    echo $ResponseContent
+} elseif ( $ResponseContent -eq $NotebookUnavailableMsg ) {
+    $Output = $ResponseContent
+    echo $Output
+} elseif ( $ResponseContent -eq $NotebookStartingMsg ) {
+    $Output = "SageMaker is still starting, please try again in a few minutes"
+    echo $Output
+} elseif ( $ResponseContent ) {
+    start-process 'C:\Program Files (x86)\Mozilla Firefox\firefox.exe' $ResponseContent
+    $Output = "SageMaker opened successfully"
+} else {
+    $Output = "Timed out waiting for SageMaker, please try again"
+    echo $Output
 }
 
-Remove-Item $HomeLocationURIs
+Remove-Item $HomeLocationURIs -ErrorAction SilentlyContinue
+aws ssm delete-parameter --name $ParameterName --region $Env:AWS_Region --profile appstream_machine_role 2>$null | Out-Null
+Remove-Item "$($HomeLocationRequests)session-requests\$StackName\$FleetName\$SessionId" -Recurse -ErrorAction SilentlyContinue
@@ -0,0 +1,75 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+# Waits for the response of the Data Sandbox lambda. Dot-source this file and call
+# Wait-SessionUrl. Checks start fast, then back off exponentially with jitter up to
+# MaxDelayMs, and stop at DeadlineSeconds, which matches the 5 minute lifetime of a
+# pre-signed notebook URL.
+
+function Test-SessionUrlFile
+{
+    param ( [string]$HomeFile )
+
+    # metadata only, the file is read once it exists and is not empty
+    $Item = Get-Item $HomeFile -ErrorAction SilentlyContinue
+    return ( $Item -and $Item.Length -gt 0 )
+}
+
+function Read-SessionUrlParameter
+{
+    param ( [string]$ParameterName )
+
+    $Parameter = aws ssm get-parameter --name $ParameterName --with-decryption --region $Env:AWS_Region --profile appstream_machine_role 2>$null | ConvertFrom-Json
+    if ( -not $Parameter ) { return $null }
+
+    # read once, the parameter is removed as soon as it has been consumed
+    aws ssm delete-parameter --name $ParameterName --region $Env:AWS_Region --profile appstream_machine_role 2>$null | Out-Null
+    return $Parameter.Parameter.Value
+}
+
+function Wait-SessionUrl
+{
+    param (
+        [string]$HomeFile,
+        [string]$ParameterName = $null,
+        [int]$DeadlineSeconds = 300,
+        [int]$FastChecks = 2,
+        [int]$InitialDelayMs = 500,
+        [int]$MaxDelayMs = 5000,
+        [double]$Multiplier = 1.5,
+        [int]$ParameterEvery = 2
+    )
+
+    $Random = New-Object System.Random
+    $Watch = [System.Diagnostics.Stopwatch]::StartNew()
+    $Delay = $InitialDelayMs
+    $Attempt = 0
+
+    while ( $Watch.Elapsed.TotalSeconds -lt $DeadlineSeconds )
+    {
+        $Attempt++
+
+        if ( Test-SessionUrlFile $HomeFile )
+        {
+            return ( Get-Content $HomeFile -Raw ).Trim()
+        }
+
+        # the SSM check starts a CLI process, so it runs on every ParameterEvery-th attempt only
+        if ( $ParameterName -and ( $Attempt % $ParameterEvery -eq 1 -or $ParameterEvery -le 1 ) )
+        {
+            $Value = Read-SessionUrlParameter $ParameterName
+            if ( $Value ) { return $Value.Trim() }
+        }
+
+        if ( $Attempt -gt $FastChecks )
+        {
+            $Delay = [Math]::Min($MaxDelayMs, [int]($Delay * $Multiplier))
+        }
+        # jitter spreads the checks of users that logged in at the same moment
+        $Sleep = $Random.Next([int]($Delay / 2), $Delay + 1)
+        $Left = [int](($DeadlineSeconds - $Watch.Elapsed.TotalSeconds) * 1000)
+        if ( $Left -le 0 ) { break }
+        Start-Sleep -Milliseconds ([Math]::Min($Sleep, $Left))
+    }
+    return $null
+}
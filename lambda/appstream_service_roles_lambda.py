@@ -2,48 +2,142 @@
 #// SPDX-License-Identifier: MIT-0
 
 import json
-import boto3
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-iam = boto3.client('iam')
+from clients import get_client
 
+MANAGED_ROLES = [
+    {
+        'RoleName': 'AmazonAppStreamServiceAccess',
+        'Path': '/service-role/',
+        'Description': 'Amazon AppStream Service Access Role',
+        'Service': 'appstream.amazonaws.com',
+        'PolicyArns': ['arn:aws:iam::aws:policy/service-role/AmazonAppStreamServiceAccess']
+    },
+    {
+        'RoleName': 'ApplicationAutoScalingForAmazonAppStreamAccess',
+        'Path': '/service-role/',
+        'Description': 'Amazon AppStream Service Access Role',
+        'Service': 'application-autoscaling.amazonaws.com',
+        'PolicyArns': ['arn:aws:iam::aws:policy/service-role/ApplicationAutoScalingForAmazonAppStreamAccess']
+    }
+]
 
-def lambda_handler(event, context):
-    
-    appstream_service_role_policy_document = { "Version": "2012-10-17", "Statement": [ { "Effect": "Allow", "Principal": { "Service": "appstream.amazonaws.com" }, "Action": "sts:AssumeRole" } ] }
-    appstream_autoscaling_role_policy_document = { "Version": "2012-10-17", "Statement": [ { "Effect": "Allow", "Principal": { "Service": "application-autoscaling.amazonaws.com" }, "Action": "sts:AssumeRole" } ] }
+# IAM is eventually consistent, changes are polled until visible within this budget
+CONVERGENCE_TIMEOUT_SECONDS = 45
+CONVERGENCE_MAX_DELAY_SECONDS = 8
 
+
+def assume_role_policy_document(service):
+    return {"Version": "2012-10-17", "Statement": [{"Effect": "Allow", "Principal": {"Service": service}, "Action": "sts:AssumeRole"}]}
+
+
+def trusts_service(policy_document, service):
+    statements = policy_document.get('Statement', [])
+    if isinstance(statements, dict):
+        statements = [statements]
+    for statement in statements:
+        services = statement.get('Principal', {}).get('Service', [])
+        actions = statement.get('Action', [])
+        if isinstance(services, str):
+            services = [services]
+        if isinstance(actions, str):
+            actions = [actions]
+        if statement.get('Effect') == 'Allow' and service in services and 'sts:AssumeRole' in actions:
+            return True
+    return False
+
+
+def fetch_actual_state(iam, desired):
+    """Return the current state of the role, or None if it does not exist.
+
+    Only a missing role is treated as absent, throttling and access errors are raised.
+    """
     try:
-        query_appstream_service_role = iam.get_role(
-        RoleName='AmazonAppStreamServiceAccess'
-        )
-        print("AppStream Service role already exists")
-    except:
-        print('AppStream Service role does not yet exist, and will be created')
-        create_appstream_service_role = iam.create_role(
-            Path="/service-role/",
-            RoleName="AmazonAppStreamServiceAccess",
-            AssumeRolePolicyDocument=json.dumps(appstream_service_role_policy_document),
-            Description="Amazon AppStream Service Access Role"
-            )
-        attach_appstream_service_access_role_policy = iam.attach_role_policy(
-                RoleName="AmazonAppStreamServiceAccess",
-                PolicyArn='arn:aws:iam::aws:policy/service-role/AmazonAppStreamServiceAccess'
-            )
-            
-    try:
-        query_appstream_autoscaling_role = iam.get_role(
-        RoleName='ApplicationAutoScalingForAmazonAppStreamAccess'
-        )
-        print("AppStream Autoscaling role already exists")
-    except:
-        print('AppStream Autoscaling role does not yet exist, and will be created')
-        create_appstream_autoscaling_role = iam.create_role(
-            Path="/service-role/",
-            RoleName="ApplicationAutoScalingForAmazonAppStreamAccess",
-            AssumeRolePolicyDocument=json.dumps(appstream_autoscaling_role_policy_document),
-            Description="Amazon AppStream Service Access Role"
-            )
-        attach_appstream_service_access_role_policy = iam.attach_role_policy(
-                RoleName="ApplicationAutoScalingForAmazonAppStreamAccess",
-                PolicyArn='arn:aws:iam::aws:policy/service-role/ApplicationAutoScalingForAmazonAppStreamAccess'
-            )
+        role = iam.get_role(RoleName=desired['RoleName'])['Role']
+    except iam.exceptions.NoSuchEntityException:
+        return None
+    policy_arns = set()
+    paginator = iam.get_paginator('list_attached_role_policies')
+    for page in paginator.paginate(RoleName=desired['RoleName']):
+        policy_arns.update(p['PolicyArn'] for p in page['AttachedPolicies'])
+    return {'AssumeRolePolicyDocument': role['AssumeRolePolicyDocument'], 'PolicyArns': policy_arns}
+
+
+def plan_changes(desired, actual):
+    if actual is None:
+        return [('create_role', None)] + [('attach_role_policy', arn) for arn in desired['PolicyArns']]
+    changes = []
+    if not trusts_service(actual['AssumeRolePolicyDocument'], desired['Service']):
+        changes.append(('update_assume_role_policy', None))
+    changes.extend(('attach_role_policy', arn) for arn in desired['PolicyArns'] if arn not in actual['PolicyArns'])
+    return changes
+
+
+def apply_changes(iam, desired, changes):
+    for action, arn in changes:
+        print(json.dumps({'role': desired['RoleName'], 'action': action, 'policy': arn}))
+        if action == 'create_role':
+            try:
+                iam.create_role(
+                    Path=desired['Path'],
+                    RoleName=desired['RoleName'],
+                    AssumeRolePolicyDocument=json.dumps(assume_role_policy_document(desired['Service'])),
+                    Description=desired['Description'])
+            except iam.exceptions.EntityAlreadyExistsException:
+                # created concurrently since the state was read
+                pass
+        elif action == 'update_assume_role_policy':
+            iam.update_assume_role_policy(
+                RoleName=desired['RoleName'],
+                PolicyDocument=json.dumps(assume_role_policy_document(desired['Service'])))
+        elif action == 'attach_role_policy':
+            iam.attach_role_policy(RoleName=desired['RoleName'], PolicyArn=arn)
+
+
+def wait_for_convergence(iam, desired, timeout=CONVERGENCE_TIMEOUT_SECONDS):
+    deadline = time.monotonic() + timeout
+    delay = 1
+    while True:
+        pending = plan_changes(desired, fetch_actual_state(iam, desired))
+        if not pending:
+            return []
+        if time.monotonic() + delay > deadline:
+            return pending
+        time.sleep(delay)
+        delay = min(CONVERGENCE_MAX_DELAY_SECONDS, delay * 2)
+
+
+def reconcile_role(iam, desired, actual):
+    changes = plan_changes(desired, actual)
+    if not changes:
+        print(f"{desired['RoleName']} is up to date")
+        return {'role': desired['RoleName'], 'changes': 0, 'pending': []}
+    apply_changes(iam, desired, changes)
+    pending = wait_for_convergence(iam, desired)
+    return {'role': desired['RoleName'], 'changes': len(changes), 'pending': [a for a, _ in pending]}
+
+
+def lambda_handler(event, context):
+    iam = get_client('iam')
+
+    with ThreadPoolExecutor(max_workers=len(MANAGED_ROLES)) as pool:
+        actual_states = list(pool.map(lambda desired: fetch_actual_state(iam, desired), MANAGED_ROLES))
+        results = list(pool.map(lambda args: reconcile_role(iam, *args), zip(MANAGED_ROLES, actual_states)))
+
+    print(json.dumps({'results': results}))
+    not_converged = [r['role'] for r in results if r['pending']]
+    if not_converged:
+        raise RuntimeError(f'IAM changes not visible after {CONVERGENCE_TIMEOUT_SECONDS}s for {not_converged}')
+    return {'results': results}
+
+
+def on_event(event, context):
+    """Custom resource handler of the provider framework, a raised exception fails the stack."""
+    if event['RequestType'] == 'Delete':
+        # the service roles are shared by the account and outlive the stack
+        return {'PhysicalResourceId': event['PhysicalResourceId']}
+    results = lambda_handler(event, context)['results']
+    return {'PhysicalResourceId': 'AppStreamServiceRoles',
+            'Data': {'Changes': str(sum(r['changes'] for r in results))}}
@@ -0,0 +1,164 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from clients import get_client
+from metrics import new_metrics
+from session_resolver import iter_sessions
+from throttle import AdaptiveTokenBucket, is_throttling_error
+
+STACK_NAME = os.environ.get('STACK_NAME', '')
+FLEET_NAME = os.environ.get('FLEET_NAME', '')
+STATE_TABLE_NAME = os.environ.get('STATE_TABLE_NAME', '')
+SCHEDULE_MINUTES = int(os.environ.get('SCHEDULE_MINUTES', '15'))
+
+DRY_RUN = os.environ.get('DRY_RUN', 'true').lower() == 'true'
+# expire sessions that have not been connected for this long, 0 disables the rule
+MAX_DISCONNECTED_MINUTES = int(os.environ.get('MAX_DISCONNECTED_MINUTES', '60'))
+# expire sessions that started more than this long ago, 0 disables the rule
+MAX_SESSION_HOURS = int(os.environ.get('MAX_SESSION_HOURS', '0'))
+# only reap disconnected sessions while fewer instances than this are available, 0 always reaps
+REAP_WHEN_AVAILABLE_BELOW = int(os.environ.get('REAP_WHEN_AVAILABLE_BELOW', '0'))
+EXEMPT_USERS = {u.strip() for u in os.environ.get('EXEMPT_USERS', '').split(',') if u.strip()}
+MAX_EXPIRATIONS_PER_RUN = int(os.environ.get('MAX_EXPIRATIONS_PER_RUN', '50'))
+EXPIRE_BATCH_SIZE = int(os.environ.get('EXPIRE_BATCH_SIZE', '5'))
+EXPIRE_MAX_ATTEMPTS = 3
+
+# ExpireSession is a control plane call, kept well under its account-wide rate limit
+expire_limiter = AdaptiveTokenBucket(max_rate=float(os.environ.get('EXPIRE_MAX_TPS', '2')), burst=EXPIRE_BATCH_SIZE)
+
+
+def parse_bool(value):
+    """A boolean from an event field, which console and EventBridge test payloads often send as a string."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return value != 0
+    normalized = str(value).strip().lower()
+    if normalized in ('true', '1', 'yes'):
+        return True
+    if normalized in ('false', '0', 'no', ''):
+        return False
+    raise ValueError(f'not a boolean: {value!r}')
+
+
+def fleet_capacity(fleet_name):
+    fleet = get_client('appstream').describe_fleets(Names=[fleet_name])['Fleets'][0]
+    return fleet.get('ComputeCapacityStatus', {})
+
+
+def disconnected_since(session_ids, now, table_name=STATE_TABLE_NAME):
+    """Return {session_id: epoch seconds} of when each session was first seen disconnected.
+
+    Describe calls only show the current ConnectionState, so the first sighting is
+    kept in the state table. A sighting older than two schedule periods is stale,
+    the session reconnected in between, and the clock starts again.
+    """
+    dynamodb = get_client('dynamodb')
+    stale_after = 2 * SCHEDULE_MINUTES * 60
+    since = {}
+    ids = list(session_ids)
+    for i in range(0, len(ids), 100):
+        keys = [{'pk': {'S': session_id}} for session_id in ids[i:i + 100]]
+        request = {table_name: {'Keys': keys, 'ProjectionExpression': 'pk, disconnectedSince, lastSeen'}}
+        while request:
+            resp = dynamodb.batch_get_item(RequestItems=request)
+            for item in resp['Responses'].get(table_name, []):
+                if now - float(item['lastSeen']['N']) <= stale_after:
+                    since[item['pk']['S']] = float(item['disconnectedSince']['N'])
+            request = resp.get('UnprocessedKeys')
+    for session_id in ids:
+        since.setdefault(session_id, now)
+
+    expires_at = str(int(now + stale_after))
+    for i in range(0, len(ids), 25):
+        writes = [{'PutRequest': {'Item': {
+            'pk': {'S': session_id},
+            'disconnectedSince': {'N': str(since[session_id])},
+            'lastSeen': {'N': str(now)},
+            'expiresAt': {'N': expires_at}}}} for session_id in ids[i:i + 25]]
+        request = {table_name: writes}
+        while request:
+            request = dynamodb.batch_write_item(RequestItems=request).get('UnprocessedItems')
+    return since
+
+
+def find_candidates(sessions, since, now, capacity):
+    """Apply the rules; return [(session, reason, age_seconds)] ordered oldest first."""
+    reap_idle = MAX_DISCONNECTED_MINUTES > 0 and (
+        REAP_WHEN_AVAILABLE_BELOW <= 0 or capacity.get('Available', 0) < REAP_WHEN_AVAILABLE_BELOW)
+    candidates = []
+    for session in sessions:
+        if session['State'] != 'ACTIVE' or session['UserId'] in EXEMPT_USERS:
+            continue
+        age = now - session['StartTime'].timestamp()
+        if MAX_SESSION_HOURS > 0 and age >= MAX_SESSION_HOURS * 3600:
+            candidates.append((session, 'max-session-age', age))
+        elif reap_idle and session['Id'] in since:
+            idle = now - since[session['Id']]
+            if idle >= MAX_DISCONNECTED_MINUTES * 60:
+                candidates.append((session, 'disconnected', idle))
+    candidates.sort(key=lambda c: c[2], reverse=True)
+    return candidates
+
+
+def expire_session(session_id):
+    appstream = get_client('appstream')
+    for attempt in range(1, EXPIRE_MAX_ATTEMPTS + 1):
+        try:
+            expire_limiter.call(appstream.expire_session, SessionId=session_id)
+            return 'expired'
+        except appstream.exceptions.ResourceNotFoundException:
+            return 'gone'
+        except Exception as e:
+            if not is_throttling_error(e) or attempt == EXPIRE_MAX_ATTEMPTS:
+                print(json.dumps({'sessionId': session_id, 'error': str(e)}))
+                return 'error'
+
+
+def lambda_handler(event, context):
+    dry_run = parse_bool((event or {}).get('dry_run', DRY_RUN))
+    now = time.time()
+    metrics = new_metrics(service='AppStreamSessionReaper',
+                          properties={'StackName': STACK_NAME, 'FleetName': FLEET_NAME, 'DryRun': dry_run})
+
+    capacity = fleet_capacity(FLEET_NAME)
+    sessions = list(iter_sessions(get_client('appstream'), STACK_NAME, FLEET_NAME))
+    disconnected = [s['Id'] for s in sessions if s['State'] == 'ACTIVE' and s.get('ConnectionState') == 'NOT_CONNECTED']
+    since = disconnected_since(disconnected, now) if disconnected else {}
+    candidates = find_candidates(sessions, since, now, capacity)[:MAX_EXPIRATIONS_PER_RUN]
+
+    outcomes = {}
+    if not dry_run:
+        with ThreadPoolExecutor(max_workers=EXPIRE_BATCH_SIZE) as pool:
+            for i in range(0, len(candidates), EXPIRE_BATCH_SIZE):
+                batch = [c[0]['Id'] for c in candidates[i:i + EXPIRE_BATCH_SIZE]]
+                outcomes.update(zip(batch, pool.map(expire_session, batch)))
+
+    expired = sum(1 for outcome in outcomes.values() if outcome == 'expired')
+    report = {
+        'dryRun': dry_run,
+        'capacity': capacity,
+        'sessions': len(sessions),
+        'disconnected': len(disconnected),
+        'candidates': [{'sessionId': s['Id'], 'userId': s['UserId'], 'reason': reason,
+                        'ageMinutes': round(age / 60), 'outcome': outcomes.get(s['Id'], 'dry-run' if dry_run else None)}
+                       for s, reason, age in candidates],
+        # a session holds one fleet instance, so every expired session is an instance reclaimed
+        'instancesReclaimed': expired,
+        'limiter': expire_limiter.stats(),
+    }
+    print(json.dumps(report, default=str))
+
+    metrics.put('SessionsScanned', len(sessions))
+    metrics.put('SessionsDisconnected', len(disconnected))
+    metrics.put('ReapCandidates', len(candidates))
+    metrics.put('SessionsExpired', expired)
+    metrics.put('ExpireErrors', sum(1 for outcome in outcomes.values() if outcome == 'error'))
+    metrics.put('AvailableCapacity', capacity.get('Available', 0))
+    metrics.flush()
+    return report
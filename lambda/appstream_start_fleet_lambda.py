@@ -0,0 +1,61 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import json
+import time
+
+from clients import get_client
+from metrics import new_metrics
+
+# is_complete polls a few times itself before handing back to the provider framework
+POLL_BUDGET_SECONDS = 40
+POLL_MAX_DELAY_SECONDS = 10
+
+
+def describe_fleet(fleet_name):
+    return get_client('appstream').describe_fleets(Names=[fleet_name])['Fleets'][0]
+
+
+def fleet_is_ready(fleet):
+    capacity = fleet.get('ComputeCapacityStatus', {})
+    return fleet['State'] == 'RUNNING' and capacity.get('Running', 0) >= capacity.get('Desired', 0)
+
+
+def on_event(event, context):
+    fleet_name = event['ResourceProperties']['FleetName']
+    if event['RequestType'] == 'Delete':
+        return {'PhysicalResourceId': event.get('PhysicalResourceId', fleet_name)}
+
+    fleet = describe_fleet(fleet_name)
+    if fleet['State'] == 'STOPPED':
+        print(f'Starting fleet {fleet_name}')
+        get_client('appstream').start_fleet(Name=fleet_name)
+    else:
+        print(f"Fleet {fleet_name} is already {fleet['State']}")
+    return {'PhysicalResourceId': fleet_name, 'Data': {'StartedAt': str(time.time())}}
+
+
+def is_complete(event, context):
+    if event['RequestType'] == 'Delete':
+        return {'IsComplete': True}
+
+    fleet_name = event['ResourceProperties']['FleetName']
+    started_at = float(event['Data']['StartedAt'])
+    deadline = time.monotonic() + POLL_BUDGET_SECONDS
+    delay = 2
+    while True:
+        fleet = describe_fleet(fleet_name)
+        print(json.dumps({'fleet': fleet_name, 'state': fleet['State'],
+                          'capacity': fleet.get('ComputeCapacityStatus', {})}))
+        if fleet_is_ready(fleet):
+            break
+        if time.monotonic() + delay > deadline:
+            return {'IsComplete': False}
+        time.sleep(delay)
+        delay = min(POLL_MAX_DELAY_SECONDS, delay * 2)
+
+    time_to_ready = round(time.time() - started_at, 1)
+    metrics = new_metrics(service='AppStreamFleet', properties={'FleetName': fleet_name})
+    metrics.put('FleetTimeToReadySeconds', time_to_ready, 'Seconds')
+    metrics.flush()
+    return {'IsComplete': True, 'Data': {'TimeToReadySeconds': str(time_to_ready)}}
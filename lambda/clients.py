@@ -0,0 +1,49 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+# Shared by every client of the container: a pool large enough for the broker's
+# worker threads and the standard retry mode, which backs off on throttling.
+client_config = Config(
+    max_pool_connections=int(os.environ.get('MAX_POOL_CONNECTIONS', '16')),
+    connect_timeout=int(os.environ.get('CONNECT_TIMEOUT_SECONDS', '5')),
+    read_timeout=int(os.environ.get('READ_TIMEOUT_SECONDS', '15')),
+    retries={'max_attempts': int(os.environ.get('MAX_ATTEMPTS', '5')), 'mode': 'standard'}
+)
+
+_session = None
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(service_name):
+    """Return the container-wide client for service_name, creating it on first use."""
+    client = _clients.get(service_name)
+    if client is not None:
+        return client
+    # creating clients from a session is not thread safe
+    with _lock:
+        global _session
+        if service_name not in _clients:
+            if _session is None:
+                _session = boto3.session.Session()
+            _clients[service_name] = _session.client(service_name, config=client_config)
+        return _clients[service_name]
+
+
+def register_client(service_name, client):
+    """Use client for service_name instead of a lazily created one (benchmarks, local runs)."""
+    with _lock:
+        _clients[service_name] = client
+
+
+def reset_clients():
+    global _session
+    with _lock:
+        _clients.clear()
+        _session = None
@@ -2,36 +2,332 @@
 #// SPDX-License-Identifier: MIT-0
 
 import json
-import boto3
+import os
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
-appstream = boto3.client('appstream')
-s3_client = boto3.client('s3')
-s3_resource = boto3.resource('s3')
-sagemaker = boto3.client('sagemaker')
+from botocore.exceptions import BotoCoreError, ClientError
 
+from clients import get_client
+from dedup import DynamoDBDedupStore, EventDeduplicator, FileDedupStore, dedup_key
+from metrics import NAMESPACE, new_metrics
+from notebook_backends import NotebookInstanceBackend, NotebookUnavailableError, StudioBackend
+from notebook_router import (NotebookLoadIndex, NotebookRouter, NotebookStatusIndex, list_notebook_statuses,
+                             urls_issued_per_instance)
+from response_channels import build_channels
+from session_request import is_session_request_key, parse_request_body, parse_request_key
+from session_resolver import find_session
+from throttle import AdaptiveTokenBucket, SingleFlight
+from ttl_cache import TTLCache
 
-def lambda_handler(event, context):
-    for i in range(len(event)):
-        event_bucket = event['Records'][i]['s3']['bucket']['name']
-        event_key = event['Records'][i]['s3']['object']['key']
-
-    json_object = s3_client.get_object(Bucket=event_bucket, Key=event_key)
-    json_data = json_object['Body'].read()
-    json_dict = json.loads(json_data)
-
-    resp = appstream.describe_sessions(StackName=json_dict['stackName'], FleetName=json_dict['fleetName'],
-                                       UserId=json_dict['user'])
-    resp_user_session = resp['Sessions'][0]['Id']
-
-    if json_dict['sessionId'] == resp_user_session:
-        sagemaker_resp = sagemaker.create_presigned_notebook_instance_url(NotebookInstanceName="Data-Sandbox-Notebook",
-                                                                          SessionExpirationDurationInSeconds=1800)
-        sagemaker_url = sagemaker_resp['AuthorizedUrl']
-        s3_client.put_object(Bucket=json_dict['bucketName'],
-                             Body=sagemaker_url,
-                             Key=f"{json_dict['prefixName']}/session_url.txt")
+INVALID_SESSION_MSG = "You are running an invalid session, please log back in."
+# tells the launcher to keep waiting and ask again, see sagemaker-notebook.ps1
+NOTEBOOK_STARTING_MSG = "Your SageMaker notebook is starting, please keep waiting."
+NOTEBOOK_UNAVAILABLE_MSG = "Your SageMaker notebook is unavailable, please contact your administrator."
+NOTEBOOK_SESSION_SECONDS = 1800
+# an authorized URL can only be redeemed for 5 minutes after it was created
+PRESIGNED_URL_TTL_SECONDS = int(os.environ.get('PRESIGNED_URL_TTL_SECONDS', '300'))
+PRESIGNED_URL_SAFETY_SECONDS = int(os.environ.get('PRESIGNED_URL_SAFETY_SECONDS', '60'))
+
+# Records of one notification are processed on a bounded pool that lives for the
+# lifetime of the container. Workers share the clients of clients.get_client.
+max_workers = int(os.environ.get('MAX_WORKERS', '8'))
+executor = ThreadPoolExecutor(max_workers=max_workers)
+
+# describe_sessions results keyed by (stack, fleet, user), kept across warm invocations
+session_cache = TTLCache(max_entries=int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', '1024')),
+                         ttl_seconds=int(os.environ.get('SESSION_CACHE_TTL_SECONDS', '60')))
+
+# user names of home folder hashes already read from a request body, for requests that only carry the hash
+user_by_hash = TTLCache(max_entries=int(os.environ.get('USER_HASH_CACHE_MAX_ENTRIES', '1024')),
+                        ttl_seconds=int(os.environ.get('USER_HASH_CACHE_TTL_SECONDS', '3600')))
+
+# authorized notebook URLs keyed by (user, sessionId, notebook instance), each with its own expiry
+url_cache = TTLCache(max_entries=int(os.environ.get('URL_CACHE_MAX_ENTRIES', '1024')),
+                     ttl_seconds=PRESIGNED_URL_TTL_SECONDS - PRESIGNED_URL_SAFETY_SECONDS)
+
+# S3 delivers notifications at least once; each object version is handled once.
+# DEDUP_TABLE_NAME selects the DynamoDB store, DEDUP_STORE_PATH the local file store.
+if os.environ.get('DEDUP_TABLE_NAME'):
+    dedup_store = DynamoDBDedupStore(get_client, os.environ['DEDUP_TABLE_NAME'])
+elif os.environ.get('DEDUP_STORE_PATH'):
+    dedup_store = FileDedupStore(os.environ['DEDUP_STORE_PATH'])
+else:
+    dedup_store = None
+deduplicator = EventDeduplicator(dedup_store, window_seconds=int(os.environ.get('DEDUP_WINDOW_SECONDS', '600')),
+                                 lease_seconds=int(os.environ.get('DEDUP_LEASE_SECONDS', '45')))
+
+# The URL is delivered through every configured channel: the home folder the client
+# has always polled, and e.g. an SSM parameter it can read without waiting for the sync.
+response_channels = build_channels(os.environ.get('RESPONSE_CHANNELS', 'homefolder').split(','), get_client,
+                                   ttl_seconds=int(os.environ.get('RESPONSE_TTL_SECONDS', str(PRESIGNED_URL_TTL_SECONDS))),
+                                   local_directory=os.environ.get('RESPONSE_LOCAL_PATH'))
+
+# Duplicate in-flight lookups for the same user and session share one backend call,
+# and every container paces its calls so bursts stay under the account API limits.
+session_flight = SingleFlight()
+url_flight = SingleFlight()
+appstream_limiter = AdaptiveTokenBucket(max_rate=float(os.environ.get('APPSTREAM_MAX_TPS', '10')))
+sagemaker_limiter = AdaptiveTokenBucket(max_rate=float(os.environ.get('SAGEMAKER_MAX_TPS', '10')))
+
+# Users are spread over the notebook instance pool; the status of the pool is
+# listed at most every NOTEBOOK_STATUS_REFRESH_SECONDS, not on every request.
+notebook_instances = os.environ.get('NOTEBOOK_INSTANCES', 'Data-Sandbox-Notebook').split(',')
+
+
+def list_pool_statuses():
+    return sagemaker_limiter.call(lambda: list(list_notebook_statuses(get_client('sagemaker'), 'Data-Sandbox-Notebook')))
+
+
+notebook_status_index = NotebookStatusIndex(list_pool_statuses,
+                                            refresh_seconds=int(os.environ.get('NOTEBOOK_STATUS_REFRESH_SECONDS', '60')))
+
+
+def list_pool_loads():
+    # the UrlIssued metric of record_url_issued, summed over every broker container
+    return urls_issued_per_instance(get_client('cloudwatch'), notebook_router.instance_names,
+                                    NOTEBOOK_SESSION_SECONDS, NAMESPACE)
+
+
+notebook_load_index = NotebookLoadIndex(list_pool_loads,
+                                        refresh_seconds=int(os.environ.get('NOTEBOOK_STATUS_REFRESH_SECONDS', '60')))
+notebook_router = NotebookRouter(notebook_instances, notebook_status_index, notebook_load_index,
+                                 max_users_per_instance=int(os.environ.get('NOTEBOOK_MAX_USERS_PER_INSTANCE', '0')),
+                                 assignment_ttl_seconds=NOTEBOOK_SESSION_SECONDS)
+
+# SANDBOX_BACKEND selects where users are sent: an instance of the notebook pool,
+# or their own user profile in the SageMaker Studio domain STUDIO_DOMAIN_ID/NAME.
+if os.environ.get('SANDBOX_BACKEND', 'notebook') == 'studio':
+    notebook_backend = StudioBackend(get_client, sagemaker_limiter, NOTEBOOK_SESSION_SECONDS,
+                                     domain_id=os.environ.get('STUDIO_DOMAIN_ID'),
+                                     domain_name=os.environ.get('STUDIO_DOMAIN_NAME', 'data-sandbox-studio'))
+else:
+    notebook_backend = NotebookInstanceBackend(get_client, sagemaker_limiter, notebook_router, notebook_status_index,
+                                               NOTEBOOK_SESSION_SECONDS)
+
+
+def resolve_user_session(stack_name, fleet_name, user, session_id):
+    cache_key = (stack_name, fleet_name, user)
+    cached_session = session_cache.get(cache_key)
+    if cached_session is not None and cached_session['Id'] == session_id:
+        return cached_session
+    if cached_session is not None:
+        # the user has moved to another session since we cached it
+        session_cache.invalidate(cache_key)
+
+    def fetch():
+        resp_user_session = appstream_limiter.call(find_session, get_client('appstream'),
+                                                   stack_name, fleet_name, session_id, user=user)
+        if resp_user_session is not None:
+            session_cache.set(cache_key, resp_user_session)
+        return resp_user_session
+
+    return session_flight.do((stack_name, fleet_name, user, session_id), fetch)
+
+
+def get_notebook_url(user, session, notebook_target):
+    cache_key = (user, session['Id'], notebook_target)
+    sagemaker_url = url_cache.get(cache_key)
+    if sagemaker_url is not None:
+        return sagemaker_url
+
+    return url_flight.do(cache_key, mint_notebook_url, cache_key, session)
+
+
+def mint_notebook_url(cache_key, session):
+    sagemaker_url = notebook_backend.presign(cache_key[0], cache_key[2])
+
+    # reuse the URL only while it is safely redeemable and the AppStream session is still alive
+    ttl = PRESIGNED_URL_TTL_SECONDS - PRESIGNED_URL_SAFETY_SECONDS
+    if session.get('MaxExpirationTime') is not None:
+        session_left = session['MaxExpirationTime'].timestamp() - time.time() - PRESIGNED_URL_SAFETY_SECONDS
+        ttl = min(ttl, session_left)
+    if ttl > 0:
+        url_cache.set(cache_key, sagemaker_url, ttl_seconds=ttl)
+    return sagemaker_url
+
+
+def record_url_issued(notebook_instance):
+    # per instance activity, read by the idle-stop job of the notebook pool
+    activity = new_metrics(properties={'NotebookInstance': notebook_instance},
+                           dimensions=[['Service', 'NotebookInstance']])
+    activity.put('UrlIssued', 1)
+    activity.flush()
+    notebook_load_index.record(notebook_instance)
+
+
+def process_record(record, metrics):
+    event_bucket = record['s3']['bucket']['name']
+    event_key = urllib.parse.unquote_plus(record['s3']['object']['key'])
+
+    # other files saved to the home folder are dropped before any call is made
+    if not is_session_request_key(event_key):
+        return {'bucket': event_bucket, 'key': event_key, 'status': 'filtered'}
+
+    event_id = dedup_key(record)
+    with metrics.stage('Dedup'):
+        first_delivery = deduplicator.claim(event_id)
+    if not first_delivery:
+        return {'bucket': event_bucket, 'key': event_key, 'status': 'duplicate'}
+    try:
+        result = handle_session_request(event_bucket, event_key, metrics)
+    except Exception:
+        deduplicator.release(event_id)
+        raise
+    deduplicator.complete(event_id)
+    return result
+
+
+def read_keyed_request_user(event_bucket, event_key, keyed_request, metrics):
+    # the body names the user, so a cold container reads it once per user instead of searching the fleet
+    with metrics.stage('GetObject'):
+        json_object = get_client('s3').get_object(Bucket=event_bucket, Key=event_key)
+        json_data = json_object['Body'].read()
+    json_dict = parse_request_body(json_data, event_bucket, event_key, prefix=keyed_request['prefix'])
+    if (json_dict['stackName'], json_dict['fleetName'], json_dict['sessionId']) != \
+            (keyed_request['stack'], keyed_request['fleet'], keyed_request['session_id']):
+        raise ValueError('session request body does not match its key')
+    user_by_hash.set(keyed_request['user_hash'], json_dict['user'])
+    return json_dict['user']
+
+
+def handle_session_request(event_bucket, event_key, metrics):
+    keyed_request = parse_request_key(event_key)
+    if keyed_request is not None:
+        # fast path, the request is fully described by its key once the user behind the hash is known
+        metrics.set_property('RequestPath', 'key')
+        user = user_by_hash.get(keyed_request['user_hash'])
+        if user is None:
+            metrics.set_property('RequestPath', 'key+body')
+            user = read_keyed_request_user(event_bucket, event_key, keyed_request, metrics)
+        with metrics.stage('DescribeSessions'):
+            resp_user_session = resolve_user_session(keyed_request['stack'], keyed_request['fleet'],
+                                                     user, keyed_request['session_id'])
+        response_bucket = event_bucket
+        response_prefix = keyed_request['prefix']
+        session_id = keyed_request['session_id']
+    else:
+        metrics.set_property('RequestPath', 'body')
+        with metrics.stage('GetObject'):
+            json_object = get_client('s3').get_object(Bucket=event_bucket, Key=event_key)
+            json_data = json_object['Body'].read()
+        json_dict = parse_request_body(json_data, event_bucket, event_key)
+
+        with metrics.stage('DescribeSessions'):
+            resp_user_session = resolve_user_session(json_dict['stackName'], json_dict['fleetName'],
+                                                     json_dict['user'], json_dict['sessionId'])
+        response_bucket = json_dict['bucketName']
+        response_prefix = json_dict['prefixName']
+        session_id = json_dict['sessionId']
+
+    if resp_user_session is not None:
+        with metrics.stage('Route'):
+            notebook_target = notebook_backend.target(resp_user_session['UserId'])
+        metrics.set_property('Backend', notebook_backend.name)
+        metrics.set_property(notebook_backend.target_property, notebook_target)
+        try:
+            with metrics.stage('NotebookStatus'):
+                notebook_ready = notebook_backend.ensure_ready(notebook_target)
+        except NotebookUnavailableError as e:
+            print(json.dumps({'key': event_key, 'error': str(e)}))
+            notebook_ready = False
+            response_body = NOTEBOOK_UNAVAILABLE_MSG
+            status = 'notebook_unavailable'
+        else:
+            response_body = NOTEBOOK_STARTING_MSG
+            status = 'notebook_starting'
+        if notebook_ready:
+            with metrics.stage('Presign'):
+                response_body = get_notebook_url(resp_user_session['UserId'], resp_user_session, notebook_target)
+            if notebook_backend.name == 'notebook':
+                record_url_issued(notebook_target)
+            status = 'ok'
     else:
-        error_msg = "You are running an invalid session, please log back in."
-        s3_client.put_object(Bucket=json_dict['bucketName'],
-                             Body=error_msg,
-                             Key=f"{json_dict['prefixName']}/session_url.txt")
+        response_body = INVALID_SESSION_MSG
+        status = 'invalid_session'
+
+    # the request only fails when no channel could deliver the response
+    delivery_errors = []
+    for channel in response_channels:
+        try:
+            with metrics.stage(channel.stage):
+                channel.deliver(response_bucket, response_prefix, session_id, response_body)
+        except Exception as e:
+            print(json.dumps({'key': event_key, 'channel': channel.name, 'error': f'{type(e).__name__}: {e}'}))
+            delivery_errors.append(e)
+    if len(delivery_errors) == len(response_channels):
+        raise delivery_errors[0]
+
+    return {'bucket': event_bucket, 'key': event_key, 'status': status}
+
+
+def safe_process_record(record):
+    # a bad session.json must not fail the other records of the batch
+    metrics = new_metrics()
+    start = time.perf_counter()
+    try:
+        result = process_record(record, metrics)
+    except Exception as e:
+        s3_info = record.get('s3', {})
+        result = {'bucket': s3_info.get('bucket', {}).get('name'),
+                  'key': s3_info.get('object', {}).get('key'),
+                  'status': 'error',
+                  'error': f'{type(e).__name__}: {e}',
+                  # AWS errors, throttling included, may pass on a retry; a bad request never does
+                  'retryable': isinstance(e, (ClientError, BotoCoreError))}
+        print(json.dumps(result))
+    metrics.put('RecordMs', (time.perf_counter() - start) * 1000, 'Milliseconds')
+    metrics.count('RecordErrors', 1 if result['status'] == 'error' else 0)
+    metrics.count('DuplicateEvents', 1 if result['status'] == 'duplicate' else 0)
+    metrics.count('FilteredEvents', 1 if result['status'] == 'filtered' else 0)
+    metrics.count('NotebookStarting', 1 if result['status'] == 'notebook_starting' else 0)
+    metrics.set_property('Status', result['status'])
+    metrics.flush()
+    return result
+
+
+def unwrap_records(event):
+    """Return (sqs message id, S3 record) pairs for direct S3 and SQS-wrapped events."""
+    pairs = []
+    for record in event.get('Records', []):
+        if record.get('eventSource') == 'aws:sqs':
+            body = json.loads(record['body'])
+            # s3:TestEvent messages carry no Records and are simply dropped
+            for s3_record in body.get('Records', []):
+                pairs.append((record['messageId'], s3_record))
+        else:
+            pairs.append((None, record))
+    return pairs
+
+
+def lambda_handler(event, context):
+    pairs = unwrap_records(event)
+    results = list(executor.map(safe_process_record, [s3_record for _, s3_record in pairs]))
+
+    # SQS retries only the messages reported here, see ReportBatchItemFailures
+    failed_messages = []
+    for (message_id, _), result in zip(pairs, results):
+        if message_id is not None and result['status'] == 'error' and message_id not in failed_messages:
+            failed_messages.append(message_id)
+
+    retryable = [r for (message_id, _), r in zip(pairs, results)
+                 if message_id is None and r['status'] == 'error' and r['retryable']]
+
+    print(json.dumps({'records': len(results),
+                      'failed': sum(1 for r in results if r['status'] == 'error'),
+                      'filtered': sum(1 for r in results if r['status'] == 'filtered'),
+                      'session_cache': session_cache.stats(),
+                      'url_cache': url_cache.stats(),
+                      'coalesced': session_flight.coalesced + url_flight.coalesced,
+                      'duplicates': deduplicator.duplicates,
+                      'appstream_limiter': appstream_limiter.stats(),
+                      'sagemaker_limiter': sagemaker_limiter.stats(),
+                      'notebook_backend': notebook_backend.stats()}))
+
+    # a direct S3 notification is only retried, by the async invoke, when the invocation fails;
+    # the records that succeeded are skipped on the retry as duplicates
+    if retryable:
+        raise RuntimeError(f"{len(retryable)} of {len(results)} records failed and will be retried: {retryable[0]['error']}")
+    return {'results': results,
+            'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failed_messages]}
@@ -0,0 +1,145 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+from ttl_cache import TTLCache
+
+
+def dedup_key(record):
+    """Identify one version of an S3 object; redeliveries of an event share it."""
+    s3_info = record['s3']
+    obj = s3_info['object']
+    version = obj.get('versionId') or obj.get('sequencer') or obj.get('eTag', '')
+    key = urllib.parse.unquote_plus(obj['key'])
+    return f"{s3_info['bucket']['name']}/{key}@{version}"
+
+
+class DynamoDBDedupStore:
+    """Durable claims shared by all containers, expired by the table's TTL attribute.
+
+    A claim's expiresAt is checked on every claim, the TTL sweeper only cleans up.
+    The client is only created by get_client on the first claim.
+    """
+
+    def __init__(self, get_client, table_name):
+        self.get_client = get_client
+        self.table_name = table_name
+
+    def put_if_absent(self, key, ttl_seconds):
+        client = self.get_client('dynamodb')
+        now = int(time.time())
+        try:
+            client.put_item(
+                TableName=self.table_name,
+                Item={'pk': {'S': key}, 'expiresAt': {'N': str(now + ttl_seconds)}},
+                # an expired item may still be present until the TTL sweeper removes it
+                ConditionExpression='attribute_not_exists(pk) OR expiresAt < :now',
+                ExpressionAttributeValues={':now': {'N': str(now)}})
+            return True
+        except client.exceptions.ConditionalCheckFailedException:
+            return False
+
+    def extend(self, key, ttl_seconds):
+        self.get_client('dynamodb').put_item(
+            TableName=self.table_name,
+            Item={'pk': {'S': key}, 'expiresAt': {'N': str(int(time.time()) + ttl_seconds)}})
+
+    def delete(self, key):
+        self.get_client('dynamodb').delete_item(TableName=self.table_name, Key={'pk': {'S': key}})
+
+
+class FileDedupStore:
+    """Local stand-in for the durable store: one marker file per claimed key, its mtime is the expiry."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def put_if_absent(self, key, ttl_seconds):
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) < time.time():
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        self.extend(key, ttl_seconds)
+        return True
+
+    def extend(self, key, ttl_seconds):
+        expires_at = time.time() + ttl_seconds
+        os.utime(self._path(key), (expires_at, expires_at))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class EventDeduplicator:
+    """Claim each event once: first in the container's memory, then in the durable store.
+
+    A claim starts as a lease of lease_seconds, shorter than the function
+    timeout, so an invocation that times out or runs out of memory does not
+    block the retries of its events. complete() turns it into a claim for
+    window_seconds once the response was delivered. release() drops it when
+    processing failed with an error.
+    """
+
+    def __init__(self, store=None, window_seconds=600, lease_seconds=45, max_entries=4096):
+        self.store = store
+        self.window_seconds = window_seconds
+        self.lease_seconds = lease_seconds
+        self.window = TTLCache(max_entries=max_entries, ttl_seconds=window_seconds)
+        self.duplicates = 0
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        # records of one batch run concurrently, the check and the claim must not interleave
+        with self._lock:
+            if self.window.get(key) is not None:
+                self.duplicates += 1
+                return False
+            self.window.set(key, True, ttl_seconds=self.lease_seconds)
+        if self.store is None:
+            return True
+        try:
+            claimed = self.store.put_if_absent(key, self.lease_seconds)
+        except Exception:
+            # the event is retried, the retry must not find this container's claim
+            self.window.invalidate(key)
+            raise
+        if not claimed:
+            with self._lock:
+                self.duplicates += 1
+        return claimed
+
+    def complete(self, key):
+        self.window.set(key, True)
+        if self.store is None:
+            return
+        try:
+            self.store.extend(key, self.window_seconds)
+        except Exception as e:
+            # the response was delivered, a redelivery after the lease only sends it again
+            print(json.dumps({'dedup': 'extend failed', 'key': key, 'error': f'{type(e).__name__}: {e}'}))
+
+    def release(self, key):
+        # lets a redelivery retry an event whose processing failed
+        self.window.invalidate(key)
+        if self.store is not None:
+            self.store.delete(key)
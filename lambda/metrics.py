@@ -0,0 +1,94 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'DataSandbox/Broker')
+# 'emf' prints CloudWatch Embedded Metric Format lines, 'off' records nothing
+METRICS_MODE = os.environ.get('METRICS_MODE', 'emf')
+
+
+class RecordMetrics:
+    """Per-record stage timings and counters, flushed as one EMF log line."""
+
+    def __init__(self, service='DataSandboxBroker', properties=None, dimensions=None):
+        self.service = service
+        self.properties = dict(properties or {})
+        # every dimension needs a property of the same name, Service is always set
+        self.dimensions = dimensions or [['Service']]
+        self.values = {}
+        self.units = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        outcome = 'ok'
+        try:
+            yield
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            self.put(f'{name}Ms', (time.perf_counter() - start) * 1000, 'Milliseconds')
+            self.properties[f'{name}Outcome'] = outcome
+
+    def put(self, name, value, unit='Count'):
+        self.values[name] = value
+        self.units[name] = unit
+
+    def count(self, name, value=1):
+        self.put(name, self.values.get(name, 0) + value)
+
+    def set_property(self, name, value):
+        self.properties[name] = value
+
+    def to_emf(self):
+        doc = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': self.dimensions,
+                    'Metrics': [{'Name': name, 'Unit': self.units[name]} for name in self.values]
+                }]
+            },
+            'Service': self.service
+        }
+        doc.update(self.properties)
+        doc.update(self.values)
+        return doc
+
+    def flush(self):
+        print(json.dumps(self.to_emf(), default=str))
+
+
+class NoopMetrics:
+    """Drop-in RecordMetrics that records nothing, for tests and local runs."""
+
+    def __init__(self, service=None, properties=None, dimensions=None):
+        pass
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def put(self, name, value, unit='Count'):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def set_property(self, name, value):
+        pass
+
+    def flush(self):
+        pass
+
+
+def new_metrics(service='DataSandboxBroker', properties=None, dimensions=None):
+    if METRICS_MODE == 'off':
+        return NoopMetrics(service, properties, dimensions)
+    return RecordMetrics(service, properties, dimensions)
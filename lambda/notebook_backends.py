@@ -0,0 +1,164 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import hashlib
+import json
+import re
+import threading
+
+from botocore.exceptions import ClientError
+
+from throttle import SingleFlight
+from ttl_cache import TTLCache
+
+
+class NotebookUnavailableError(Exception):
+    """The user's notebook is in a state only an administrator can fix, e.g. Failed."""
+
+
+class NotebookInstanceBackend:
+    """Users share the instances of the notebook pool, started on demand.
+
+    target() routes the user to an instance of the pool, an InService one
+    whenever there is one. ensure_ready() is True once that instance is
+    InService, starts it when it is Stopped, and raises NotebookUnavailableError
+    when it is Failed or being deleted.
+    """
+
+    name = 'notebook'
+    target_property = 'NotebookInstance'
+
+    def __init__(self, get_client, limiter, router, status_index, session_seconds):
+        self.get_client = get_client
+        self.limiter = limiter
+        self.router = router
+        self.status_index = status_index
+        self.session_seconds = session_seconds
+        self.start_flight = SingleFlight()
+
+    def target(self, user):
+        return self.router.route(user)
+
+    def ensure_ready(self, notebook_instance):
+        # an instance the index does not know about is assumed to be InService
+        status = self.status_index.statuses().get(notebook_instance, 'InService')
+        if status == 'InService':
+            return True
+        if status == 'Stopped':
+            self.start_flight.do(notebook_instance, self._start, notebook_instance)
+        elif status in ('Failed', 'Deleting'):
+            raise NotebookUnavailableError(f'notebook instance {notebook_instance} is {status}')
+        # Pending, Stopping and Updating settle by themselves
+        return False
+
+    def _start(self, notebook_instance):
+        try:
+            self.limiter.call(self.get_client('sagemaker').start_notebook_instance, NotebookInstanceName=notebook_instance)
+            print(json.dumps({'notebook_instance': notebook_instance, 'action': 'start'}))
+        except ClientError as e:
+            # another container started it first, the instance is no longer Stopped
+            if e.response.get('Error', {}).get('Code') != 'ValidationException':
+                raise
+        self.status_index.mark(notebook_instance, 'Pending')
+
+    def presign(self, user, notebook_instance):
+        return self.limiter.call(self.get_client('sagemaker').create_presigned_notebook_instance_url,
+                                 NotebookInstanceName=notebook_instance,
+                                 SessionExpirationDurationInSeconds=self.session_seconds)['AuthorizedUrl']
+
+    def stats(self):
+        return self.router.stats()
+
+
+def user_profile_name(user):
+    """A valid, stable Studio user profile name for an AppStream user name.
+
+    Profile names allow [a-zA-Z0-9-] and 63 characters. The hash suffix keeps
+    users apart whose names only differ in the characters that were replaced.
+    """
+    slug = re.sub(r'[^a-z0-9]+', '-', user.lower()).strip('-')[:52] or 'user'
+    return f"{slug}-{hashlib.sha256(user.encode('utf-8')).hexdigest()[:10]}"
+
+
+class StudioBackend:
+    """Every user gets a user profile, and so their own compute, in a SageMaker Studio domain.
+
+    The domain is found by name unless its id is given. A missing user profile is
+    created on the user's first request. Until it is InService, ensure_ready()
+    is False and the client is told to keep waiting. A profile that failed or
+    is being deleted raises NotebookUnavailableError.
+    """
+
+    name = 'studio'
+    target_property = 'UserProfile'
+
+    def __init__(self, get_client, limiter, session_seconds, domain_id=None, domain_name=None, profile_ttl_seconds=3600):
+        self.get_client = get_client
+        self.limiter = limiter
+        self.session_seconds = session_seconds
+        self.domain_id = domain_id
+        self.domain_name = domain_name
+        self.profiles_created = 0
+        # profiles seen InService; a profile is never moved out of service by the broker
+        self.ready_profiles = TTLCache(max_entries=4096, ttl_seconds=profile_ttl_seconds)
+        self.profile_flight = SingleFlight()
+        self._lock = threading.Lock()
+
+    def resolve_domain_id(self):
+        if self.domain_id:
+            return self.domain_id
+        with self._lock:
+            if not self.domain_id:
+                params = {}
+                while not self.domain_id:
+                    resp = self.limiter.call(self.get_client('sagemaker').list_domains, **params)
+                    for domain in resp.get('Domains', []):
+                        if domain['DomainName'] == self.domain_name:
+                            self.domain_id = domain['DomainId']
+                    if not resp.get('NextToken'):
+                        break
+                    params['NextToken'] = resp['NextToken']
+                if not self.domain_id:
+                    raise ValueError(f'SageMaker Studio domain {self.domain_name} not found')
+        return self.domain_id
+
+    def target(self, user):
+        return user_profile_name(user)
+
+    def ensure_ready(self, profile_name):
+        if self.ready_profiles.get(profile_name):
+            return True
+        return self.profile_flight.do(profile_name, self._check_profile, profile_name)
+
+    def _check_profile(self, profile_name):
+        sagemaker = self.get_client('sagemaker')
+        domain_id = self.resolve_domain_id()
+        try:
+            status = self.limiter.call(sagemaker.describe_user_profile,
+                                       DomainId=domain_id, UserProfileName=profile_name)['Status']
+        except sagemaker.exceptions.ResourceNotFound:
+            try:
+                # the profile inherits the domain's default execution role and security groups
+                self.limiter.call(sagemaker.create_user_profile, DomainId=domain_id, UserProfileName=profile_name)
+                self.profiles_created += 1
+                print(json.dumps({'user_profile': profile_name, 'action': 'create'}))
+            except sagemaker.exceptions.ResourceInUse:
+                # created by another container in the meantime
+                pass
+            return False
+        if status == 'InService':
+            self.ready_profiles.set(profile_name, True)
+            return True
+        if status in ('Failed', 'Deleting', 'Delete_Failed'):
+            raise NotebookUnavailableError(f'user profile {profile_name} is {status}')
+        return False
+
+    def presign(self, user, profile_name):
+        return self.limiter.call(self.get_client('sagemaker').create_presigned_domain_url,
+                                 DomainId=self.resolve_domain_id(),
+                                 UserProfileName=profile_name,
+                                 SessionExpirationDurationInSeconds=self.session_seconds)['AuthorizedUrl']
+
+    def stats(self):
+        return {'domain_id': self.domain_id, 'profiles_created': self.profiles_created,
+                'ready_profiles': self.ready_profiles.stats()['size']}
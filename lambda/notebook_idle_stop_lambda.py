@@ -0,0 +1,94 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import datetime
+import json
+import os
+
+from clients import get_client
+from metrics import new_metrics
+
+NOTEBOOK_INSTANCES = os.environ.get('NOTEBOOK_INSTANCES', 'Data-Sandbox-Notebook').split(',')
+DRY_RUN = os.environ.get('DRY_RUN', 'false').lower() == 'true'
+# a notebook URL is good for a 30 minute browser session, an instance is never
+# stopped while a user may still hold one
+NOTEBOOK_SESSION_MINUTES = 30
+WARM_WINDOW_MINUTES = max(NOTEBOOK_SESSION_MINUTES, int(os.environ.get('WARM_WINDOW_MINUTES', '60')))
+# UTC hours, e.g. '7-19', during which instances are kept running on the days of KEEP_WARM_DAYS
+KEEP_WARM_HOURS_UTC = os.environ.get('KEEP_WARM_HOURS_UTC', '')
+KEEP_WARM_DAYS = os.environ.get('KEEP_WARM_DAYS', 'MON,TUE,WED,THU,FRI').split(',')
+# the broker publishes UrlIssued per NotebookInstance for every URL it hands out
+ACTIVITY_NAMESPACE = os.environ.get('ACTIVITY_NAMESPACE', 'DataSandbox/Broker')
+ACTIVITY_SERVICE = os.environ.get('ACTIVITY_SERVICE', 'DataSandboxBroker')
+
+DAYS_OF_WEEK = ['MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT', 'SUN']
+
+
+def in_keep_warm_hours(now):
+    if not KEEP_WARM_HOURS_UTC:
+        return False
+    first, last = (int(h) for h in KEEP_WARM_HOURS_UTC.split('-'))
+    return DAYS_OF_WEEK[now.weekday()] in KEEP_WARM_DAYS and first <= now.hour < last
+
+
+def list_pool_instances():
+    paginator = get_client('sagemaker').get_paginator('list_notebook_instances')
+    instances = {}
+    for page in paginator.paginate(NameContains='Data-Sandbox-Notebook'):
+        for instance in page['NotebookInstances']:
+            if instance['NotebookInstanceName'] in NOTEBOOK_INSTANCES:
+                instances[instance['NotebookInstanceName']] = instance
+    return instances
+
+
+def urls_issued(notebook_instance, start, end):
+    resp = get_client('cloudwatch').get_metric_statistics(
+        Namespace=ACTIVITY_NAMESPACE,
+        MetricName='UrlIssued',
+        Dimensions=[{'Name': 'Service', 'Value': ACTIVITY_SERVICE},
+                    {'Name': 'NotebookInstance', 'Value': notebook_instance}],
+        StartTime=start,
+        EndTime=end,
+        Period=WARM_WINDOW_MINUTES * 60,
+        Statistics=['Sum'])
+    return sum(point['Sum'] for point in resp['Datapoints'])
+
+
+def decide(instance, now):
+    """Return (action, reason) for one notebook instance."""
+    if instance['NotebookInstanceStatus'] != 'InService':
+        return 'skip', instance['NotebookInstanceStatus']
+    if in_keep_warm_hours(now):
+        return 'skip', 'keep-warm-hours'
+    window_start = now - datetime.timedelta(minutes=WARM_WINDOW_MINUTES)
+    # the status change of a start or restart updates LastModifiedTime
+    if instance['LastModifiedTime'] > window_start:
+        return 'skip', 'recently-started'
+    if urls_issued(instance['NotebookInstanceName'], window_start, now) > 0:
+        return 'skip', 'active'
+    return 'stop', 'idle'
+
+
+def lambda_handler(event, context):
+    dry_run = (event or {}).get('dry_run', DRY_RUN)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    sagemaker = get_client('sagemaker')
+
+    decisions = []
+    for name, instance in sorted(list_pool_instances().items()):
+        action, reason = decide(instance, now)
+        if action == 'stop' and not dry_run:
+            sagemaker.stop_notebook_instance(NotebookInstanceName=name)
+        decisions.append({'notebookInstance': name, 'status': instance['NotebookInstanceStatus'],
+                          'action': action, 'reason': reason})
+
+    stopped = sum(1 for d in decisions if d['action'] == 'stop')
+    report = {'dryRun': dry_run, 'warmWindowMinutes': WARM_WINDOW_MINUTES, 'decisions': decisions}
+    print(json.dumps(report))
+
+    metrics = new_metrics(service='NotebookIdleStop', properties={'DryRun': dry_run})
+    metrics.put('NotebooksInService', sum(1 for d in decisions if d['status'] == 'InService'))
+    metrics.put('NotebooksStopped', 0 if dry_run else stopped)
+    metrics.put('NotebooksIdle', stopped)
+    metrics.flush()
+    return report
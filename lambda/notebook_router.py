@@ -0,0 +1,221 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import datetime
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+
+from ttl_cache import TTLCache
+
+
+def rendezvous_rank(key, names):
+    """Order names by their highest-random-weight for key.
+
+    A user keeps the same first choice when instances are added to or removed
+    from the pool, unless their own instance is the one removed.
+    """
+    return sorted(names, key=lambda name: hashlib.sha256(f'{key}|{name}'.encode()).digest(), reverse=True)
+
+
+def list_notebook_statuses(sagemaker, name_contains):
+    """Yield (NotebookInstanceName, NotebookInstanceStatus) of the matching instances."""
+    params = {'NameContains': name_contains, 'MaxResults': 100}
+    while True:
+        resp = sagemaker.list_notebook_instances(**params)
+        for instance in resp.get('NotebookInstances', []):
+            yield instance['NotebookInstanceName'], instance['NotebookInstanceStatus']
+        next_token = resp.get('NextToken')
+        if not next_token:
+            return
+        params['NextToken'] = next_token
+
+
+# statuses an instance stays in until someone acts on it
+SETTLED_STATUSES = {'InService', 'Stopped', 'Failed'}
+# when no instance is InService, the one that will be ready soonest: starting, startable, settling
+FALLBACK_STATUS_ORDER = {'Pending': 0, 'Stopped': 1, 'Stopping': 2, 'Updating': 2}
+
+
+class NotebookStatusIndex:
+    """Status of every notebook instance of the pool, refreshed at most every refresh_seconds.
+
+    Requests between refreshes read the cached index. While an instance is in a
+    transition (Pending, Stopping, ...) the index refreshes every
+    unsettled_refresh_seconds instead, so a started instance is seen InService
+    soon after it is. A failed refresh keeps the last known statuses until the
+    next attempt.
+    """
+
+    def __init__(self, list_statuses, refresh_seconds=60, unsettled_refresh_seconds=10, clock=time.monotonic):
+        self.list_statuses = list_statuses
+        self.refresh_seconds = refresh_seconds
+        self.unsettled_refresh_seconds = unsettled_refresh_seconds
+        self.clock = clock
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._statuses = {}
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def _fresh(self):
+        if self._refreshed_at is None:
+            return False
+        settled = all(status in SETTLED_STATUSES for status in self._statuses.values())
+        max_age = self.refresh_seconds if settled else self.unsettled_refresh_seconds
+        return self.clock() - self._refreshed_at < max_age
+
+    def statuses(self):
+        if self._fresh():
+            return self._statuses
+        # one thread refreshes, the others wait for it and reuse its result
+        with self._lock:
+            if not self._fresh():
+                try:
+                    self._statuses = dict(self.list_statuses())
+                    self.refreshes += 1
+                except Exception as e:
+                    self.refresh_errors += 1
+                    print(json.dumps({'notebook_status_index': 'refresh failed', 'error': f'{type(e).__name__}: {e}'}))
+                self._refreshed_at = self.clock()
+        return self._statuses
+
+    def mark(self, name, status):
+        """Record a status change made by this container until the next refresh confirms it."""
+        with self._lock:
+            self._statuses = dict(self._statuses, **{name: status})
+
+    def invalidate(self):
+        with self._lock:
+            self._refreshed_at = None
+
+
+def urls_issued_per_instance(cloudwatch, instance_names, window_seconds, namespace, service='DataSandboxBroker'):
+    """Return {instance name: UrlIssued sum of the last window_seconds}, over every broker container."""
+    end = datetime.datetime.now(datetime.timezone.utc)
+    queries = [{'Id': f'instance{index}',
+                'MetricStat': {'Metric': {'Namespace': namespace, 'MetricName': 'UrlIssued',
+                                          'Dimensions': [{'Name': 'Service', 'Value': service},
+                                                         {'Name': 'NotebookInstance', 'Value': name}]},
+                               'Period': window_seconds, 'Stat': 'Sum'}}
+               for index, name in enumerate(instance_names)]
+    params = {'MetricDataQueries': queries, 'StartTime': end - datetime.timedelta(seconds=window_seconds),
+              'EndTime': end}
+    loads = {name: 0 for name in instance_names}
+    while True:
+        resp = cloudwatch.get_metric_data(**params)
+        for result in resp.get('MetricDataResults', []):
+            loads[instance_names[int(result['Id'][len('instance'):])]] += int(sum(result.get('Values', [])))
+        if not resp.get('NextToken'):
+            return loads
+        params['NextToken'] = resp['NextToken']
+
+
+class NotebookLoadIndex:
+    """Users sent to each instance of the pool by all broker containers, read at most every refresh_seconds.
+
+    list_loads returns the URLs issued per instance within the routing window,
+    e.g. urls_issued_per_instance. The metric reaches CloudWatch a minute or
+    two late, so the URLs this container issued since the last read are added
+    until the next read. A failed read keeps the last known loads.
+    """
+
+    def __init__(self, list_loads, refresh_seconds=60, clock=time.monotonic):
+        self.list_loads = list_loads
+        self.refresh_seconds = refresh_seconds
+        self.clock = clock
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._loads = Counter()
+        self._issued = Counter()
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def loads(self):
+        with self._lock:
+            if self._refreshed_at is None or self.clock() - self._refreshed_at >= self.refresh_seconds:
+                try:
+                    self._loads = Counter(self.list_loads())
+                    self._issued = Counter()
+                    self.refreshes += 1
+                except Exception as e:
+                    self.refresh_errors += 1
+                    print(json.dumps({'notebook_load_index': 'refresh failed', 'error': f'{type(e).__name__}: {e}'}))
+                self._refreshed_at = self.clock()
+            return self._loads + self._issued
+
+    def record(self, name):
+        with self._lock:
+            self._issued[name] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._refreshed_at = None
+
+
+class NotebookRouter:
+    """Route users to notebook instances of the pool.
+
+    A user goes to the first instance of their rendezvous ranking while it is
+    InService and has room. Otherwise the user goes to the least loaded InService
+    instance, and ties keep the ranking order. When no instance is InService, the
+    user goes to one that is starting, or else to the first Stopped one, which the
+    broker then starts. The load of an instance comes from load_index, shared by all
+    broker containers, and is only read when the first choice is not usable or
+    max_users_per_instance is set. The chosen instance sticks to the user for
+    assignment_ttl_seconds in this container.
+    """
+
+    def __init__(self, instance_names, status_index=None, load_index=None, max_users_per_instance=0,
+                 assignment_ttl_seconds=1800, max_entries=1024):
+        self.instance_names = list(instance_names)
+        self.status_index = status_index
+        self.load_index = load_index
+        self.max_users_per_instance = max_users_per_instance
+        self.assignments = TTLCache(max_entries=max_entries, ttl_seconds=assignment_ttl_seconds)
+
+    def loads(self):
+        loads = Counter({name: 0 for name in self.instance_names})
+        if self.load_index is not None:
+            loads.update({name: count for name, count in self.load_index.loads().items() if name in loads})
+        return loads
+
+    def route(self, user):
+        if len(self.instance_names) == 1:
+            return self.instance_names[0]
+
+        statuses = self.status_index.statuses() if self.status_index is not None else {}
+        # an instance missing from the index, e.g. before the first refresh succeeded, is assumed usable
+        usable = [name for name in self.instance_names if statuses.get(name, 'InService') == 'InService']
+
+        assigned = self.assignments.get(user)
+        if assigned in usable:
+            self.assignments.set(user, assigned)
+            return assigned
+
+        ranked = rendezvous_rank(user, self.instance_names)
+        if not usable:
+            # wait for an instance that is already starting rather than start another one,
+            # a Failed or Deleting instance is only returned when the whole pool is
+            return min(ranked, key=lambda name: FALLBACK_STATUS_ORDER.get(statuses.get(name), 3))
+        preferred = ranked[0]
+        if preferred in usable and self.max_users_per_instance <= 0:
+            choice = preferred
+        else:
+            loads = self.loads()
+            if preferred in usable and loads[preferred] < self.max_users_per_instance:
+                choice = preferred
+            else:
+                choice = min((name for name in ranked if name in usable), key=lambda name: loads[name])
+        self.assignments.set(user, choice)
+        return choice
+
+    def stats(self):
+        stats = {'assignments': len(self.assignments.items())}
+        if self.status_index is not None:
+            stats.update(refreshes=self.status_index.refreshes, refresh_errors=self.status_index.refresh_errors)
+        if self.load_index is not None:
+            stats.update(load_refreshes=self.load_index.refreshes, load_refresh_errors=self.load_index.refresh_errors)
+        return stats
@@ -0,0 +1,115 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import datetime
+import json
+import os
+import time
+
+
+class HomeFolderChannel:
+    """session_url.txt in the user's home folder, picked up by the AppStream sync."""
+
+    name = 'homefolder'
+    stage = 'PutObject'
+
+    def __init__(self, get_client):
+        self.get_client = get_client
+
+    def deliver(self, bucket, prefix, session_id, body):
+        self.get_client('s3').put_object(Bucket=bucket, Body=body, Key=f'{prefix}/session_url.txt')
+
+
+class SsmChannel:
+    """One SecureString parameter per session, read through the fleet's SSM endpoint.
+
+    The parameter is written once and expires after ttl_seconds. The client
+    deletes it before every request and once it has read it.
+    """
+
+    name = 'ssm'
+    stage = 'PutParameter'
+
+    def __init__(self, get_client, parameter_prefix='/datasandbox/session-url', ttl_seconds=300):
+        self.get_client = get_client
+        self.parameter_prefix = parameter_prefix
+        self.ttl_seconds = ttl_seconds
+
+    def parameter_name(self, session_id):
+        return f'{self.parameter_prefix}/{session_id}'
+
+    def deliver(self, bucket, prefix, session_id, body):
+        client = self.get_client('ssm')
+        expires = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.ttl_seconds)
+        try:
+            client.put_parameter(
+                Name=self.parameter_name(session_id),
+                Value=body,
+                Type='SecureString',
+                Overwrite=False,
+                # expiration policies need the advanced tier
+                Tier='Advanced',
+                Policies=json.dumps([{
+                    'Type': 'Expiration', 'Version': '1.0',
+                    'Attributes': {'Timestamp': expires.strftime('%Y-%m-%dT%H:%M:%S.000Z')}
+                }]))
+        except client.exceptions.ParameterAlreadyExists:
+            # an unread response for this session is still waiting for the client
+            pass
+
+
+class LocalChannel:
+    """File based stand-in for a write-once/read-once channel, for local runs."""
+
+    name = 'local'
+    stage = 'DeliverLocal'
+
+    def __init__(self, directory, ttl_seconds=300):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, session_id)
+
+    def deliver(self, bucket, prefix, session_id, body):
+        path = self._path(session_id)
+        tmp_path = f'{path}.{os.getpid()}.{time.monotonic_ns()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(body)
+        try:
+            # link fails if a response is already waiting, which keeps it write-once
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    def read_once(self, session_id):
+        path = self._path(session_id)
+        claimed = f'{path}.reading.{os.getpid()}.{time.monotonic_ns()}'
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        try:
+            if os.path.getmtime(claimed) + self.ttl_seconds < time.time():
+                return None
+            with open(claimed) as f:
+                return f.read()
+        finally:
+            os.remove(claimed)
+
+
+def build_channels(names, get_client, ttl_seconds=300, local_directory=None):
+    channels = []
+    for name in names:
+        if name == HomeFolderChannel.name:
+            channels.append(HomeFolderChannel(get_client))
+        elif name == SsmChannel.name:
+            channels.append(SsmChannel(get_client, ttl_seconds=ttl_seconds))
+        elif name == LocalChannel.name:
+            channels.append(LocalChannel(local_directory, ttl_seconds=ttl_seconds))
+        else:
+            raise ValueError(f'unknown response channel {name}')
+    return channels
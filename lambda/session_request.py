@@ -0,0 +1,60 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import hashlib
+import json
+import posixpath
+import re
+
+# sagemaker-notebook.ps1 writes its request to
+#   user/custom/<sha256(user)>/session-requests/<stack>/<fleet>/<sessionId>/session.json
+# so everything but the user name can be read from the key. The user is read from
+# the body the first time a container sees the hash, and checked against it.
+REQUEST_KEY_PATTERN = re.compile(
+    r'^(?P<prefix>user/custom/(?P<user_hash>[0-9a-f]{64}))'
+    r'/session-requests/(?P<stack>[A-Za-z0-9_.-]{1,100})/(?P<fleet>[A-Za-z0-9_.-]{1,100})'
+    r'/(?P<session_id>[A-Za-z0-9-]{1,128})/session\.json$')
+
+# legacy request written to the root of the home folder, its fields are in the body
+LEGACY_KEY_PATTERN = re.compile(r'^user/custom/[0-9a-f]{64}/session\.json$')
+
+REQUEST_FIELDS = ('user', 'sessionId', 'bucketName', 'prefixName', 'stackName', 'fleetName')
+
+
+def hash_user(user):
+    return hashlib.sha256(user.encode('utf-8')).hexdigest()
+
+
+def is_session_request_key(key):
+    """True for the only two key shapes the broker acts on, anything else is ignored."""
+    return REQUEST_KEY_PATTERN.match(key) is not None or LEGACY_KEY_PATTERN.match(key) is not None
+
+
+def parse_request_key(key):
+    """Return the request fields encoded in key, or None if it is not a keyed request."""
+    match = REQUEST_KEY_PATTERN.match(key)
+    if match is None:
+        return None
+    return match.groupdict()
+
+
+def parse_request_body(data, bucket, key, prefix=None):
+    """Parse and validate a session.json body read from bucket/key.
+
+    prefix is the home folder of the request, the folder of key unless given.
+    Raises ValueError when a field is missing or does not belong to the object
+    the request was read from.
+    """
+    request = json.loads(data)
+    if not isinstance(request, dict):
+        raise ValueError('session request is not a JSON object')
+    for field in REQUEST_FIELDS:
+        if not isinstance(request.get(field), str) or not request[field]:
+            raise ValueError(f'session request field {field} is missing or empty')
+    if request['bucketName'] != bucket:
+        raise ValueError('session request bucketName does not match the event bucket')
+    if request['prefixName'] != (posixpath.dirname(key) if prefix is None else prefix):
+        raise ValueError('session request prefixName does not match the event key')
+    if hash_user(request['user']) != posixpath.basename(request['prefixName']):
+        raise ValueError('session request user does not match the home folder')
+    return request
@@ -0,0 +1,28 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+
+def iter_sessions(appstream, stack_name, fleet_name, user=None):
+    """Yield every AppStream session of the stack/fleet, one page at a time."""
+    params = {'StackName': stack_name, 'FleetName': fleet_name}
+    if user is not None:
+        params['UserId'] = user
+    while True:
+        resp = appstream.describe_sessions(**params)
+        for session in resp.get('Sessions', []):
+            yield session
+        next_token = resp.get('NextToken')
+        if not next_token:
+            return
+        params['NextToken'] = next_token
+
+
+def find_session(appstream, stack_name, fleet_name, session_id, user=None):
+    """Return the session whose Id is session_id, or None if there is no such session.
+
+    Pages are only fetched until the session is found.
+    """
+    for session in iter_sessions(appstream, stack_name, fleet_name, user=user):
+        if session['Id'] == session_id:
+            return session
+    return None
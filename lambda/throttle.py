@@ -0,0 +1,135 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+THROTTLING_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'SlowDown',
+}
+
+
+def is_throttling_error(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into a single execution.
+
+    The first caller for a key runs the function, callers arriving while it is in
+    flight wait for it and receive the same result or exception.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AdaptiveTokenBucket:
+    """Token bucket whose rate backs off multiplicatively on throttling errors.
+
+    The rate drops to backoff_factor of its value (not below min_rate) and new
+    calls are held back for a jittered pause whenever a call is throttled. It
+    then recovers by recovery_step tokens/sec on every success until it reaches
+    max_rate again.
+    """
+
+    def __init__(self, max_rate, burst=None, min_rate=0.5, backoff_factor=0.5, recovery_step=0.1,
+                 base_pause_seconds=0.2, max_pause_seconds=5.0, clock=time.monotonic, sleep=time.sleep):
+        self.max_rate = float(max_rate)
+        self.rate = self.max_rate
+        self.burst = float(burst if burst is not None else max_rate)
+        self.min_rate = min_rate
+        self.backoff_factor = backoff_factor
+        self.recovery_step = recovery_step
+        self.base_pause_seconds = base_pause_seconds
+        self.max_pause_seconds = max_pause_seconds
+        self.clock = clock
+        self.sleep = sleep
+        self.throttled = 0
+        self._tokens = self.burst
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._consecutive_throttles = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            self.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self._consecutive_throttles = 0
+            self.rate = min(self.max_rate, self.rate + self.recovery_step)
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttled += 1
+            self._consecutive_throttles += 1
+            self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+            pause = min(self.max_pause_seconds, self.base_pause_seconds * 2 ** (self._consecutive_throttles - 1))
+            self._paused_until = max(self._paused_until, self.clock() + random.uniform(pause / 2, pause))
+
+    def call(self, fn, *args, **kwargs):
+        self.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_throttling_error(e):
+                self.on_throttle()
+            raise
+        self.on_success()
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {'rate': round(self.rate, 3), 'throttled': self.throttled}
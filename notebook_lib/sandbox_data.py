@@ -0,0 +1,333 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+"""Fast reads of large objects from the data sandbox bucket, for the notebook kernels.
+
+    from sandbox_data import ChunkCache, SandboxReader
+
+    with SandboxReader(bucket, cache=ChunkCache()) as reader:
+        df = pandas.read_parquet(reader.open('exports/trips.parquet'))
+        with open('/tmp/trips.csv', 'wb') as f:
+            reader.copy_to('exports/trips.csv', f)
+
+An object is fetched as ranged GETs of chunk_size bytes, at most max_workers at
+a time. Every chunk is read straight into the consumer's buffer or into a file
+of the chunk cache, and cached chunks are read back through mmap. The cache
+keeps the least recently used chunks up to max_bytes on the notebook volume,
+instead of a full copy of every object that was read.
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_CACHE_DIR = os.environ.get('SANDBOX_DATA_CACHE_DIR',
+                                   os.path.expanduser('~/SageMaker/.datasandbox/chunk-cache'))
+DEFAULT_CACHE_BYTES = int(os.environ.get('SANDBOX_DATA_CACHE_BYTES', str(2 * 1024 ** 3)))
+
+
+def read_body_into(body, view):
+    """Fill view from a GetObject body, without an intermediate bytes object."""
+    # StreamingBody only has readinto in recent botocore, the urllib3 response below it always has
+    stream = body if hasattr(body, 'readinto') else getattr(body, '_raw_stream', None)
+    filled = 0
+    while filled < len(view):
+        if stream is not None:
+            count = stream.readinto(view[filled:])
+        else:
+            data = body.read(len(view) - filled)
+            count = len(data)
+            view[filled:filled + count] = data
+        if not count:
+            raise IOError(f'short read: {filled} of {len(view)} bytes')
+        filled += count
+
+
+class ChunkCache:
+    """Thread safe LRU cache of object chunks, one file each under directory, at most max_bytes in total.
+
+    Chunks are written through a writable mmap under a temporary name and then
+    renamed, so no reader sees a partial chunk. Hits are returned as read-only
+    memoryviews over an mmap of the file. Kernels can share the directory, the
+    LRU order of chunks cached by earlier kernels is their modification time.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        cached = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.tmp'):
+                # left behind by a kernel that died while writing
+                self._remove(entry.name)
+                continue
+            stat = entry.stat()
+            cached.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(cached):
+            self._entries[name] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _remove(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        # a chunk that is still mapped stays readable after its file is removed
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            self._remove(name)
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+        try:
+            with open(self._path(name), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(self._path(name))
+        except FileNotFoundError:
+            # evicted by another kernel sharing the directory
+            with self._lock:
+                self._size -= self._entries.pop(name, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return memoryview(mapped)
+
+    def put(self, name, size, fill):
+        """Create chunk name of size bytes, fill(view) writes it, and return a view of the cached chunk."""
+        tmp_path = self._path(f'{name}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'w+b') as f:
+            f.truncate(size)
+            mapped = mmap.mmap(f.fileno(), size)
+        try:
+            with memoryview(mapped) as view:
+                fill(view)
+            # mapped again read-only, the pages just written are still in the page cache
+            with open(tmp_path, 'rb') as f:
+                cached = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            os.replace(tmp_path, self._path(name))
+        except BaseException:
+            self._remove(os.path.basename(tmp_path))
+            raise
+        finally:
+            mapped.close()
+        with self._lock:
+            self._size += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            self._evict()
+        return memoryview(cached)
+
+    def stats(self):
+        with self._lock:
+            return {'chunks': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class SandboxReader:
+    """Parallel ranged reads of the objects of one bucket.
+
+    Every GET of an object carries the ETag its HEAD returned, so an object that
+    is replaced while it is read fails with PreconditionFailed instead of
+    mixing chunks of both versions.
+    """
+
+    def __init__(self, bucket, client=None, chunk_size=DEFAULT_CHUNK_SIZE, max_workers=DEFAULT_MAX_WORKERS, cache=None):
+        self.bucket = bucket
+        # botocore keeps 10 connections per client by default, one per worker avoids waiting for a connection
+        self.client = client or boto3.client('s3', config=Config(max_pool_connections=max_workers))
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.cache = cache
+        self.requests = 0
+        self.bytes_fetched = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sandbox-data')
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def head(self, key):
+        """Return (size, etag) of the object."""
+        resp = self.client.head_object(Bucket=self.bucket, Key=key)
+        return resp['ContentLength'], resp['ETag']
+
+    def _chunks(self, size):
+        return [(start, min(self.chunk_size, size - start)) for start in range(0, size, self.chunk_size)]
+
+    def _fetch_into(self, key, etag, start, view):
+        resp = self.client.get_object(Bucket=self.bucket, Key=key, IfMatch=etag,
+                                      Range=f'bytes={start}-{start + len(view) - 1}')
+        read_body_into(resp['Body'], view)
+        with self._lock:
+            self.requests += 1
+            self.bytes_fetched += len(view)
+
+    def _chunk(self, key, etag, start, length):
+        """Return a memoryview of one chunk, from the cache when there is one."""
+        if self.cache is None:
+            view = memoryview(bytearray(length))
+            self._fetch_into(key, etag, start, view)
+            return view
+        name = hashlib.sha256(f'{self.bucket}/{key}|{etag}|{self.chunk_size}|{start}'.encode()).hexdigest()
+        view = self.cache.get(name)
+        if view is None:
+            view = self.cache.put(name, length, lambda target: self._fetch_into(key, etag, start, target))
+        return view
+
+    def _copy_chunk(self, key, etag, start, target):
+        target[:] = self._chunk(key, etag, start, len(target))
+
+    def readinto(self, key, buffer):
+        """Read the whole object into buffer, e.g. a bytearray, numpy array or writable mmap, and return its size.
+
+        Without a cache every chunk is written directly into its slice of buffer.
+        """
+        size, etag = self.head(key)
+        view = memoryview(buffer).cast('B')
+        if len(view) < size:
+            raise ValueError(f'buffer of {len(view)} bytes is too small for {size} bytes')
+        fetch = self._fetch_into if self.cache is None else self._copy_chunk
+        futures = [self._executor.submit(fetch, key, etag, start, view[start:start + length])
+                   for start, length in self._chunks(size)]
+        for future in futures:
+            future.result()
+        return size
+
+    def read(self, key):
+        size, _ = self.head(key)
+        buffer = bytearray(size)
+        self.readinto(key, buffer)
+        return buffer
+
+    def iter_chunks(self, key, prefetch=None):
+        """Yield the object as consecutive memoryviews, with up to prefetch chunks in flight."""
+        size, etag = self.head(key)
+        chunks = iter(self._chunks(size))
+        pending = deque()
+
+        def submit_next():
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pending.append(self._executor.submit(self._chunk, key, etag, *chunk))
+
+        for _ in range(prefetch or self.max_workers):
+            submit_next()
+        try:
+            while pending:
+                view = pending.popleft().result()
+                submit_next()
+                yield view
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def copy_to(self, key, fileobj):
+        """Write the object to a binary file-like object and return its size."""
+        copied = 0
+        for view in self.iter_chunks(key):
+            fileobj.write(view)
+            copied += len(view)
+        return copied
+
+    def open(self, key):
+        """Return a seekable, buffered binary file of the object, for libraries that take a file."""
+        return io.BufferedReader(SandboxObject(self, key), buffer_size=self.chunk_size)
+
+    def stats(self):
+        stats = {'requests': self.requests, 'bytes_fetched': self.bytes_fetched}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return stats
+
+
+class SandboxObject(io.RawIOBase):
+    """Random access to one object, a chunk at a time, prefetching the next chunk."""
+
+    def __init__(self, reader, key):
+        super().__init__()
+        self.reader = reader
+        self.key = key
+        self.size, self.etag = reader.head(key)
+        self._position = 0
+        self._chunks = {}
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self.size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def _chunk_future(self, start):
+        if start not in self._chunks:
+            length = min(self.reader.chunk_size, self.size - start)
+            self._chunks[start] = self.reader._executor.submit(self.reader._chunk, self.key, self.etag, start, length)
+        return self._chunks[start]
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        start = self._position - self._position % self.reader.chunk_size
+        chunk = self._chunk_future(start)
+        # keep the current chunk and the next one only
+        following = start + self.reader.chunk_size
+        if following < self.size:
+            self._chunk_future(following)
+        for cached_start in [s for s in self._chunks if s not in (start, following)]:
+            self._chunks.pop(cached_start).cancel()
+
+        view = chunk.result()
+        offset = self._position - start
+        count = min(len(buffer), len(view) - offset)
+        memoryview(buffer).cast('B')[:count] = view[offset:offset + count]
+        self._position += count
+        return count
+
+    def close(self):
+        for future in self._chunks.values():
+            future.cancel()
+        self._chunks.clear()
+        super().close()
@@ -0,0 +1,24 @@
+#!/bin/bash
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+# Runs once, as root, when the notebook instance is created. Only
+# /home/ec2-user/SageMaker lives on the EBS volume and survives a restart, so
+# the environment cache and its pip configuration are placed there. The
+# environment itself is built by on-start.sh, which also runs on the first boot.
+
+set -e
+
+PERSISTENT=/home/ec2-user/SageMaker/.datasandbox
+
+mkdir -p "$PERSISTENT/envs" "$PERSISTENT/pkgs" "$PERSISTENT/pip-cache" "$PERSISTENT/wheelhouse"
+
+# the instance has no internet access, pip only installs from the synced wheelhouse
+cat > "$PERSISTENT/pip.conf" <<PIP
+[global]
+no-index = true
+find-links = $PERSISTENT/wheelhouse
+cache-dir = $PERSISTENT/pip-cache
+PIP
+
+chown -R ec2-user:ec2-user "$PERSISTENT"
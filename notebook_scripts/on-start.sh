@@ -0,0 +1,102 @@
+#!/bin/bash
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+# Runs as root on every start of the notebook instance, including the first.
+#
+# The "Data Sandbox" kernel runs from a conda environment kept on the EBS volume
+# under /home/ec2-user/SageMaker/.datasandbox. On the first boot it is cloned,
+# offline, from the preinstalled python3 environment. Packages are installed
+# from s3://<data sandbox bucket>/__PACKAGE_PREFIX__/, which holds a
+# requirements.txt and the wheels it needs, e.g. from
+# `pip download -r requirements.txt -d . --only-binary=:all: --platform manylinux2014_x86_64`,
+# and the modules of notebook_lib/ under lib/.
+# The environment is only rebuilt when that requirements.txt changes, so later
+# starts just re-register the kernel. Lifecycle scripts must finish within
+# 5 minutes, so the build and the pre-warm run in the background.
+
+set -e
+
+PACKAGE_BUCKET="__PACKAGE_BUCKET__"
+PACKAGE_PREFIX="__PACKAGE_PREFIX__"
+PERSISTENT=/home/ec2-user/SageMaker/.datasandbox
+ENV_PREFIX=$PERSISTENT/envs/datasandbox
+
+mkdir -p "$PERSISTENT/envs" "$PERSISTENT/pkgs" "$PERSISTENT/pip-cache" "$PERSISTENT/wheelhouse"
+
+cat > "$PERSISTENT/build-env.sh" <<'BUILD'
+#!/bin/bash
+# Runs as ec2-user: build-env.sh kernel | build-env.sh build <bucket> <prefix>
+set -e
+
+PERSISTENT=/home/ec2-user/SageMaker/.datasandbox
+ENV_PREFIX=$PERSISTENT/envs/datasandbox
+STAMP=$ENV_PREFIX/.requirements.sha256
+export CONDA_PKGS_DIRS=$PERSISTENT/pkgs
+export PIP_CONFIG_FILE=$PERSISTENT/pip.conf
+source /home/ec2-user/anaconda3/bin/activate
+
+register_kernel() {
+    "$ENV_PREFIX/bin/python" -m ipykernel install --user --name datasandbox --display-name "Data Sandbox"
+}
+
+if [ "$1" == "kernel" ]; then
+    register_kernel
+    exit 0
+fi
+
+exec 9> "$PERSISTENT/.build.lock"
+flock -n 9 || { echo "a build is already running"; exit 0; }
+echo "build started $(date -u +%FT%TZ)"
+
+aws s3 sync --only-show-errors --delete "s3://$2/$3/" "$PERSISTENT/wheelhouse/" || echo "no wheelhouse in s3://$2/$3/"
+
+if [ ! -x "$ENV_PREFIX/bin/python" ]; then
+    conda create --yes --quiet --offline --prefix "$ENV_PREFIX" --clone python3
+    rm -f "$STAMP"
+fi
+
+# the data sandbox libraries, e.g. sandbox_data, are synced to wheelhouse/lib
+SITE_PACKAGES=$("$ENV_PREFIX/bin/python" -c 'import sysconfig; print(sysconfig.get_paths()["purelib"])')
+echo "$PERSISTENT/wheelhouse/lib" > "$SITE_PACKAGES/datasandbox-lib.pth"
+
+if [ -f "$PERSISTENT/wheelhouse/requirements.txt" ]; then
+    WANTED=$(sha256sum "$PERSISTENT/wheelhouse/requirements.txt" | cut -d' ' -f1)
+    if [ "$(cat "$STAMP" 2>/dev/null)" != "$WANTED" ]; then
+        "$ENV_PREFIX/bin/python" -m pip install --quiet -r "$PERSISTENT/wheelhouse/requirements.txt"
+        echo "$WANTED" > "$STAMP"
+    fi
+fi
+
+# byte-compiled once on the EBS volume, kernels then skip compiling at import
+"$ENV_PREFIX/bin/python" -m compileall -q -j 0 "$ENV_PREFIX/lib" > /dev/null 2>&1 || true
+register_kernel
+
+# read the common libraries once, so the first kernel of the boot does not wait on a cold volume
+"$ENV_PREFIX/bin/python" -c "
+import importlib
+for name in ('numpy', 'pandas', 'boto3', 'matplotlib.pyplot'):
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        pass
+" || true
+echo "build finished $(date -u +%FT%TZ)"
+BUILD
+
+# created before this configuration was attached, on-create.sh never ran
+if [ ! -f "$PERSISTENT/pip.conf" ]; then
+    printf '[global]\nno-index = true\nfind-links = %s/wheelhouse\ncache-dir = %s/pip-cache\n' "$PERSISTENT" "$PERSISTENT" > "$PERSISTENT/pip.conf"
+fi
+chown -R ec2-user:ec2-user "$PERSISTENT"
+
+# `conda activate datasandbox` in a terminal finds the cached environment
+sudo -u ec2-user bash -c "printf 'envs_dirs:\n  - $PERSISTENT/envs\n  - /home/ec2-user/anaconda3/envs\n' > /home/ec2-user/.condarc"
+
+# the home directory is recreated on every start, a cached environment only needs its kernel registered again
+if [ -x "$ENV_PREFIX/bin/python" ]; then
+    # a failure here must not fail the start of the instance, the background build registers it again
+    sudo -u ec2-user bash "$PERSISTENT/build-env.sh" kernel || true
+fi
+
+sudo -u ec2-user nohup bash "$PERSISTENT/build-env.sh" build "$PACKAGE_BUCKET" "$PACKAGE_PREFIX" >> "$PERSISTENT/build.log" 2>&1 &
@@ -11,9 +11,13 @@ from aws_cdk import (
     aws_logs as logs,
     aws_cloudformation as cfn,
     custom_resources as cr,
-    aws_s3 as s3
+    aws_s3 as s3,
+    aws_dynamodb as dynamodb,
+    aws_sqs as sqs,
+    aws_applicationautoscaling as appscaling
 )
 from aws_cdk.core import Aws
+from stacks.data_sandbox_notebook import notebook_instance_names
 
 current_dir = os.path.dirname(__file__)
 
@@ -27,6 +31,20 @@ class AppstreamStack(cfn.NestedStack):
         appstream_image_name = self.node.try_get_context("appstream_image_name")
         appstream_instance_type = self.node.try_get_context("appstream_instance_type")
         appstream_fleet_type = self.node.try_get_context("appstream_fleet_type")
+        appstream_desired_instances = int(self.node.try_get_context("appstream_desired_instances") or 5)
+        appstream_idle_disconnect_timeout_seconds = int(self.node.try_get_context("appstream_idle_disconnect_timeout_seconds") or 0)
+        appstream_disconnect_timeout_seconds = int(self.node.try_get_context("appstream_disconnect_timeout_seconds") or 345600)
+        appstream_max_user_duration_seconds = int(self.node.try_get_context("appstream_max_user_duration_seconds") or 345600)
+        appstream_scaling = self.node.try_get_context("appstream_scaling") or {}
+        notebook_pool_size = int(self.node.try_get_context("notebook_pool_size") or 1)
+        notebook_max_users_per_instance = int(self.node.try_get_context("notebook_max_users_per_instance") or 0)
+        sandbox_backend = self.node.try_get_context("sandbox_backend") or 'notebook'
+        studio_domain_name = self.node.try_get_context("studio_domain_name") or 'data-sandbox-studio'
+        broker_queue_enabled = str(self.node.try_get_context("broker_queue_enabled")).lower() == 'true'
+        broker_queue_batch_size = int(self.node.try_get_context("broker_queue_batch_size") or 10)
+        broker_queue_batching_window_seconds = int(self.node.try_get_context("broker_queue_batching_window_seconds") or 0)
+        broker_queue_max_concurrency = int(self.node.try_get_context("broker_queue_max_concurrency") or 5)
+        broker_queue_max_receive_count = int(self.node.try_get_context("broker_queue_max_receive_count") or 3)
         
         #build AppStream security
         self.appstream_security_group = ec2.SecurityGroup(
@@ -48,7 +66,18 @@ class AppstreamStack(cfn.NestedStack):
                         iam.PolicyStatement(
                             effect=iam.Effect.ALLOW,
                             actions=['ssm:GetParameter'],
-                            resources=['*']
+                            resources=[f'arn:aws:ssm:{Aws.REGION}:{Aws.ACCOUNT_ID}:parameter/s3/datasandboxbucket']
+                        )
+                    ]
+                ),
+                # every fleet instance shares this role, so a session's parameter is only protected by its
+                # unguessable session id and the short expiry of the URL, not by IAM
+                'AllowSessionUrlRead': iam.PolicyDocument(
+                    statements=[
+                        iam.PolicyStatement(
+                            effect=iam.Effect.ALLOW,
+                            actions=['ssm:GetParameter', 'ssm:DeleteParameter'],
+                            resources=[f'arn:aws:ssm:{Aws.REGION}:{Aws.ACCOUNT_ID}:parameter/datasandbox/session-url/*']
                         )
                     ]
                 ),
@@ -67,12 +96,12 @@ class AppstreamStack(cfn.NestedStack):
 
         appstream_fleet = appstream.CfnFleet(self, 'AppStreamFleet',
              compute_capacity=appstream.CfnFleet.ComputeCapacityProperty(
-                 desired_instances=5),
+                 desired_instances=appstream_desired_instances),
              instance_type=appstream_instance_type,
              fleet_type=appstream_fleet_type,
-             idle_disconnect_timeout_in_seconds=0,
-             disconnect_timeout_in_seconds=345600,
-             max_user_duration_in_seconds=345600,
+             idle_disconnect_timeout_in_seconds=appstream_idle_disconnect_timeout_seconds,
+             disconnect_timeout_in_seconds=appstream_disconnect_timeout_seconds,
+             max_user_duration_in_seconds=appstream_max_user_duration_seconds,
              image_name=appstream_image_name,
              name=f'{appstream_environment_name}-fleet',
              vpc_config=appstream.CfnFleet.VpcConfigProperty(
@@ -103,8 +132,51 @@ class AppstreamStack(cfn.NestedStack):
         fleet_association.add_depends_on(appstream_stack)
         fleet_association.add_depends_on(appstream_fleet)
 
+        # Scale the fleet on capacity utilization, plus scheduled capacity windows
+        if appstream_scaling:
+            fleet_scalable_target = appscaling.ScalableTarget(self, 'AppStreamFleetScalableTarget',
+                service_namespace=appscaling.ServiceNamespace.APPSTREAM,
+                resource_id=f'fleet/{appstream_environment_name}-fleet',
+                scalable_dimension='appstream:fleet:DesiredCapacity',
+                min_capacity=int(appstream_scaling.get('min_capacity', 1)),
+                max_capacity=int(appstream_scaling.get('max_capacity', appstream_desired_instances)),
+                role=iam.Role.from_role_arn(self, 'AppStreamAutoScalingRole',
+                    f'arn:aws:iam::{Aws.ACCOUNT_ID}:role/service-role/ApplicationAutoScalingForAmazonAppStreamAccess')
+                )
+            fleet_scalable_target.node.add_dependency(appstream_fleet)
+
+            # PredefinedMetric has no AppStream member in this CDK version, so the policy is declared directly
+            if appstream_scaling.get('target_utilization_percent'):
+                appscaling.CfnScalingPolicy(self, 'AppStreamCapacityUtilization',
+                    policy_name=f'{appstream_environment_name}-fleet-capacity-utilization',
+                    policy_type='TargetTrackingScaling',
+                    scaling_target_id=fleet_scalable_target.scalable_target_id,
+                    target_tracking_scaling_policy_configuration=appscaling.CfnScalingPolicy.TargetTrackingScalingPolicyConfigurationProperty(
+                        target_value=float(appstream_scaling['target_utilization_percent']),
+                        predefined_metric_specification=appscaling.CfnScalingPolicy.PredefinedMetricSpecificationProperty(
+                            predefined_metric_type='AppStreamAverageCapacityUtilization'),
+                        scale_in_cooldown=int(appstream_scaling.get('scale_in_cooldown_seconds', 900)),
+                        scale_out_cooldown=int(appstream_scaling.get('scale_out_cooldown_seconds', 120))
+                        )
+                    )
+
+            for scheduled_action in appstream_scaling.get('schedules', []):
+                fleet_scalable_target.scale_on_schedule(scheduled_action['name'],
+                    schedule=appscaling.Schedule.expression(scheduled_action['schedule']),
+                    min_capacity=scheduled_action.get('min_capacity'),
+                    max_capacity=scheduled_action.get('max_capacity')
+                    )
+
         # Build Lambda Function Resources
 
+        # Table of already handled S3 events, so redelivered notifications are skipped
+        dedup_table = dynamodb.Table(self, 'DataSandboxDedupTable',
+            partition_key=dynamodb.Attribute(name='pk', type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute='expiresAt',
+            removal_policy=core.RemovalPolicy.DESTROY
+            )
+
         # Define Lambda Function Policy
 
         lambda_inline_policy = {
@@ -138,15 +210,62 @@ class AppstreamStack(cfn.NestedStack):
                 statements=[
                     iam.PolicyStatement(
                         effect=iam.Effect.ALLOW,
-                        actions=['sagemaker:ListTags', 'sagemaker:ListNotebookInstances',
+                        actions=['sagemaker:ListTags', 'sagemaker:StartNotebookInstance',
                                  'sagemaker:CreatePresignedDomainUrl', 'sagemaker:CreatePresignedNotebookInstanceUrl'],
                         resources=[
-                            f'arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:notebook-instance/data-sandbox-notebook']
+                            f'arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:notebook-instance/data-sandbox-notebook*']
+                    ),
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=['sagemaker:ListNotebookInstances'],
+                        resources=['*']
+                    ),
+                    # the pool's load is the UrlIssued metric of all broker containers
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=['cloudwatch:GetMetricData'],
+                        resources=['*']
+                    )
+                ]
+            ),
+            'AllowSessionUrlWrite': iam.PolicyDocument(
+                statements=[
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=['ssm:PutParameter'],
+                        resources=[f'arn:aws:ssm:{Aws.REGION}:{Aws.ACCOUNT_ID}:parameter/datasandbox/session-url/*']
+                    )
+                ]
+            ),
+            'AllowDedupTable': iam.PolicyDocument(
+                statements=[
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=['dynamodb:PutItem', 'dynamodb:DeleteItem'],
+                        resources=[dedup_table.table_arn]
                     )
                 ]
             )
         }
 
+        # the Studio domain is looked up by name at runtime, it is created after this stack
+        if sandbox_backend == 'studio':
+            lambda_inline_policy['AllowStudioAccess'] = iam.PolicyDocument(
+                statements=[
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=['sagemaker:CreatePresignedDomainUrl', 'sagemaker:DescribeUserProfile',
+                                 'sagemaker:CreateUserProfile', 'sagemaker:AddTags'],
+                        resources=[f'arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:user-profile/*/*']
+                    ),
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=['sagemaker:ListDomains'],
+                        resources=['*']
+                    )
+                ]
+            )
+
         # Build Lambda Role
         lambda_role = iam.Role(
             self,
@@ -163,31 +282,127 @@ class AppstreamStack(cfn.NestedStack):
 
 
         # Build Lambda Function
+        lambda_timeout_seconds = 60
         data_sandbox_lambda = _lambda.Function(self, 'DataSandboxLambda',
            handler='data_sandbox_lambda.lambda_handler',
            runtime=_lambda.Runtime.PYTHON_3_8,
            code=_lambda.Code.asset(os.path.join(current_dir, '../lambda')),
            role=lambda_role,
            memory_size=256,
-           timeout=core.Duration.seconds(60),
+           timeout=core.Duration.seconds(lambda_timeout_seconds),
            log_retention=logs.RetentionDays.THREE_MONTHS,
-           log_retention_role=lambda_role
+           log_retention_role=lambda_role,
+           environment={
+               'DEDUP_TABLE_NAME': dedup_table.table_name,
+               # a claim left by an invocation that timed out expires before its retry arrives
+               'DEDUP_LEASE_SECONDS': str(lambda_timeout_seconds - 15),
+               'RESPONSE_CHANNELS': 'homefolder,ssm',
+               'NOTEBOOK_INSTANCES': ','.join(notebook_instance_names(notebook_pool_size)),
+               'NOTEBOOK_MAX_USERS_PER_INSTANCE': str(notebook_max_users_per_instance),
+               'SANDBOX_BACKEND': sandbox_backend,
+               'STUDIO_DOMAIN_NAME': studio_domain_name
+           }
            )
 
-        # Grant S3 access to invoke the lambda function
-        data_sandbox_lambda_permissions = _lambda.CfnPermission(self, 'LambdaPermissions',
-            principal='s3.amazonaws.com',
-            action="lambda:InvokeFunction",
-            source_arn=f"arn:aws:s3:::appstream2-36fb080bb8-{Aws.REGION}-{Aws.ACCOUNT_ID}",
-            function_name=data_sandbox_lambda.function_name,
-            source_account=f'{Aws.ACCOUNT_ID}'
-            )
-
-        #put bucket notification on AppStream homefolder
-        
         appstream_homefolder_bucket_array = [f'arn:aws:s3:::appstream2-36fb080bb8-{Aws.REGION}-{Aws.ACCOUNT_ID}']
         appstream_homefolder_bucket_string = f'appstream2-36fb080bb8-{Aws.REGION}-{Aws.ACCOUNT_ID}'
-        
+
+        if broker_queue_enabled:
+            # Buffer home folder notifications in SQS so login storms are absorbed by the queue
+            broker_dead_letter_queue = sqs.Queue(self, 'DataSandboxBrokerDLQ',
+                retention_period=core.Duration.days(14)
+                )
+
+            broker_queue = sqs.Queue(self, 'DataSandboxBrokerQueue',
+                visibility_timeout=core.Duration.seconds(6 * 60),
+                dead_letter_queue=sqs.DeadLetterQueue(
+                    max_receive_count=broker_queue_max_receive_count,
+                    queue=broker_dead_letter_queue)
+                )
+
+            broker_queue.add_to_resource_policy(iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                principals=[iam.ServicePrincipal('s3.amazonaws.com')],
+                actions=['sqs:SendMessage'],
+                resources=[broker_queue.queue_arn],
+                conditions={
+                    'ArnLike': {'aws:SourceArn': appstream_homefolder_bucket_array[0]},
+                    'StringEquals': {'aws:SourceAccount': f'{Aws.ACCOUNT_ID}'}
+                }
+            ))
+
+            broker_queue.grant_consume_messages(lambda_role)
+
+            broker_event_source = _lambda.CfnEventSourceMapping(self, 'DataSandboxBrokerEventSource',
+                event_source_arn=broker_queue.queue_arn,
+                function_name=data_sandbox_lambda.function_name,
+                batch_size=broker_queue_batch_size,
+                maximum_batching_window_in_seconds=broker_queue_batching_window_seconds
+                )
+            # not modelled by the CDK version in use
+            broker_event_source.add_property_override('FunctionResponseTypes', ['ReportBatchItemFailures'])
+            broker_event_source.add_property_override('ScalingConfig.MaximumConcurrency', broker_queue_max_concurrency)
+            broker_event_source.node.add_dependency(lambda_role)
+
+            notification_configuration = {
+                "QueueConfigurations": [
+                    {
+                      "Id": "string",
+                      "QueueArn": f"{broker_queue.queue_arn}",
+                      "Events": ["s3:ObjectCreated:*"],
+                      "Filter": {
+                        "Key": {
+                          "FilterRules": [
+                            {
+                              "Name": "prefix",
+                              "Value": "user/custom/"
+                            },
+                            {
+                              "Name": "suffix",
+                              "Value": "session.json"
+                            }
+                          ]
+                        }
+                      }
+                    }
+                  ]
+            }
+        else:
+            # Grant S3 access to invoke the lambda function
+            data_sandbox_lambda_permissions = _lambda.CfnPermission(self, 'LambdaPermissions',
+                principal='s3.amazonaws.com',
+                action="lambda:InvokeFunction",
+                source_arn=f"arn:aws:s3:::appstream2-36fb080bb8-{Aws.REGION}-{Aws.ACCOUNT_ID}",
+                function_name=data_sandbox_lambda.function_name,
+                source_account=f'{Aws.ACCOUNT_ID}'
+                )
+
+            notification_configuration = {
+                "LambdaFunctionConfigurations": [
+                    {
+                      "Id": "string",
+                      "LambdaFunctionArn":  f"{data_sandbox_lambda.function_arn}",
+                      "Events": ["s3:ObjectCreated:*"],
+                      "Filter": {
+                        "Key": {
+                          "FilterRules": [
+                            {
+                              "Name": "prefix",
+                              "Value": "user/custom/"
+                            },
+                            {
+                              "Name": "suffix",
+                              "Value": "session.json"
+                            }
+                          ]
+                        }
+                      }
+                    }
+                  ]
+            }
+
+        #put bucket notification on AppStream homefolder
+
         s3_event_config_custom_sdk_policy = cr.AwsCustomResourcePolicy.from_statements(statements=[
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
@@ -202,25 +417,7 @@ class AppstreamStack(cfn.NestedStack):
             physical_resource_id=cr.PhysicalResourceId.of(id='s3EventNotification'),
             parameters={
                 "Bucket": appstream_homefolder_bucket_string,
-                "NotificationConfiguration": {
-                    "LambdaFunctionConfigurations": [
-                        {
-                          "Id": "string",
-                          "LambdaFunctionArn":  f"{data_sandbox_lambda.function_arn}",
-                          "Events": ["s3:ObjectCreated:*"],
-                          "Filter": {
-                            "Key": {
-                              "FilterRules": [
-                                {
-                                  "Name": "suffix",
-                                  "Value": ".json"
-                                }
-                              ]
-                            }
-                          }
-                        }
-                      ]
-                }
+                "NotificationConfiguration": notification_configuration
             }
         )
         
@@ -238,11 +435,16 @@ class AppstreamStack(cfn.NestedStack):
         s3_event_custom_sdk_trigger = cr.AwsCustomResource(
             self, 'custom-event-sdk',
             on_create=s3_event_config_custom_sdk_param,
-            on_update=s3_event_config_custom_sdk_delete_param,
+            # switching broker_queue_enabled updates the resource, the new destination must be put
+            on_update=s3_event_config_custom_sdk_param,
             on_delete=s3_event_config_custom_sdk_delete_param,
             policy=s3_event_config_custom_sdk_policy,
             log_retention=logs.RetentionDays.THREE_MONTHS
         )
+
+        if broker_queue_enabled:
+            # S3 validates the destination when the notification is put
+            s3_event_custom_sdk_trigger.node.add_dependency(broker_queue)
         
         #build custom resource to assign IAM role to AppStream fleet
         appstream_fleet_iam_role_assignment_policy = cr.AwsCustomResourcePolicy.from_statements(statements=[
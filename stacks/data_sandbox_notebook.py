@@ -11,11 +11,23 @@ from aws_cdk import (
     aws_cloudformation as cfn
 )
 from aws_cdk.core import Aws
+from stacks.data_sandbox_notebook_lifecycle import NotebookLifecycleConfig
+
+
+def notebook_instance_names(pool_size):
+    """Names of the notebook instance pool, the first keeps the name of the original single instance."""
+    return ['Data-Sandbox-Notebook'] + [f'Data-Sandbox-Notebook-{i}' for i in range(2, pool_size + 1)]
+
 
 class NotebookStack(cfn.NestedStack):
     def __init__(self, scope: core.Construct, id: str, aws_region='', vpc='', s3stack='', appstreamsg='', **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
         
+        #parameters
+        notebook_pool_size = int(self.node.try_get_context("notebook_pool_size") or 1)
+        notebook_instance_type = self.node.try_get_context("notebook_instance_type") or 'ml.t3.medium'
+        notebook_volume_size_gb = int(self.node.try_get_context("notebook_volume_size_gb") or 20)
+
         # build sagemaker notebook
 
         # Create KMS Key to be associated with Sagemaker Notebook
@@ -69,15 +81,26 @@ class NotebookStack(cfn.NestedStack):
         # Grant the notebook role access to the KMS key
         notebook_kms.grant_encrypt_decrypt(notebook_role)
         
-        self.notebook_instance = sagemaker.CfnNotebookInstance(self,
-              id='Data-Sandbox-Notebook',
-              instance_type='ml.t3.medium',
-              role_arn=notebook_role.role_arn,
-              notebook_instance_name='Data-Sandbox-Notebook',
-              kms_key_id=notebook_kms.key_arn,
-              root_access='Disabled',
-              direct_internet_access='Disabled',
-              subnet_id=vpc.select_subnets(subnet_type=ec2.SubnetType.ISOLATED).subnet_ids[0],
-              security_group_ids=[self.notebook_security_group.security_group_id],
-              volume_size_in_gb=20
-              )
\ No newline at end of file
+        # Lifecycle scripts keep the kernel environment cached on the EBS volume,
+        # with packages from a wheelhouse in the data sandbox bucket
+        notebook_lifecycle = NotebookLifecycleConfig(self, 'notebook-lifecycle', package_bucket=s3stack)
+        s3stack.grant_read(notebook_role, f'{notebook_lifecycle.package_prefix}/*')
+
+        # build the notebook instance pool, spread over the isolated subnets
+        isolated_subnet_ids = vpc.select_subnets(subnet_type=ec2.SubnetType.ISOLATED).subnet_ids
+        self.notebook_instances = []
+        for index, notebook_instance_name in enumerate(notebook_instance_names(notebook_pool_size)):
+            self.notebook_instances.append(sagemaker.CfnNotebookInstance(self,
+                  id=notebook_instance_name,
+                  instance_type=notebook_instance_type,
+                  role_arn=notebook_role.role_arn,
+                  notebook_instance_name=notebook_instance_name,
+                  kms_key_id=notebook_kms.key_arn,
+                  root_access='Disabled',
+                  direct_internet_access='Disabled',
+                  subnet_id=isolated_subnet_ids[index % len(isolated_subnet_ids)],
+                  security_group_ids=[self.notebook_security_group.security_group_id],
+                  volume_size_in_gb=notebook_volume_size_gb,
+                  lifecycle_config_name=notebook_lifecycle.lifecycle_config_name
+                  ))
+        self.notebook_instance = self.notebook_instances[0]
@@ -0,0 +1,87 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import os
+from aws_cdk import (
+    core,
+    aws_iam as iam,
+    aws_lambda as _lambda,
+    aws_logs as logs,
+    aws_cloudformation as cfn,
+    aws_events as events,
+    aws_events_targets as targets
+)
+from aws_cdk.core import Aws
+from stacks.data_sandbox_notebook import notebook_instance_names
+
+current_dir = os.path.dirname(__file__)
+
+
+class NotebookIdleStopStack(cfn.NestedStack):
+    def __init__(self, scope: core.Construct, id: str, aws_region='', **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        #parameters
+        notebook_pool_size = int(self.node.try_get_context("notebook_pool_size") or 1)
+        notebook_idle_stop_schedule_minutes = int(self.node.try_get_context("notebook_idle_stop_schedule_minutes") or 15)
+        notebook_idle_stop_dry_run = str(self.node.try_get_context("notebook_idle_stop_dry_run")).lower() == 'true'
+        notebook_warm_window_minutes = int(self.node.try_get_context("notebook_warm_window_minutes") or 60)
+        notebook_keep_warm_hours_utc = self.node.try_get_context("notebook_keep_warm_hours_utc") or ''
+        notebook_keep_warm_days = self.node.try_get_context("notebook_keep_warm_days") or ['MON', 'TUE', 'WED', 'THU', 'FRI']
+
+        # Define Lambda Function Policy
+
+        lambda_inline_policy = {
+            'AllowNotebookIdleStop': iam.PolicyDocument(
+                statements=[
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=['sagemaker:StopNotebookInstance'],
+                        resources=[f'arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:notebook-instance/data-sandbox-notebook*']
+                    ),
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=['sagemaker:ListNotebookInstances','cloudwatch:GetMetricStatistics'],
+                        resources=['*']
+                    )
+                ]
+            )
+        }
+
+        # Build Lambda Role
+        lambda_role = iam.Role(
+            self,
+            id='lambda-role',
+            description='Notebook idle stop lambda',
+            max_session_duration=core.Duration.seconds(3600),
+            assumed_by=iam.ServicePrincipal('lambda.amazonaws.com'),
+            managed_policies=[iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")],
+            inline_policies=lambda_inline_policy
+            )
+
+        # Build Lambda Function
+        notebook_idle_stop_lambda = _lambda.Function(self, 'NotebookIdleStop',
+           handler='notebook_idle_stop_lambda.lambda_handler',
+           runtime=_lambda.Runtime.PYTHON_3_8,
+           code=_lambda.Code.asset(os.path.join(current_dir, '../lambda')),
+           role=lambda_role,
+           memory_size=256,
+           timeout=core.Duration.seconds(60),
+           reserved_concurrent_executions=1,
+           log_retention=logs.RetentionDays.THREE_MONTHS,
+           environment={
+               'NOTEBOOK_INSTANCES': ','.join(notebook_instance_names(notebook_pool_size)),
+               'DRY_RUN': str(notebook_idle_stop_dry_run).lower(),
+               'WARM_WINDOW_MINUTES': str(notebook_warm_window_minutes),
+               'KEEP_WARM_HOURS_UTC': notebook_keep_warm_hours_utc,
+               'KEEP_WARM_DAYS': ','.join(notebook_keep_warm_days),
+               'METRICS_NAMESPACE': 'DataSandbox/Notebook'
+           }
+           )
+
+        # Stop idle notebook instances on a schedule, the broker starts them again on demand
+        notebook_idle_stop_rule = events.Rule(self, 'NotebookIdleStopSchedule',
+            description='Stop notebook instances that issued no URL within the warm window',
+            schedule=events.Schedule.rate(core.Duration.minutes(notebook_idle_stop_schedule_minutes))
+            )
+        notebook_idle_stop_rule.add_target(targets.LambdaFunction(notebook_idle_stop_lambda))
@@ -0,0 +1,36 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import os
+from aws_cdk import (
+    core,
+    aws_sagemaker as sagemaker
+)
+
+current_dir = os.path.dirname(__file__)
+
+
+class NotebookLifecycleConfig(core.Construct):
+    """Lifecycle scripts that build and reuse a conda/pip environment cache on the notebook's EBS volume.
+
+    The scripts are read from notebook_scripts/ and install packages from
+    s3://<package_bucket>/<package_prefix>/, see on-start.sh.
+    """
+
+    def __init__(self, scope: core.Construct, id: str, package_bucket='', package_prefix='notebook-packages', **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        def lifecycle_hook(script_name):
+            with open(os.path.join(current_dir, '../notebook_scripts', script_name)) as f:
+                content = f.read()
+            content = content.replace('__PACKAGE_BUCKET__', package_bucket.bucket_name).replace('__PACKAGE_PREFIX__', package_prefix)
+            return [sagemaker.CfnNotebookInstanceLifecycleConfig.NotebookInstanceLifecycleHookProperty(
+                content=core.Fn.base64(content))]
+
+        self.lifecycle_config = sagemaker.CfnNotebookInstanceLifecycleConfig(self, 'NotebookLifecycleConfig',
+            notebook_instance_lifecycle_config_name='data-sandbox-notebook-lifecycle',
+            on_create=lifecycle_hook('on-create.sh'),
+            on_start=lifecycle_hook('on-start.sh')
+            )
+        self.lifecycle_config_name = self.lifecycle_config.attr_notebook_instance_lifecycle_config_name
+        self.package_prefix = package_prefix
@@ -3,6 +3,7 @@
 
 import os
 import json
+import hashlib
 from aws_cdk import (
     core,
     aws_ssm as ssm,
@@ -13,6 +14,18 @@ from aws_cdk import (
 from aws_cdk.core import Aws
 
 current_dir = os.path.dirname(__file__)
+appstream_scripts_dir = os.path.join(current_dir, '../appstream_scripts/')
+notebook_lib_dir = os.path.join(current_dir, '../notebook_lib/')
+
+
+def hash_scripts(scripts_dir):
+    # sha256 of every script, plus one digest over all of them that names the version
+    script_hashes = {}
+    for name in sorted(os.listdir(scripts_dir)):
+        with open(os.path.join(scripts_dir, name), 'rb') as f:
+            script_hashes[name] = hashlib.sha256(f.read()).hexdigest()
+    version = hashlib.sha256(json.dumps(script_hashes, sort_keys=True).encode()).hexdigest()[:16]
+    return version, script_hashes
 
 
 class S3Stack(cfn.NestedStack):
@@ -30,14 +43,41 @@ class S3Stack(cfn.NestedStack):
 
         deploy_appstream_scripts = s3_deployment.BucketDeployment(
             self, 'AppstreamScriptsDeployment',
-            sources=[s3_deployment.Source.asset(os.path.join(current_dir, '../appstream_scripts/'))],
+            sources=[s3_deployment.Source.asset(appstream_scripts_dir)],
             destination_bucket=self.data_sandbox_bucket,
             destination_key_prefix='appstream-scripts'
         )
+
+        # Upload the same scripts under a content addressed prefix, so a launcher that
+        # already has this version cached can skip the download
+        scripts_version, script_hashes = hash_scripts(appstream_scripts_dir)
+        scripts_prefix = f'appstream-scripts-versions/{scripts_version}'
+
+        deploy_versioned_appstream_scripts = s3_deployment.BucketDeployment(
+            self, 'AppstreamScriptsVersionedDeployment',
+            sources=[s3_deployment.Source.asset(appstream_scripts_dir)],
+            destination_bucket=self.data_sandbox_bucket,
+            destination_key_prefix=scripts_prefix,
+            prune=False
+        )
+
+        # Upload the notebook libraries next to the wheelhouse, the notebook lifecycle
+        # scripts sync them and put them on the path of the Data Sandbox kernel
+        deploy_notebook_lib = s3_deployment.BucketDeployment(
+            self, 'NotebookLibDeployment',
+            sources=[s3_deployment.Source.asset(notebook_lib_dir)],
+            destination_bucket=self.data_sandbox_bucket,
+            destination_key_prefix='notebook-packages/lib'
+        )
         
         # build ssm parameters
-        ssm.StringParameter(self, 'BucketParam',
+        bucket_param = ssm.StringParameter(self, 'BucketParam',
             parameter_name='/s3/datasandboxbucket',
             string_value=json.dumps({
-                "bucket-name": [f'{self.data_sandbox_bucket.bucket_name}']
-            }))
\ No newline at end of file
+                "bucket-name": [f'{self.data_sandbox_bucket.bucket_name}'],
+                "scripts-version": scripts_version,
+                "scripts-prefix": scripts_prefix,
+                "scripts": script_hashes
+            }))
+        # launchers download the advertised prefix, it must be uploaded before the parameter changes
+        bucket_param.node.add_dependency(deploy_versioned_appstream_scripts)
@@ -31,7 +31,10 @@ class AppstreamServiceRolesStack(cfn.NestedStack):
                     iam.PolicyStatement(
                         effect=iam.Effect.ALLOW,
                         actions=[
+                            'iam:GetRole',
+                            'iam:ListAttachedRolePolicies',
                             'iam:CreateRole',
+                            'iam:UpdateAssumeRolePolicy',
                             'iam:AttachRolePolicy'
                         ],
                         resources=[f"arn:aws:iam::{Aws.ACCOUNT_ID}:role/service-role/AmazonAppStreamServiceAccess",f"arn:aws:iam::{Aws.ACCOUNT_ID}:role/service-role/ApplicationAutoScalingForAmazonAppStreamAccess"]
@@ -54,36 +57,25 @@ class AppstreamServiceRolesStack(cfn.NestedStack):
 
         # Build Lambda Function
         appstream_service_roles_lambda = _lambda.Function(self, 'AppStreamServiceRoles',
-           handler='appstream_service_roles_lambda.lambda_handler',
+           handler='appstream_service_roles_lambda.on_event',
            runtime=_lambda.Runtime.PYTHON_3_8,
            code=_lambda.Code.asset(os.path.join(current_dir, '../lambda')),
            role=lambda_role,
            memory_size=256,
-           timeout=core.Duration.seconds(60)
+           timeout=core.Duration.seconds(60),
+           log_retention=logs.RetentionDays.THREE_MONTHS
            )
 
-        #build custom resource to start appstream fleet
-        appstream_deploy_service_roles_policy = cr.AwsCustomResourcePolicy.from_statements(statements=[
-            iam.PolicyStatement(
-                effect=iam.Effect.ALLOW,
-                actions=['lambda:InvokeFunction'],
-                resources=[appstream_service_roles_lambda.function_arn]
-            )
-        ])
+        #build custom resource to create the appstream service roles, a failed reconcile fails the stack
+        appstream_service_roles_provider = cr.Provider(
+            self, 'appstream-service-roles-provider',
+            on_event_handler=appstream_service_roles_lambda
+        )
 
-        appstream_deploy_service_roles_create = cr.AwsSdkCall(
-            action='invoke',
-            service='Lambda',
-            physical_resource_id=cr.PhysicalResourceId.of(id='AppStreamServiceRolesCreate'),
-            parameters={
-                "FunctionName": appstream_service_roles_lambda.function_arn
+        appstream_deploy_service_roles_trigger = core.CustomResource(
+            self, 'appstream-service-roles',
+            service_token=appstream_service_roles_provider.service_token,
+            properties={
+                "RoleNames": ['AmazonAppStreamServiceAccess', 'ApplicationAutoScalingForAmazonAppStreamAccess']
             }
         )
-        
-
-        appstream_deploy_service_roles_trigger = cr.AwsCustomResource(
-            self, 'appstream-service-role',
-            on_create=appstream_deploy_service_roles_create,
-            policy=appstream_deploy_service_roles_policy,
-            log_retention=logs.RetentionDays.THREE_MONTHS
-        )
\ No newline at end of file
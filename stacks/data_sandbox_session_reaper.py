@@ -0,0 +1,101 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import os
+from aws_cdk import (
+    core,
+    aws_iam as iam,
+    aws_lambda as _lambda,
+    aws_logs as logs,
+    aws_cloudformation as cfn,
+    aws_dynamodb as dynamodb,
+    aws_events as events,
+    aws_events_targets as targets
+)
+
+current_dir = os.path.dirname(__file__)
+
+
+class AppstreamSessionReaperStack(cfn.NestedStack):
+    def __init__(self, scope: core.Construct, id: str, aws_region='', **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        #parameters
+        appstream_environment_name = self.node.try_get_context("appstream_environment_name")
+        session_reaper_schedule_minutes = int(self.node.try_get_context("session_reaper_schedule_minutes") or 15)
+        session_reaper_dry_run = str(self.node.try_get_context("session_reaper_dry_run")).lower() != 'false'
+        # 0 disables the idle rule, so only a missing key falls back to the default
+        session_reaper_max_disconnected_minutes = self.node.try_get_context("session_reaper_max_disconnected_minutes")
+        session_reaper_max_disconnected_minutes = 60 if session_reaper_max_disconnected_minutes is None else int(session_reaper_max_disconnected_minutes)
+        session_reaper_max_session_hours = int(self.node.try_get_context("session_reaper_max_session_hours") or 0)
+        session_reaper_when_available_below = int(self.node.try_get_context("session_reaper_when_available_below") or 0)
+        session_reaper_exempt_users = self.node.try_get_context("session_reaper_exempt_users") or []
+
+        # First sighting of each disconnected session, kept between runs
+        reaper_state_table = dynamodb.Table(self, 'SessionReaperStateTable',
+            partition_key=dynamodb.Attribute(name='pk', type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute='expiresAt',
+            removal_policy=core.RemovalPolicy.DESTROY
+            )
+
+        # Define Lambda Function Policy
+
+        lambda_inline_policy = {
+            'AllowSessionReaping': iam.PolicyDocument(
+                statements=[
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=['appstream:DescribeSessions','appstream:DescribeFleets','appstream:ExpireSession'],
+                        resources=['*']
+                    ),
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=['dynamodb:BatchGetItem','dynamodb:BatchWriteItem'],
+                        resources=[reaper_state_table.table_arn]
+                    )
+                ]
+            )
+        }
+
+        # Build Lambda Role
+        lambda_role = iam.Role(
+            self,
+            id='lambda-role',
+            description='AppStream session reaper lambda',
+            max_session_duration=core.Duration.seconds(3600),
+            assumed_by=iam.ServicePrincipal('lambda.amazonaws.com'),
+            managed_policies=[iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")],
+            inline_policies=lambda_inline_policy
+            )
+
+        # Build Lambda Function
+        session_reaper_lambda = _lambda.Function(self, 'AppStreamSessionReaper',
+           handler='appstream_session_reaper_lambda.lambda_handler',
+           runtime=_lambda.Runtime.PYTHON_3_8,
+           code=_lambda.Code.asset(os.path.join(current_dir, '../lambda')),
+           role=lambda_role,
+           memory_size=256,
+           timeout=core.Duration.seconds(300),
+           reserved_concurrent_executions=1,
+           log_retention=logs.RetentionDays.THREE_MONTHS,
+           environment={
+               'STACK_NAME': f'{appstream_environment_name}-stack',
+               'FLEET_NAME': f'{appstream_environment_name}-fleet',
+               'STATE_TABLE_NAME': reaper_state_table.table_name,
+               'SCHEDULE_MINUTES': str(session_reaper_schedule_minutes),
+               'DRY_RUN': str(session_reaper_dry_run).lower(),
+               'MAX_DISCONNECTED_MINUTES': str(session_reaper_max_disconnected_minutes),
+               'MAX_SESSION_HOURS': str(session_reaper_max_session_hours),
+               'REAP_WHEN_AVAILABLE_BELOW': str(session_reaper_when_available_below),
+               'EXEMPT_USERS': ','.join(session_reaper_exempt_users),
+               'METRICS_NAMESPACE': 'DataSandbox/Fleet'
+           }
+           )
+
+        # Run the reaper on a schedule, one run at a time
+        session_reaper_rule = events.Rule(self, 'SessionReaperSchedule',
+            description='Expire idle and over-age AppStream sessions',
+            schedule=events.Schedule.rate(core.Duration.minutes(session_reaper_schedule_minutes))
+            )
+        session_reaper_rule.add_target(targets.LambdaFunction(session_reaper_lambda))
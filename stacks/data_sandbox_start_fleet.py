@@ -23,29 +23,82 @@ class AppstreamStartFleetStack(cfn.NestedStack):
         
         #parameters
         appstream_environment_name = self.node.try_get_context("appstream_environment_name")
+        appstream_fleet_ready_timeout_minutes = int(self.node.try_get_context("appstream_fleet_ready_timeout_minutes") or 30)
         
-        #build custom resource to start appstream fleet
-        appstream_fleet_start_policy = cr.AwsCustomResourcePolicy.from_statements(statements=[
-            iam.PolicyStatement(
-                effect=iam.Effect.ALLOW,
-                actions=['appstream:StopFleet','appstream:StartFleet'],
-                resources=[f'arn:aws:appstream:{Aws.REGION}:{Aws.ACCOUNT_ID}:fleet/{appstream_environment_name}-fleet',f'{appstreamrole.role_arn}']
+        # Build Lambda Function Resources
+
+        # Define Lambda Function Policy
+
+        lambda_inline_policy = {
+            'AllowFleetStart': iam.PolicyDocument(
+                statements=[
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=['appstream:StartFleet'],
+                        resources=[f'arn:aws:appstream:{Aws.REGION}:{Aws.ACCOUNT_ID}:fleet/{appstream_environment_name}-fleet',f'{appstreamrole.role_arn}']
+                    ),
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=['appstream:DescribeFleets'],
+                        resources=['*']
+                    )
+                ]
+            )
+        }
+
+        # Build Lambda Role
+        lambda_role = iam.Role(
+            self,
+            id='lambda-role',
+            description='AppStream start fleet lambda',
+            max_session_duration=core.Duration.seconds(3600),
+            assumed_by=iam.ServicePrincipal('lambda.amazonaws.com'),
+            managed_policies=[iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")],
+            inline_policies=lambda_inline_policy
             )
-        ])
-
-        appstream_fleet_start_create = cr.AwsSdkCall(
-            action='startFleet',
-            service='AppStream',
-            physical_resource_id=cr.PhysicalResourceId.of(id='AppStreamFeeltIAMRoleAssignementCreate'),
-            parameters={
-                "Name": f'{appstream_environment_name}-fleet'
+
+        # Build Lambda Functions, one starts the fleet and one waits until it is ready
+        start_fleet_lambda = _lambda.Function(self, 'AppStreamStartFleet',
+           handler='appstream_start_fleet_lambda.on_event',
+           runtime=_lambda.Runtime.PYTHON_3_8,
+           code=_lambda.Code.asset(os.path.join(current_dir, '../lambda')),
+           role=lambda_role,
+           memory_size=256,
+           timeout=core.Duration.seconds(60),
+           log_retention=logs.RetentionDays.THREE_MONTHS
+           )
+
+        fleet_ready_lambda = _lambda.Function(self, 'AppStreamFleetReady',
+           handler='appstream_start_fleet_lambda.is_complete',
+           runtime=_lambda.Runtime.PYTHON_3_8,
+           code=_lambda.Code.asset(os.path.join(current_dir, '../lambda')),
+           role=lambda_role,
+           memory_size=256,
+           timeout=core.Duration.seconds(60),
+           log_retention=logs.RetentionDays.THREE_MONTHS,
+           environment={
+               'METRICS_NAMESPACE': 'DataSandbox/Fleet'
+           }
+           )
+
+        #build custom resource to start appstream fleet and wait until it is ready
+        appstream_fleet_start_provider = cr.Provider(
+            self, 'appstream-start-fleet-provider',
+            on_event_handler=start_fleet_lambda,
+            is_complete_handler=fleet_ready_lambda,
+            query_interval=core.Duration.seconds(30),
+            total_timeout=core.Duration.minutes(appstream_fleet_ready_timeout_minutes)
+        )
+
+        appstream_fleet_start_trigger = core.CustomResource(
+            self, 'appstream-start-fleet-ready',
+            service_token=appstream_fleet_start_provider.service_token,
+            properties={
+                "FleetName": f'{appstream_environment_name}-fleet'
             }
         )
-        
 
-        appstream_fleet_start_trigger = cr.AwsCustomResource(
-            self, 'appstream-start-fleet',
-            on_create=appstream_fleet_start_create,
-            policy=appstream_fleet_start_policy,
-            log_retention=logs.RetentionDays.THREE_MONTHS
-        )
\ No newline at end of file
+        core.CfnOutput(self, 'FleetTimeToReadySeconds',
+            description='Seconds from startFleet until the fleet was RUNNING with its desired capacity',
+            value=appstream_fleet_start_trigger.get_att_string('TimeToReadySeconds')
+        )
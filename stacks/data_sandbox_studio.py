@@ -0,0 +1,105 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+from aws_cdk import (
+    aws_ec2 as ec2,
+    core,
+    aws_iam as iam,
+    aws_cloudformation as cfn
+)
+from aws_cdk.core import Aws
+
+
+class StudioStack(cfn.NestedStack):
+    """SageMaker Studio domain in the isolated VPC, the alternative to the notebook instance pool.
+
+    The broker creates a user profile per user in the domain and finds the domain
+    by its name, see notebook_backends.StudioBackend.
+    """
+
+    def __init__(self, scope: core.Construct, id: str, aws_region='', vpc='', s3stack='', appstreamsg='', **kwargs) -> None:
+        super().__init__(scope, id, **kwargs)
+
+        #parameters
+        studio_domain_name = self.node.try_get_context("studio_domain_name") or 'data-sandbox-studio'
+
+        # build security group, shared by the Studio apps and the domain's EFS volume
+        self.studio_security_group = ec2.SecurityGroup(
+            self, 'StudioSecurityGroup',
+            vpc=vpc,
+            security_group_name='studio-sg'
+        )
+
+        self.studio_security_group.add_ingress_rule(
+            peer=appstreamsg,
+            connection=ec2.Port.tcp(443),
+            description='Allow 443 ingress for Appstream instances'
+        )
+
+        self.studio_security_group.add_ingress_rule(
+            peer=self.studio_security_group,
+            connection=ec2.Port.all_tcp(),
+            description='Allow traffic between Studio apps and the home EFS volume'
+        )
+
+        # Build VPC endpoints, a VpcOnly domain reaches SageMaker and serves the Studio UI through them
+        studio_endpoint_services = {
+            'sagemaker-api-endpoint': ec2.InterfaceVpcEndpointAwsService.SAGEMAKER_API,
+            'sagemaker-runtime-endpoint': ec2.InterfaceVpcEndpointAwsService.SAGEMAKER_RUNTIME,
+            'studio-endpoint': ec2.InterfaceVpcEndpointService(f'aws.sagemaker.{Aws.REGION}.studio', 443),
+            'sts-endpoint': ec2.InterfaceVpcEndpointAwsService.STS
+        }
+        for endpoint_id, endpoint_service in studio_endpoint_services.items():
+            ec2.InterfaceVpcEndpoint(self, endpoint_id,
+                vpc=vpc,
+                service=endpoint_service,
+                private_dns_enabled=True,
+                security_groups=[self.studio_security_group]
+                )
+
+        # Create execution role of the Studio apps
+        studio_role = iam.Role(
+            self, 'studio_role',
+            description='Studio Execution Role',
+            assumed_by=iam.ServicePrincipal('sagemaker.amazonaws.com'),
+            inline_policies={
+                'AllowStudioApps': iam.PolicyDocument(
+                    statements=[
+                        iam.PolicyStatement(
+                            effect=iam.Effect.ALLOW,
+                            actions=['sagemaker:CreateApp', 'sagemaker:DeleteApp', 'sagemaker:DescribeApp',
+                                     'sagemaker:DescribeDomain', 'sagemaker:DescribeUserProfile'],
+                            resources=[f'arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:domain/*',
+                                       f'arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:user-profile/*/*',
+                                       f'arn:aws:sagemaker:{Aws.REGION}:{Aws.ACCOUNT_ID}:app/*']
+                        ),
+                        iam.PolicyStatement(
+                            effect=iam.Effect.ALLOW,
+                            actions=['sagemaker:ListApps'],
+                            resources=['*']
+                        )
+                    ]
+                )
+            }
+        )
+        s3stack.grant_read(studio_role, 'notebook-packages/*')
+
+        # build the domain, aws_sagemaker has no construct for AWS::SageMaker::Domain in this CDK version
+        isolated_subnet_ids = vpc.select_subnets(subnet_type=ec2.SubnetType.ISOLATED).subnet_ids
+        self.studio_domain = core.CfnResource(self, 'StudioDomain',
+            type='AWS::SageMaker::Domain',
+            properties={
+                'DomainName': studio_domain_name,
+                'AuthMode': 'IAM',
+                'AppNetworkAccessType': 'VpcOnly',
+                'VpcId': vpc.vpc_id,
+                'SubnetIds': isolated_subnet_ids,
+                'DefaultUserSettings': {
+                    'ExecutionRole': studio_role.role_arn,
+                    'SecurityGroups': [self.studio_security_group.security_group_id]
+                }
+            }
+            )
+        self.studio_domain_name = studio_domain_name
+
+        core.CfnOutput(self, 'StudioDomainId', value=self.studio_domain.get_att('DomainId').to_string())
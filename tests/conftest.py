@@ -0,0 +1,52 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# the Lambda modules import each other by their flat names, as in the deployment package
+sys.path.insert(0, os.path.join(REPO_DIR, 'lambda'))
+
+
+def synth_app(outdir, **context_overrides):
+    """Synthesize app.py with the cdk.json context plus context_overrides.
+
+    Returns the templates of the nested stacks by their id without dashes,
+    e.g. 'appstreamstack', and the parent template as 'DataSandbox'.
+    """
+    with open(os.path.join(REPO_DIR, 'cdk.json')) as f:
+        context = json.load(f)['context']
+    context.update(context_overrides)
+    env = dict(os.environ,
+               CDK_CONTEXT_JSON=json.dumps(context),
+               CDK_OUTDIR=str(outdir),
+               CDK_DEFAULT_ACCOUNT='123456789012',
+               CDK_DEFAULT_REGION='us-east-1',
+               JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION='1')
+    subprocess.run([sys.executable, 'app.py'], cwd=REPO_DIR, env=env, check=True, capture_output=True)
+
+    templates = {}
+    for path in glob.glob(os.path.join(str(outdir), '*.template.json')):
+        name = os.path.basename(path).split('.')[0]
+        # DataSandbox<nested stack id><8 hex digits>
+        match = re.fullmatch(r'DataSandbox(\w+)[0-9A-F]{8}', name)
+        with open(path) as f:
+            templates[match.group(1) if match else name] = json.load(f)
+    return templates
+
+
+def resources(template, resource_type):
+    return {logical_id: resource for logical_id, resource in template['Resources'].items()
+            if resource['Type'] == resource_type}
+
+
+@pytest.fixture(scope='session')
+def default_templates(tmp_path_factory):
+    return synth_app(tmp_path_factory.mktemp('cdk.out'))
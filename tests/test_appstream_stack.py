@@ -0,0 +1,92 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import pytest
+
+pytest.importorskip('aws_cdk.core')
+
+from conftest import resources, synth_app  # noqa: E402
+
+SESSION_REQUEST_FILTER = {'Key': {'FilterRules': [{'Name': 'prefix', 'Value': 'user/custom/'},
+                                                  {'Name': 'suffix', 'Value': 'session.json'}]}}
+
+
+@pytest.fixture(scope='module')
+def queue_template(tmp_path_factory):
+    templates = synth_app(tmp_path_factory.mktemp('cdk.out'),
+                          broker_queue_enabled='true',
+                          broker_queue_batch_size=25,
+                          broker_queue_batching_window_seconds=2,
+                          broker_queue_max_concurrency=7,
+                          broker_queue_max_receive_count=4)
+    return templates['appstreamstack']
+
+
+def logical_id(template, resource_type, name_part):
+    return next(logical_id for logical_id in resources(template, resource_type) if name_part in logical_id)
+
+
+def home_folder_notification(template):
+    trigger = next(r for r in resources(template, 'Custom::AWS').values()
+                   if r['Properties']['Create']['action'] == 'putBucketNotificationConfiguration')
+    return trigger['Properties']
+
+
+def test_queue_redrives_to_the_dead_letter_queue(queue_template):
+    queues = resources(queue_template, 'AWS::SQS::Queue')
+    assert len(queues) == 2
+    dlq_id = logical_id(queue_template, 'AWS::SQS::Queue', 'DLQ')
+    queue = queues[logical_id(queue_template, 'AWS::SQS::Queue', 'BrokerQueue')]['Properties']
+    assert queue['VisibilityTimeout'] == 360
+    assert queue['RedrivePolicy'] == {'deadLetterTargetArn': {'Fn::GetAtt': [dlq_id, 'Arn']}, 'maxReceiveCount': 4}
+    assert queues[dlq_id]['Properties']['MessageRetentionPeriod'] == 14 * 24 * 3600
+
+
+def test_event_source_mapping_reports_batch_item_failures(queue_template):
+    mappings = resources(queue_template, 'AWS::Lambda::EventSourceMapping')
+    assert len(mappings) == 1
+    mapping = next(iter(mappings.values()))['Properties']
+    assert mapping['BatchSize'] == 25
+    assert mapping['MaximumBatchingWindowInSeconds'] == 2
+    assert mapping['FunctionResponseTypes'] == ['ReportBatchItemFailures']
+    assert mapping['ScalingConfig'] == {'MaximumConcurrency': 7}
+    queue_id = logical_id(queue_template, 'AWS::SQS::Queue', 'BrokerQueue')
+    assert mapping['EventSourceArn'] == {'Fn::GetAtt': [queue_id, 'Arn']}
+
+
+def test_home_folder_notifies_the_queue_for_session_requests_only(queue_template):
+    trigger = home_folder_notification(queue_template)
+    queue_id = logical_id(queue_template, 'AWS::SQS::Queue', 'BrokerQueue')
+    for request in ('Create', 'Update'):
+        configuration = trigger[request]['parameters']['NotificationConfiguration']
+        assert 'LambdaFunctionConfigurations' not in configuration
+        [queue_configuration] = configuration['QueueConfigurations']
+        assert queue_configuration['QueueArn'] == {'Fn::GetAtt': [queue_id, 'Arn']}
+        assert queue_configuration['Events'] == ['s3:ObjectCreated:*']
+        assert queue_configuration['Filter'] == SESSION_REQUEST_FILTER
+    assert trigger['Delete']['parameters']['NotificationConfiguration'] == {}
+    # S3 only accepts a queue whose policy lets the bucket send to it
+    [policy] = resources(queue_template, 'AWS::SQS::QueuePolicy').values()
+    [statement] = policy['Properties']['PolicyDocument']['Statement']
+    assert statement['Principal'] == {'Service': 's3.amazonaws.com'}
+    assert statement['Action'] == 'sqs:SendMessage'
+
+
+def test_without_the_queue_the_home_folder_invokes_the_lambda(default_templates):
+    template = default_templates['appstreamstack']
+    assert not resources(template, 'AWS::SQS::Queue')
+    assert not resources(template, 'AWS::Lambda::EventSourceMapping')
+    configuration = home_folder_notification(template)['Create']['parameters']['NotificationConfiguration']
+    [lambda_configuration] = configuration['LambdaFunctionConfigurations']
+    assert lambda_configuration['Filter'] == SESSION_REQUEST_FILTER
+
+
+def test_fleet_role_only_reaches_its_own_parameters(default_templates):
+    template = default_templates['appstreamstack']
+    [role] = [r for logical_id, r in resources(template, 'AWS::IAM::Role').items() if logical_id.startswith('appstreamrole')]
+    for policy in role['Properties']['Policies']:
+        for statement in policy['PolicyDocument']['Statement']:
+            actions = statement['Action'] if isinstance(statement['Action'], list) else [statement['Action']]
+            if any(action.startswith('ssm:') for action in actions):
+                resource = statement['Resource']['Fn::Join'][1][-1]
+                assert resource in (':parameter/s3/datasandboxbucket', ':parameter/datasandbox/session-url/*')
@@ -0,0 +1,141 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import threading
+
+import pytest
+
+import dedup
+from dedup import EventDeduplicator, FileDedupStore, dedup_key
+
+
+class FakeTime:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+class FailingStore:
+    def __init__(self):
+        self.fail_put = True
+        self.fail_extend = True
+
+    def put_if_absent(self, key, ttl_seconds):
+        if self.fail_put:
+            raise ConnectionError('throttled')
+        return True
+
+    def extend(self, key, ttl_seconds):
+        if self.fail_extend:
+            raise ConnectionError('throttled')
+
+    def delete(self, key):
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(dedup, 'time', fake)
+    return fake
+
+
+def new_deduplicator(store, clock, window_seconds=600, lease_seconds=45):
+    deduplicator = EventDeduplicator(store, window_seconds=window_seconds, lease_seconds=lease_seconds)
+    deduplicator.window.clock = clock.monotonic
+    return deduplicator
+
+
+def test_dedup_key_identifies_the_object_version():
+    record = {'s3': {'bucket': {'name': 'home'},
+                     'object': {'key': 'user/custom/abc/session+request.json', 'sequencer': '0A'}}}
+    assert dedup_key(record) == 'home/user/custom/abc/session request.json@0A'
+
+
+def test_duplicate_inside_the_window_is_dropped(tmp_path, clock):
+    store = FileDedupStore(str(tmp_path))
+    first = new_deduplicator(store, clock)
+    assert first.claim('event')
+    first.complete('event')
+    clock.now += 500
+    assert not first.claim('event')
+    # another container only has the shared store
+    assert not new_deduplicator(store, clock).claim('event')
+    assert first.duplicates == 1
+
+
+def test_lease_expires_before_a_retry(tmp_path, clock):
+    store = FileDedupStore(str(tmp_path))
+    crashed = new_deduplicator(store, clock, lease_seconds=45)
+    assert crashed.claim('event')
+    # the invocation timed out without complete() or release()
+    clock.now += 30
+    assert not new_deduplicator(store, clock).claim('event')
+    clock.now += 20
+    assert crashed.claim('event')
+    assert new_deduplicator(store, clock).claim('other-event')
+
+
+def test_release_lets_a_failed_event_be_retried(tmp_path, clock):
+    store = FileDedupStore(str(tmp_path))
+    deduplicator = new_deduplicator(store, clock)
+    assert deduplicator.claim('event')
+    deduplicator.release('event')
+    assert deduplicator.claim('event')
+    deduplicator.release('event')
+    assert new_deduplicator(store, clock).claim('event')
+
+
+def test_complete_extends_the_lease_to_the_window(tmp_path, clock):
+    store = FileDedupStore(str(tmp_path))
+    deduplicator = new_deduplicator(store, clock, window_seconds=600, lease_seconds=45)
+    assert deduplicator.claim('event')
+    deduplicator.complete('event')
+    clock.now += 300
+    assert not deduplicator.claim('event')
+    assert not new_deduplicator(store, clock).claim('event')
+    clock.now += 301
+    assert new_deduplicator(store, clock).claim('event')
+
+
+def test_concurrent_claims_of_the_same_key_admit_one(tmp_path, clock):
+    store = FileDedupStore(str(tmp_path))
+    containers = [new_deduplicator(store, clock) for _ in range(2)]
+    claimers = containers * 4
+    barrier = threading.Barrier(len(claimers))
+    results = []
+
+    def claim(deduplicator):
+        barrier.wait()
+        results.append(deduplicator.claim('event'))
+
+    threads = [threading.Thread(target=claim, args=(d,)) for d in claimers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [False] * 7 + [True]
+
+
+def test_store_error_on_claim_does_not_block_the_retry(clock):
+    store = FailingStore()
+    deduplicator = new_deduplicator(store, clock)
+    with pytest.raises(ConnectionError):
+        deduplicator.claim('event')
+    store.fail_put = False
+    assert deduplicator.claim('event')
+
+
+def test_store_error_on_complete_keeps_the_delivery(clock, capsys):
+    store = FailingStore()
+    store.fail_put = False
+    deduplicator = new_deduplicator(store, clock)
+    assert deduplicator.claim('event')
+    deduplicator.complete('event')
+    assert 'extend failed' in capsys.readouterr().out
+    assert not deduplicator.claim('event')
@@ -0,0 +1,53 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import json
+
+import pytest
+
+pytest.importorskip('aws_cdk.core')
+
+from conftest import resources, synth_app  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def notebook_template(tmp_path_factory):
+    templates = synth_app(tmp_path_factory.mktemp('cdk.out'),
+                          notebook_pool_size=3,
+                          notebook_instance_type='ml.m5.xlarge',
+                          notebook_volume_size_gb=50)
+    return templates['notebookstack']
+
+
+def lifecycle_config(template):
+    [(logical_id, config)] = resources(template, 'AWS::SageMaker::NotebookInstanceLifecycleConfig').items()
+    return logical_id, config['Properties']
+
+
+def test_every_pool_instance_uses_the_lifecycle_config(notebook_template):
+    lifecycle_id, _ = lifecycle_config(notebook_template)
+    instances = resources(notebook_template, 'AWS::SageMaker::NotebookInstance')
+    assert sorted(i['Properties']['NotebookInstanceName'] for i in instances.values()) == \
+        ['Data-Sandbox-Notebook', 'Data-Sandbox-Notebook-2', 'Data-Sandbox-Notebook-3']
+    for instance in instances.values():
+        properties = instance['Properties']
+        assert properties['LifecycleConfigName'] == {
+            'Fn::GetAtt': [lifecycle_id, 'NotebookInstanceLifecycleConfigName']}
+        assert properties['InstanceType'] == 'ml.m5.xlarge'
+        assert properties['VolumeSizeInGB'] == 50
+    # one isolated subnet each
+    assert len({json.dumps(i['Properties']['SubnetId']) for i in instances.values()}) == 3
+
+
+def test_lifecycle_scripts_point_at_the_package_bucket(notebook_template):
+    _, properties = lifecycle_config(notebook_template)
+    [on_start] = properties['OnStart']
+    content = json.dumps(on_start['Content'])
+    assert '__PACKAGE_BUCKET__' not in content
+    assert '__PACKAGE_PREFIX__' not in content
+    assert 'PACKAGE_PREFIX=\\"notebook-packages\\"' in content
+    # the bucket name is resolved by CloudFormation from the S3 stack
+    joined = on_start['Content']['Fn::Base64']['Fn::Join'][1]
+    assert any(isinstance(part, dict) and 'DataSandboxBucket' in part.get('Ref', '') for part in joined)
+    [on_create] = properties['OnCreate']
+    assert '__PACKAGE_' not in json.dumps(on_create['Content'])
@@ -0,0 +1,184 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import datetime
+import hashlib
+import io
+import json
+import os
+
+import pytest
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import clients  # noqa: E402
+import data_sandbox_lambda  # noqa: E402
+import metrics  # noqa: E402
+import response_channels  # noqa: E402
+from response_channels import HomeFolderChannel, LocalChannel, SsmChannel, build_channels  # noqa: E402
+
+HOME_BUCKET = 'appstream2-36fb080bb8-us-east-1-123456789012'
+USER = 'user@example.com'
+SESSION_ID = 'a1b2c3d4-session'
+
+
+class ParameterAlreadyExists(Exception):
+    pass
+
+
+class FakeSsm:
+    class exceptions:
+        ParameterAlreadyExists = ParameterAlreadyExists
+
+    def __init__(self):
+        self.parameters = {}
+        self.calls = []
+
+    def put_parameter(self, Name, Value, Overwrite, **kwargs):
+        self.calls.append(dict(kwargs, Name=Name, Value=Value, Overwrite=Overwrite))
+        if Name in self.parameters and not Overwrite:
+            raise ParameterAlreadyExists(Name)
+        self.parameters[Name] = Value
+
+
+class FakeS3:
+    def __init__(self, fail_put=False):
+        self.objects = {}
+        self.fail_put = fail_put
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if self.fail_put:
+            raise ConnectionError('s3 unavailable')
+        self.objects[(Bucket, Key)] = Body
+
+
+class FakeAppStream:
+    def describe_sessions(self, StackName, FleetName, UserId=None, **kwargs):
+        expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+        return {'Sessions': [{'Id': SESSION_ID, 'UserId': USER, 'MaxExpirationTime': expires}]}
+
+
+class FakeSageMaker:
+    def list_notebook_instances(self, **kwargs):
+        return {'NotebookInstances': [{'NotebookInstanceName': 'Data-Sandbox-Notebook',
+                                       'NotebookInstanceStatus': 'InService'}]}
+
+    def create_presigned_notebook_instance_url(self, NotebookInstanceName, SessionExpirationDurationInSeconds):
+        return {'AuthorizedUrl': f'https://{NotebookInstanceName}.notebook.local/?authToken=1'}
+
+
+def test_local_channel_is_write_once(tmp_path):
+    channel = LocalChannel(str(tmp_path))
+    channel.deliver(None, None, SESSION_ID, 'first')
+    # a response that was not read yet is not replaced
+    channel.deliver(None, None, SESSION_ID, 'second')
+    assert channel.read_once(SESSION_ID) == 'first'
+    assert sorted(os.listdir(tmp_path)) == []
+
+
+def test_local_channel_is_read_once(tmp_path):
+    channel = LocalChannel(str(tmp_path))
+    assert channel.read_once(SESSION_ID) is None
+    channel.deliver(None, None, SESSION_ID, 'url')
+    assert channel.read_once(SESSION_ID) == 'url'
+    assert channel.read_once(SESSION_ID) is None
+    channel.deliver(None, None, SESSION_ID, 'next url')
+    assert channel.read_once(SESSION_ID) == 'next url'
+
+
+def test_local_channel_drops_an_expired_response(tmp_path, monkeypatch):
+    channel = LocalChannel(str(tmp_path), ttl_seconds=300)
+    channel.deliver(None, None, SESSION_ID, 'url')
+    now = response_channels.time.time()
+    monkeypatch.setattr(response_channels.time, 'time', lambda: now + 301)
+    assert channel.read_once(SESSION_ID) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_ssm_channel_is_write_once():
+    ssm = FakeSsm()
+    channel = SsmChannel(lambda service: ssm, ttl_seconds=300)
+    channel.deliver(HOME_BUCKET, 'user/custom/abc', SESSION_ID, 'first')
+    # ParameterAlreadyExists means an unread response is still waiting, it is not an error
+    channel.deliver(HOME_BUCKET, 'user/custom/abc', SESSION_ID, 'second')
+    assert ssm.parameters == {f'/datasandbox/session-url/{SESSION_ID}': 'first'}
+    first_call = ssm.calls[0]
+    assert first_call['Overwrite'] is False
+    assert first_call['Type'] == 'SecureString'
+    [policy] = json.loads(first_call['Policies'])
+    assert policy['Type'] == 'Expiration'
+
+
+def test_build_channels_keeps_the_configured_order():
+    channels = build_channels(['homefolder', 'ssm'], lambda service: None)
+    assert [type(c) for c in channels] == [HomeFolderChannel, SsmChannel]
+    with pytest.raises(ValueError):
+        build_channels(['carrier-pigeon'], lambda service: None)
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    s3 = FakeS3()
+    ssm = FakeSsm()
+    for name, client in (('s3', s3), ('ssm', ssm), ('appstream', FakeAppStream()), ('sagemaker', FakeSageMaker())):
+        clients.register_client(name, client)
+    monkeypatch.setattr(data_sandbox_lambda, 'response_channels',
+                        build_channels(['homefolder', 'ssm'], clients.get_client))
+    monkeypatch.setattr(data_sandbox_lambda, 'new_metrics', lambda *a, **kw: metrics.NoopMetrics())
+    for cache in (data_sandbox_lambda.session_cache, data_sandbox_lambda.url_cache, data_sandbox_lambda.user_by_hash):
+        cache.clear()
+    data_sandbox_lambda.notebook_status_index.invalidate()
+
+    prefix = f"user/custom/{hashlib.sha256(USER.encode()).hexdigest()}"
+    key = f'{prefix}/session.json'
+    s3.objects[(HOME_BUCKET, key)] = json.dumps({
+        'user': USER, 'sessionId': SESSION_ID, 'bucketName': HOME_BUCKET, 'prefixName': prefix,
+        'stackName': 'datasandbox-stack', 'fleetName': 'datasandbox-fleet'}).encode()
+    yield s3, ssm, key, prefix
+    clients.reset_clients()
+
+
+def handle(key):
+    return data_sandbox_lambda.handle_session_request(HOME_BUCKET, key, metrics.NoopMetrics())
+
+
+def test_response_goes_to_the_home_folder_and_ssm(broker):
+    s3, ssm, key, prefix = broker
+    assert handle(key)['status'] == 'ok'
+    url = s3.objects[(HOME_BUCKET, f'{prefix}/session_url.txt')]
+    assert url.startswith('https://Data-Sandbox-Notebook.notebook.local/')
+    assert ssm.parameters == {f'/datasandbox/session-url/{SESSION_ID}': url}
+
+
+def test_ssm_still_delivers_when_the_home_folder_fails(broker):
+    s3, ssm, key, _ = broker
+    s3.fail_put = True
+    assert handle(key)['status'] == 'ok'
+    assert f'/datasandbox/session-url/{SESSION_ID}' in ssm.parameters
+
+
+def test_home_folder_still_delivers_when_ssm_fails(broker, monkeypatch):
+    s3, ssm, key, prefix = broker
+
+    def unavailable(**kwargs):
+        raise ConnectionError('ssm unavailable')
+
+    monkeypatch.setattr(ssm, 'put_parameter', unavailable)
+    assert handle(key)['status'] == 'ok'
+    assert (HOME_BUCKET, f'{prefix}/session_url.txt') in s3.objects
+
+
+def test_request_fails_when_no_channel_delivers(broker, monkeypatch):
+    s3, ssm, key, _ = broker
+    s3.fail_put = True
+
+    def unavailable(**kwargs):
+        raise TimeoutError('ssm unavailable')
+
+    monkeypatch.setattr(ssm, 'put_parameter', unavailable)
+    # the first channel's error is raised, so the event is retried
+    with pytest.raises(ConnectionError):
+        handle(key)
@@ -0,0 +1,21 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import pytest
+
+from appstream_session_reaper_lambda import parse_bool
+
+
+@pytest.mark.parametrize('value', [True, 1, 'true', 'True', '1', 'yes'])
+def test_dry_run_values_that_mean_true(value):
+    assert parse_bool(value) is True
+
+
+@pytest.mark.parametrize('value', [False, 0, 'false', 'FALSE', '0', '', 'no'])
+def test_dry_run_values_that_mean_false(value):
+    assert parse_bool(value) is False
+
+
+def test_dry_run_rejects_other_values():
+    with pytest.raises(ValueError):
+        parse_bool('maybe')
@@ -0,0 +1,68 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import json
+
+import pytest
+
+pytest.importorskip('aws_cdk.core')
+
+from conftest import resources, synth_app  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def studio_templates(tmp_path_factory):
+    return synth_app(tmp_path_factory.mktemp('cdk.out'), sandbox_backend='studio',
+                     studio_domain_name='test-studio')
+
+
+def test_studio_stack_is_only_built_for_the_studio_backend(default_templates, studio_templates):
+    assert 'studiostack' not in default_templates
+    assert 'studiostack' in studio_templates
+
+
+def test_domain_is_vpc_only_in_the_isolated_subnets(studio_templates):
+    template = studio_templates['studiostack']
+    [domain] = resources(template, 'AWS::SageMaker::Domain').values()
+    properties = domain['Properties']
+    assert properties['DomainName'] == 'test-studio'
+    assert properties['AuthMode'] == 'IAM'
+    assert properties['AppNetworkAccessType'] == 'VpcOnly'
+    assert len(properties['SubnetIds']) == 3
+    assert all('IsolatedSubnet' in subnet['Ref'] for subnet in properties['SubnetIds'])
+    [security_group_id] = resources(template, 'AWS::EC2::SecurityGroup')
+    assert properties['DefaultUserSettings']['SecurityGroups'] == [{'Fn::GetAtt': [security_group_id, 'GroupId']}]
+
+
+def test_studio_reaches_sagemaker_through_interface_endpoints(studio_templates):
+    endpoints = resources(studio_templates['studiostack'], 'AWS::EC2::VPCEndpoint').values()
+    services = [json.dumps(e['Properties']['ServiceName']) for e in endpoints]
+    for service in ('sagemaker.api', 'sagemaker.runtime', '.studio', '.sts'):
+        assert any(service in name for name in services), service
+    for endpoint in endpoints:
+        assert endpoint['Properties']['VpcEndpointType'] == 'Interface'
+        assert endpoint['Properties']['PrivateDnsEnabled'] is True
+
+
+def test_broker_may_manage_studio_user_profiles(studio_templates):
+    template = studio_templates['appstreamstack']
+    functions = resources(template, 'AWS::Lambda::Function').values()
+    [broker] = [f for f in functions if f['Properties']['Handler'] == 'data_sandbox_lambda.lambda_handler']
+    variables = broker['Properties']['Environment']['Variables']
+    assert variables['SANDBOX_BACKEND'] == 'studio'
+    assert variables['STUDIO_DOMAIN_NAME'] == 'test-studio'
+
+    [studio_policy] = [p for role in resources(template, 'AWS::IAM::Role').values()
+                       for p in role['Properties'].get('Policies', []) if p['PolicyName'] == 'AllowStudioAccess']
+    profile_statement, domains_statement = studio_policy['PolicyDocument']['Statement']
+    assert set(profile_statement['Action']) == {'sagemaker:CreatePresignedDomainUrl', 'sagemaker:DescribeUserProfile',
+                                                'sagemaker:CreateUserProfile', 'sagemaker:AddTags'}
+    assert profile_statement['Resource']['Fn::Join'][1][-1] == ':user-profile/*/*'
+    assert domains_statement['Action'] == 'sagemaker:ListDomains'
+
+
+def test_notebook_backend_has_no_studio_grants(default_templates):
+    template = default_templates['appstreamstack']
+    policies = [p['PolicyName'] for role in resources(template, 'AWS::IAM::Role').values()
+                for p in role['Properties'].get('Policies', [])]
+    assert 'AllowStudioAccess' not in policies
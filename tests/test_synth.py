@@ -0,0 +1,79 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+import json
+
+import pytest
+
+pytest.importorskip('aws_cdk.core')
+
+from conftest import resources, synth_app  # noqa: E402
+
+
+def test_app_synthesizes_with_cdk_json_context(default_templates):
+    for name in ('DataSandbox', 'vpcstack', 's3stack', 'appstreamstack', 'notebookstack'):
+        assert name in default_templates
+
+
+def test_fleet_tracks_appstream_capacity_utilization(default_templates):
+    template = default_templates['appstreamstack']
+    policies = resources(template, 'AWS::ApplicationAutoScaling::ScalingPolicy')
+    assert len(policies) == 1
+    properties = next(iter(policies.values()))['Properties']
+    assert properties['PolicyType'] == 'TargetTrackingScaling'
+    configuration = properties['TargetTrackingScalingPolicyConfiguration']
+    assert configuration['PredefinedMetricSpecification'] == {'PredefinedMetricType': 'AppStreamAverageCapacityUtilization'}
+    assert configuration['TargetValue'] == 75
+
+    targets = resources(template, 'AWS::ApplicationAutoScaling::ScalableTarget')
+    target = next(iter(targets.values()))['Properties']
+    assert target['ScalableDimension'] == 'appstream:fleet:DesiredCapacity'
+    assert len(target['ScheduledActions']) == 2
+
+
+def nested_stack_dependencies(parent_template, nested_id):
+    [stack] = [resource for logical_id, resource in resources(parent_template, 'AWS::CloudFormation::Stack').items()
+               if logical_id.startswith(f'{nested_id}NestedStack')]
+    return stack.get('DependsOn', [])
+
+
+def test_fleet_and_scaling_target_wait_for_the_service_roles(default_templates):
+    # the scalable target uses the ApplicationAutoScalingForAmazonAppStreamAccess role the reconcile creates
+    parent = default_templates['DataSandbox']
+    for nested_id in ('appstreamstack', 'appstreamstartfleetstack'):
+        assert any(d.startswith('appstreamservicerolesstackNestedStack')
+                   for d in nested_stack_dependencies(parent, nested_id))
+    targets = resources(default_templates['appstreamstack'], 'AWS::ApplicationAutoScaling::ScalableTarget')
+    [target] = targets.values()
+    assert 'ApplicationAutoScalingForAmazonAppStreamAccess' in json.dumps(target['Properties']['RoleARN'])
+
+
+def test_app_synthesizes_without_fleet_scaling(tmp_path):
+    templates = synth_app(tmp_path, appstream_scaling={})
+    assert not resources(templates['appstreamstack'], 'AWS::ApplicationAutoScaling::ScalableTarget')
+
+
+def test_service_roles_run_through_a_provider(default_templates):
+    template = default_templates['appstreamservicerolesstack']
+    # an AwsCustomResource invoke ignores FunctionError, the provider framework fails the stack
+    assert not resources(template, 'Custom::AWS')
+    triggers = resources(template, 'AWS::CloudFormation::CustomResource')
+    assert len(triggers) == 1
+    functions = resources(template, 'AWS::Lambda::Function')
+    assert any(f['Properties']['Handler'] == 'appstream_service_roles_lambda.on_event' for f in functions.values())
+
+
+def test_session_reaper_idle_rule_can_be_disabled(tmp_path):
+    templates = synth_app(tmp_path, session_reaper_max_disconnected_minutes=0)
+    functions = resources(templates['appstreamsessionreaperstack'], 'AWS::Lambda::Function')
+    reaper = next(f for f in functions.values()
+                  if f['Properties']['Handler'] == 'appstream_session_reaper_lambda.lambda_handler')
+    assert reaper['Properties']['Environment']['Variables']['MAX_DISCONNECTED_MINUTES'] == '0'
+
+
+def test_scripts_parameter_waits_for_the_versioned_upload(default_templates):
+    template = default_templates['s3stack']
+    [param] = resources(template, 'AWS::SSM::Parameter').values()
+    [deployment_id] = [logical_id for logical_id in resources(template, 'Custom::CDKBucketDeployment')
+                       if logical_id.startswith('AppstreamScriptsVersionedDeployment')]
+    assert any(d.startswith(deployment_id) for d in param.get('DependsOn', []))
@@ -0,0 +1,257 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+"""Offline throughput benchmark for data_sandbox_lambda.lambda_handler.
+
+The handler runs against in-process stand-ins for S3, AppStream and SageMaker
+that sleep for a configurable latency per call, so the numbers reflect the
+handler's own overhead plus its concurrency, and no network is needed.
+
+    python tools/bench_broker.py --events 50 --records 10 --users 200
+    python tools/bench_broker.py --update-baseline
+"""
+
+import argparse
+import contextlib
+import datetime
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'lambda'))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import clients  # noqa: E402
+import data_sandbox_lambda  # noqa: E402
+import metrics  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(HERE, 'bench_broker_baseline.json')
+HOME_BUCKET = 'appstream2-36fb080bb8-us-east-1-123456789012'
+
+
+class FakeS3:
+    def __init__(self, latency):
+        self.latency = latency
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        time.sleep(self.latency)
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        time.sleep(self.latency)
+        self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.encode()
+        return {}
+
+
+class FakeAppStream:
+    def __init__(self, latency, sessions):
+        self.latency = latency
+        self.sessions = sessions
+
+    def describe_sessions(self, StackName, FleetName, UserId=None, NextToken=None, **kwargs):
+        time.sleep(self.latency)
+        return {'Sessions': [s for s in self.sessions if UserId is None or s['UserId'] == UserId]}
+
+
+class FakeSageMaker:
+    def __init__(self, latency, instance_names=()):
+        self.latency = latency
+        self.instance_names = list(instance_names)
+        self.calls = 0
+
+    def list_notebook_instances(self, NameContains, **kwargs):
+        time.sleep(self.latency)
+        return {'NotebookInstances': [{'NotebookInstanceName': name, 'NotebookInstanceStatus': 'InService'}
+                                      for name in self.instance_names]}
+
+    def create_presigned_notebook_instance_url(self, NotebookInstanceName, SessionExpirationDurationInSeconds):
+        time.sleep(self.latency)
+        self.calls += 1
+        return {'AuthorizedUrl': f'https://{NotebookInstanceName}.notebook.local/?authToken={self.calls}'}
+
+
+class FakeCloudWatch:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def get_metric_data(self, MetricDataQueries, **kwargs):
+        time.sleep(self.latency)
+        return {'MetricDataResults': [{'Id': query['Id'], 'Values': []} for query in MetricDataQueries]}
+
+
+class CollectingMetrics(metrics.RecordMetrics):
+    collected = []
+
+    def flush(self):
+        CollectingMetrics.collected.append(dict(self.values))
+
+
+def build_world(args):
+    rnd = random.Random(args.seed)
+    expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=4)
+    s3 = FakeS3(args.s3_latency_ms / 1000)
+    sessions = []
+    keys = []
+    for u in range(args.users):
+        user = f'user{u}@example.com'
+        session_id = f'{rnd.getrandbits(128):032x}'
+        sessions.append({'Id': session_id, 'UserId': user, 'MaxExpirationTime': expires})
+        prefix = f"user/custom/{hashlib.sha256(user.encode()).hexdigest()}"
+        if args.request_layout == 'key':
+            key = f'{prefix}/session-requests/datasandbox-stack/datasandbox-fleet/{session_id}/session.json'
+        else:
+            key = f'{prefix}/session.json'
+        s3.objects[(HOME_BUCKET, key)] = json.dumps({
+            'user': user, 'sessionId': session_id, 'bucketName': HOME_BUCKET, 'prefixName': prefix,
+            'stackName': 'datasandbox-stack', 'fleetName': 'datasandbox-fleet'}).encode()
+        keys.append(key)
+    clients.register_client('s3', s3)
+    clients.register_client('appstream', FakeAppStream(args.appstream_latency_ms / 1000, sessions))
+    instance_names = ['Data-Sandbox-Notebook'] + [f'Data-Sandbox-Notebook-{i}' for i in range(2, args.notebook_pool_size + 1)]
+    clients.register_client('sagemaker', FakeSageMaker(args.sagemaker_latency_ms / 1000, instance_names))
+    clients.register_client('cloudwatch', FakeCloudWatch(args.sagemaker_latency_ms / 1000))
+    data_sandbox_lambda.notebook_router.instance_names = instance_names
+
+    events = []
+    delivered = []
+    for _ in range(args.events):
+        records = []
+        for _ in range(args.records):
+            if delivered and rnd.random() < args.duplicate_ratio:
+                # S3 redelivers the very same record
+                records.append(rnd.choice(delivered))
+                continue
+            record = {'eventSource': 'aws:s3',
+                      's3': {'bucket': {'name': HOME_BUCKET},
+                             'object': {'key': rnd.choice(keys), 'sequencer': f'{rnd.getrandbits(64):016X}'}}}
+            delivered.append(record)
+            records.append(record)
+        events.append({'Records': records})
+    return events
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def run(args):
+    events = build_world(args)
+    data_sandbox_lambda.new_metrics = lambda *a, **kw: CollectingMetrics()
+    data_sandbox_lambda.session_cache.clear()
+    data_sandbox_lambda.url_cache.clear()
+    data_sandbox_lambda.notebook_router.assignments.clear()
+    data_sandbox_lambda.notebook_status_index.invalidate()
+    data_sandbox_lambda.notebook_load_index.invalidate()
+    data_sandbox_lambda.deduplicator.window.clear()
+    for limiter, max_tps in ((data_sandbox_lambda.appstream_limiter, args.appstream_max_tps),
+                             (data_sandbox_lambda.sagemaker_limiter, args.sagemaker_max_tps)):
+        limiter.max_rate = limiter.rate = limiter.burst = max_tps
+    CollectingMetrics.collected = []
+
+    # the handler's own log lines would interleave with the report
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for event in events:
+            data_sandbox_lambda.lambda_handler(event, None)
+        elapsed = time.perf_counter() - start
+
+        # allocations are measured on a separate pass so tracing does not skew the timings
+        duplicates = data_sandbox_lambda.deduplicator.duplicates
+        data_sandbox_lambda.deduplicator.window.clear()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        for event in events[:args.alloc_events]:
+            data_sandbox_lambda.lambda_handler(event, None)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+    allocated = [s for s in after.compare_to(before, 'filename') if s.count_diff > 0]
+    invocations = max(1, min(args.alloc_events, len(events)))
+
+    stages = {}
+    for name in sorted({n for m in CollectingMetrics.collected for n in m if n.endswith('Ms')}):
+        values = [m[name] for m in CollectingMetrics.collected if name in m]
+        stages[name] = {'p50': percentile(values, 50), 'p95': percentile(values, 95),
+                        'p99': percentile(values, 99)}
+
+    total_records = args.events * args.records
+    return {
+        'records': total_records,
+        'records_per_sec': total_records / elapsed,
+        'stages_ms': stages,
+        'alloc_blocks_per_invocation': sum(s.count_diff for s in allocated) / invocations,
+        'alloc_kib_per_invocation': sum(s.size_diff for s in allocated) / 1024 / invocations,
+        'session_cache': data_sandbox_lambda.session_cache.stats(),
+        'url_cache': data_sandbox_lambda.url_cache.stats(),
+        'duplicates': duplicates,
+        'coalesced': data_sandbox_lambda.session_flight.coalesced + data_sandbox_lambda.url_flight.coalesced,
+        'notebook_router': data_sandbox_lambda.notebook_router.stats(),
+    }
+
+
+def compare(report, baseline, tolerance, slack_ms=5.0):
+    regressions = []
+    if report['records_per_sec'] < baseline['records_per_sec'] * (1 - tolerance):
+        regressions.append(f"records_per_sec {report['records_per_sec']:.1f} < "
+                           f"baseline {baseline['records_per_sec']:.1f}")
+    for stage, values in baseline.get('stages_ms', {}).items():
+        current = report['stages_ms'].get(stage)
+        if current is None:
+            continue
+        # p99 of a few hundred samples is too noisy to gate on, it is only reported;
+        # slack_ms absorbs scheduler jitter on the short simulated calls
+        if current['p95'] > values['p95'] * (1 + tolerance) + slack_ms:
+            regressions.append(f"{stage} p95 {current['p95']:.2f}ms > baseline {values['p95']:.2f}ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--records', type=int, default=10, help='records per event')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--s3-latency-ms', type=float, default=15)
+    parser.add_argument('--appstream-latency-ms', type=float, default=40)
+    parser.add_argument('--sagemaker-latency-ms', type=float, default=60)
+    # the per-container API limiters are effectively off unless a rate is given
+    parser.add_argument('--appstream-max-tps', type=float, default=10000)
+    parser.add_argument('--sagemaker-max-tps', type=float, default=10000)
+    parser.add_argument('--alloc-events', type=int, default=5)
+    parser.add_argument('--request-layout', choices=('body', 'key'), default='body',
+                        help='legacy session.json read from S3, or the request encoded in the key')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.0,
+                        help='share of records that are redeliveries of earlier ones')
+    parser.add_argument('--notebook-pool-size', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION: {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+"""Measure the INIT cost of the Lambda handlers without touching AWS.
+
+Each sample runs in a fresh interpreter, like a cold Lambda container: it imports
+the handler module and then creates the clients the first request would need.
+Credentials, region and endpoints are stubbed so nothing leaves the machine.
+
+    python tools/bench_cold_start.py --samples 20 --max-init-ms 400
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+
+HANDLERS = {
+    'data_sandbox_lambda': ['s3', 'appstream', 'sagemaker'],
+    'appstream_service_roles_lambda': ['iam'],
+}
+
+SAMPLE = """
+import json, time
+t0 = time.perf_counter()
+import {module}
+t1 = time.perf_counter()
+from clients import get_client
+for name in {services!r}:
+    get_client(name)
+t2 = time.perf_counter()
+print(json.dumps({{'import_ms': (t1 - t0) * 1000, 'first_clients_ms': (t2 - t1) * 1000}}))
+"""
+
+STUB_ENV = {
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'AWS_SESSION_TOKEN': 'testing',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_REGION': 'us-east-1',
+    'AWS_EC2_METADATA_DISABLED': 'true',
+    'AWS_CONFIG_FILE': os.devnull,
+    'AWS_SHARED_CREDENTIALS_FILE': os.devnull,
+    'HTTP_PROXY': 'http://127.0.0.1:9',
+    'HTTPS_PROXY': 'http://127.0.0.1:9',
+}
+
+
+def run_sample(module, services):
+    env = dict(os.environ, **STUB_ENV)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [LAMBDA_DIR, env.get('PYTHONPATH')]))
+    out = subprocess.run([sys.executable, '-c', SAMPLE.format(module=module, services=services)],
+                         env=env, cwd=LAMBDA_DIR, check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def summarize(values):
+    values = sorted(values)
+    return {'p50': statistics.median(values),
+            'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+            'max': values[-1]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=10)
+    parser.add_argument('--max-init-ms', type=float, default=None,
+                        help='fail if the p50 of import + first clients exceeds this')
+    args = parser.parse_args(argv)
+
+    report = {}
+    failed = False
+    for module, services in HANDLERS.items():
+        samples = [run_sample(module, services) for _ in range(args.samples)]
+        total = [s['import_ms'] + s['first_clients_ms'] for s in samples]
+        report[module] = {'import_ms': summarize([s['import_ms'] for s in samples]),
+                          'first_clients_ms': summarize([s['first_clients_ms'] for s in samples]),
+                          'init_ms': summarize(total)}
+        if args.max_init_ms is not None and report[module]['init_ms']['p50'] > args.max_init_ms:
+            failed = True
+
+    print(json.dumps(report, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+"""Benchmark notebook_lib/sandbox_data.py against a local S3 stand-in.
+
+The stand-in serves HEAD and ranged GET of in-memory objects over HTTP, with a
+first-byte latency per request and a bandwidth cap per connection, like a
+single S3 stream. Each reader runs against the same object and its result is
+checked against the object's sha256:
+
+- single_stream: one get_object().read(), how notebooks read objects today
+- parallel_readinto: ranged GETs straight into a preallocated bytearray
+- parallel_copy_cold: ranged GETs into an empty chunk cache, copied to a file
+- parallel_copy_warm: the same copy again, served from the cache through mmap
+
+    python tools/bench_dataset_reader.py --object-mb 128 --stream-mbps 50 --min-speedup 2
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+from botocore.config import Config
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'notebook_lib'))
+from sandbox_data import ChunkCache, SandboxReader  # noqa: E402
+
+BUCKET = 'data-sandbox-bucket'
+KEY = 'exports/dataset.bin'
+
+
+class LocalS3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    objects = {}
+    etags = {}
+    latency = 0.0
+    bytes_per_sec = 0.0
+    requests = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _object(self):
+        path = self.path.split('?')[0].lstrip('/')
+        body = self.objects.get(path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None, None
+        return body, self.etags[path]
+
+    def do_HEAD(self):
+        body, etag = self._object()
+        if body is None:
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+    def do_GET(self):
+        with LocalS3Handler.lock:
+            LocalS3Handler.requests += 1
+        body, etag = self._object()
+        if body is None:
+            return
+        if self.headers.get('If-Match') not in (None, etag):
+            self.send_response(412)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        start, end = 0, len(body) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(end, int(match.group(2) or end))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('ETag', etag)
+        self.end_headers()
+
+        time.sleep(self.latency)
+        view = memoryview(body)[start:end + 1]
+        piece = 256 * 1024
+        began = time.perf_counter()
+        for offset in range(0, len(view), piece):
+            self.wfile.write(view[offset:offset + piece])
+            if self.bytes_per_sec:
+                # pace the connection to bytes_per_sec
+                ahead = (offset + piece) / self.bytes_per_sec - (time.perf_counter() - began)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+
+def start_server(body, latency, bytes_per_sec):
+    LocalS3Handler.objects = {f'{BUCKET}/{KEY}': body}
+    LocalS3Handler.etags = {f'{BUCKET}/{KEY}': '"%s"' % hashlib.md5(body).hexdigest()}
+    LocalS3Handler.latency = latency
+    LocalS3Handler.bytes_per_sec = bytes_per_sec
+    server = ThreadingHTTPServer(('127.0.0.1', 0), LocalS3Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def s3_client(endpoint, max_workers):
+    return boto3.client('s3', endpoint_url=endpoint, region_name='us-east-1',
+                        aws_access_key_id='testing', aws_secret_access_key='testing',
+                        config=Config(s3={'addressing_style': 'path'}, max_pool_connections=max_workers,
+                                      retries={'max_attempts': 1}))
+
+
+def measure(name, size, fn):
+    LocalS3Handler.requests = 0
+    start = time.perf_counter()
+    digest = fn()
+    elapsed = time.perf_counter() - start
+    return {'name': name, 'seconds': elapsed, 'mb_per_sec': size / 1024 ** 2 / elapsed,
+            'requests': LocalS3Handler.requests, 'sha256': digest}
+
+
+def run(args):
+    size = args.object_mb * 1024 ** 2
+    body = os.urandom(size)
+    expected = hashlib.sha256(body).hexdigest()
+    server = start_server(body, args.latency_ms / 1000, args.stream_mbps * 1024 ** 2)
+    endpoint = f'http://127.0.0.1:{server.server_address[1]}'
+    client = s3_client(endpoint, args.max_workers)
+    chunk_size = args.chunk_mb * 1024 ** 2
+    results = []
+
+    def single_stream():
+        return hashlib.sha256(client.get_object(Bucket=BUCKET, Key=KEY)['Body'].read()).hexdigest()
+
+    results.append(measure('single_stream', size, single_stream))
+
+    with SandboxReader(BUCKET, client=client, chunk_size=chunk_size, max_workers=args.max_workers) as reader:
+        buffer = bytearray(size)
+
+        def parallel_readinto():
+            reader.readinto(KEY, buffer)
+            return hashlib.sha256(buffer).hexdigest()
+
+        results.append(measure('parallel_readinto', size, parallel_readinto))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ChunkCache(os.path.join(tmp, 'chunk-cache'), max_bytes=args.cache_mb * 1024 ** 2)
+        with SandboxReader(BUCKET, client=client, chunk_size=chunk_size, max_workers=args.max_workers,
+                           cache=cache) as reader:
+
+            def parallel_copy():
+                with open(os.path.join(tmp, 'copy.bin'), 'w+b') as f:
+                    reader.copy_to(KEY, f)
+                    f.seek(0)
+                    return hashlib.sha256(f.read()).hexdigest()
+
+            results.append(measure('parallel_copy_cold', size, parallel_copy))
+            results.append(measure('parallel_copy_warm', size, parallel_copy))
+            cache_stats = cache.stats()
+    server.shutdown()
+
+    for result in results:
+        result['ok'] = result.pop('sha256') == expected
+    single = results[0]['seconds']
+    return {'object_mb': args.object_mb, 'chunk_mb': args.chunk_mb, 'max_workers': args.max_workers,
+            'latency_ms': args.latency_ms, 'stream_mbps': args.stream_mbps,
+            'results': results,
+            'speedup': {r['name']: single / r['seconds'] for r in results[1:]},
+            'cache': cache_stats}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--object-mb', type=int, default=128)
+    parser.add_argument('--chunk-mb', type=int, default=8)
+    parser.add_argument('--max-workers', type=int, default=8)
+    parser.add_argument('--cache-mb', type=int, default=512)
+    parser.add_argument('--latency-ms', type=float, default=20, help='first-byte latency of every request')
+    parser.add_argument('--stream-mbps', type=float, default=50, help='bandwidth of one connection, 0 for no cap')
+    parser.add_argument('--min-speedup', type=float, default=0,
+                        help='fail when parallel_readinto is not this many times faster than single_stream')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    failures = [f"{r['name']} returned different bytes" for r in report['results'] if not r['ok']]
+    if report['speedup']['parallel_readinto'] < args.min_speedup:
+        failures.append(f"parallel_readinto speedup {report['speedup']['parallel_readinto']:.2f} < {args.min_speedup}")
+    for failure in failures:
+        print(f'FAILED: {failure}', file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+"""Compare time-to-URL of the home folder path against a direct response channel.
+
+Both paths run for real on the local file system, on a compressed clock:
+
+- home folder: the broker writes session_url.txt to a staging folder (S3). A
+  sync thread copies it to the client's folder every --sync-interval seconds,
+  starting at a random phase, the way AppStream syncs the home folder. The
+  client checks for the file every --poll-interval seconds.
+- direct: the broker delivers through response_channels.LocalChannel. The
+  client reads it with read_once every --poll-interval seconds, and each read
+  costs --read-latency (e.g. an `aws ssm get-parameter` call).
+
+    python tools/bench_response_channel.py --trials 40 --sync-interval 10
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'lambda'))
+
+from response_channels import LocalChannel  # noqa: E402
+
+
+class Clock:
+    def __init__(self, scale):
+        self.scale = scale
+        self.origin = time.monotonic()
+
+    def now(self):
+        return (time.monotonic() - self.origin) / self.scale
+
+    def sleep(self, seconds):
+        time.sleep(seconds * self.scale)
+
+
+def home_folder_trial(args, clock, rnd, workdir):
+    staging = os.path.join(workdir, 's3')
+    local = os.path.join(workdir, 'home')
+    os.makedirs(staging)
+    os.makedirs(local)
+    done = threading.Event()
+
+    def sync():
+        clock.sleep(rnd.uniform(0, args.sync_interval))
+        while not done.is_set():
+            src = os.path.join(staging, 'session_url.txt')
+            if os.path.exists(src):
+                shutil.copy(src, os.path.join(local, 'session_url.txt'))
+            clock.sleep(args.sync_interval)
+
+    def broker():
+        clock.sleep(args.broker_latency)
+        with open(os.path.join(staging, 'session_url.txt'), 'w') as f:
+            f.write('https://notebook.local/?authToken=home')
+
+    start = clock.now()
+    threads = [threading.Thread(target=sync, daemon=True), threading.Thread(target=broker, daemon=True)]
+    for t in threads:
+        t.start()
+    requests = 0
+    while clock.now() - start < args.deadline:
+        requests += 1
+        if os.path.exists(os.path.join(local, 'session_url.txt')):
+            break
+        clock.sleep(args.poll_interval)
+    done.set()
+    return clock.now() - start, requests
+
+
+def direct_trial(args, clock, rnd, workdir):
+    channel = LocalChannel(os.path.join(workdir, 'channel'), ttl_seconds=args.deadline)
+
+    def broker():
+        clock.sleep(args.broker_latency)
+        channel.deliver(None, None, 'session', 'https://notebook.local/?authToken=direct')
+
+    start = clock.now()
+    threading.Thread(target=broker, daemon=True).start()
+    requests = 0
+    while clock.now() - start < args.deadline:
+        requests += 1
+        clock.sleep(args.read_latency)
+        if channel.read_once('session') is not None:
+            break
+        clock.sleep(args.poll_interval)
+    return clock.now() - start, requests
+
+
+def summarize(samples):
+    latencies = sorted(s[0] for s in samples)
+    return {'p50_seconds': round(statistics.median(latencies), 2),
+            'p95_seconds': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+            'mean_requests': round(statistics.mean(s[1] for s in samples), 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trials', type=int, default=30)
+    parser.add_argument('--sync-interval', type=float, default=10.0)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--read-latency', type=float, default=0.8)
+    parser.add_argument('--broker-latency', type=float, default=0.5)
+    parser.add_argument('--deadline', type=float, default=300.0)
+    parser.add_argument('--time-scale', type=float, default=0.01, help='wall seconds per simulated second')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(args.seed)
+    results = {'homefolder': [], 'direct': []}
+    for _ in range(args.trials):
+        for name, trial in (('homefolder', home_folder_trial), ('direct', direct_trial)):
+            workdir = tempfile.mkdtemp()
+            try:
+                results[name].append(trial(args, Clock(args.time_scale), rnd, workdir))
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({name: summarize(samples) for name, samples in results.items()}, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
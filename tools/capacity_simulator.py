@@ -0,0 +1,296 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+"""Replay a login arrival trace against an AppStream fleet scaling policy.
+
+A discrete-event simulation of one fleet with one user per instance:
+
+- Users who arrive while no instance is free wait in a FIFO queue. Their wait
+  is the queueing delay.
+- Every --evaluation-seconds, target tracking sets the desired capacity to
+  ceil(demand / target). Demand is the sessions in use plus the waiting users.
+  The result is clamped to the current min/max and respects the cooldowns.
+- Scheduled actions change min/max at their cron times (UTC).
+- New instances become usable --provisioning-seconds after a scale-out. On a
+  scale-in, only idle instances are removed.
+
+The policy uses the same schema as the appstream_scaling context in cdk.json,
+which is read by default. The report compares queueing delay against
+instance-hours:
+
+    python tools/capacity_simulator.py --synthetic-days 5
+    python tools/capacity_simulator.py --trace logins.csv --policy policy.json
+
+A trace is a CSV with the columns arrival (epoch seconds or ISO 8601, UTC) and
+duration_seconds.
+"""
+
+import argparse
+import csv
+import datetime
+import heapq
+import json
+import math
+import os
+import random
+import statistics
+import sys
+from collections import deque
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DAYS_OF_WEEK = ['SUN', 'MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT']
+
+# event order within the same second: capacity first, then departures, arrivals, evaluation
+PROVISIONED, SCHEDULED, DEPARTURE, ARRIVAL, EVALUATE = range(5)
+
+
+def parse_cron_field(field, low, high, names=None):
+    if field in ('*', '?'):
+        return set(range(low, high + 1))
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if names:
+            for index, name in enumerate(names):
+                part = part.replace(name, str(index + low))
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-'))
+        else:
+            start = end = int(part)
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """The minute, hour and day-of-week fields of an Application Auto Scaling cron()."""
+
+    def __init__(self, expression):
+        fields = expression.strip()[len('cron('):-1].split()
+        if not expression.startswith('cron(') or len(fields) != 6:
+            raise ValueError(f'Unsupported schedule {expression}')
+        self.minutes = parse_cron_field(fields[0], 0, 59)
+        self.hours = parse_cron_field(fields[1], 0, 23)
+        # cron day-of-week is 1 (SUN) to 7 (SAT)
+        self.days_of_week = parse_cron_field(fields[4], 1, 7, DAYS_OF_WEEK)
+
+    def matches(self, moment):
+        cron_day = (moment.isoweekday() % 7) + 1
+        return moment.minute in self.minutes and moment.hour in self.hours and cron_day in self.days_of_week
+
+    def occurrences(self, start, end):
+        moment = datetime.datetime.fromtimestamp(start - start % 60 + 60, datetime.timezone.utc)
+        last = datetime.datetime.fromtimestamp(end, datetime.timezone.utc)
+        while moment <= last:
+            if self.matches(moment):
+                yield moment.timestamp()
+            moment += datetime.timedelta(minutes=1)
+
+
+def parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        moment = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=datetime.timezone.utc)
+        return moment.timestamp()
+
+
+def load_trace(path):
+    with open(path, newline='') as f:
+        return sorted((parse_time(row['arrival']), float(row['duration_seconds'])) for row in csv.DictReader(f))
+
+
+def synthetic_trace(days, peak_per_hour, median_minutes, seed):
+    """Weekday logins peaking mid-morning and after lunch, a trickle at night and weekends."""
+    rnd = random.Random(seed)
+    # 2024-01-01 is a Monday
+    origin = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+    trace = []
+    for hour in range(days * 24):
+        day, hour_of_day = divmod(hour, 24)
+        weekday = day % 7 < 5
+        shape = math.exp(-((hour_of_day - 9.5) ** 2) / 3) + 0.7 * math.exp(-((hour_of_day - 14) ** 2) / 4)
+        rate = peak_per_hour * (shape if weekday else 0.05 * shape) + 0.5
+        t = 0.0
+        while True:
+            t += rnd.expovariate(rate / 3600)
+            if t >= 3600:
+                break
+            duration = min(8 * 3600, rnd.lognormvariate(math.log(median_minutes * 60), 0.7))
+            trace.append((origin + hour * 3600 + t, duration))
+    return trace
+
+
+def load_policy(path):
+    with open(path) as f:
+        document = json.load(f)
+    context = document.get('context', document)
+    policy = context.get('appstream_scaling', context)
+    policy.setdefault('desired_instances', context.get('appstream_desired_instances', policy.get('min_capacity', 1)))
+    return policy
+
+
+class FleetSimulation:
+    def __init__(self, policy, trace, provisioning_seconds, evaluation_seconds):
+        self.policy = policy
+        self.trace = trace
+        self.provisioning_seconds = provisioning_seconds
+        self.evaluation_seconds = evaluation_seconds
+        self.min_capacity = int(policy.get('min_capacity', 1))
+        self.max_capacity = int(policy.get('max_capacity', policy['desired_instances']))
+        self.target = policy.get('target_utilization_percent')
+        self.scale_in_cooldown = int(policy.get('scale_in_cooldown_seconds', 900))
+        self.scale_out_cooldown = int(policy.get('scale_out_cooldown_seconds', 120))
+
+    def run(self):
+        start, end = self.trace[0][0], max(a + d for a, d in self.trace)
+        events = []
+        sequence = 0
+
+        def push(t, kind, payload=None):
+            nonlocal sequence
+            sequence += 1
+            heapq.heappush(events, (t, kind, sequence, payload))
+
+        for arrival, duration in self.trace:
+            push(arrival, ARRIVAL, duration)
+        for action in self.policy.get('schedules', []):
+            for t in CronSchedule(action['schedule']).occurrences(start, end):
+                push(t, SCHEDULED, action)
+        t = start
+        while t <= end:
+            push(t, EVALUATE)
+            t += self.evaluation_seconds
+
+        ready = min(self.max_capacity, max(self.min_capacity, int(self.policy['desired_instances'])))
+        pending = 0
+        in_use = 0
+        queue = deque()
+        waits = []
+        last_scale_out = last_scale_in = -math.inf
+        instance_seconds = 0.0
+        peak_capacity = ready
+        clock = start
+
+        def set_desired(now, desired):
+            nonlocal ready, pending
+            desired = min(self.max_capacity, max(self.min_capacity, desired))
+            if desired > ready + pending:
+                push(now + self.provisioning_seconds, PROVISIONED, desired - ready - pending)
+                pending = desired - ready
+                return 'out'
+            if desired < ready + pending:
+                # cancel provisioning first, then stop idle instances
+                cancel = min(pending, ready + pending - desired)
+                pending -= cancel
+                ready -= min(ready - in_use, ready + pending - desired)
+                return 'in'
+            return None
+
+        def start_sessions(now):
+            nonlocal in_use
+            while queue and in_use < ready:
+                arrival, duration = queue.popleft()
+                waits.append(now - arrival)
+                in_use += 1
+                push(now + duration, DEPARTURE)
+
+        while events:
+            now, kind, _, payload = heapq.heappop(events)
+            instance_seconds += ready * (now - clock)
+            clock = now
+
+            if kind == ARRIVAL:
+                queue.append((now, payload))
+            elif kind == DEPARTURE:
+                in_use -= 1
+            elif kind == PROVISIONED:
+                arriving = min(payload, pending)
+                pending -= arriving
+                ready += arriving
+            elif kind == SCHEDULED:
+                if payload.get('min_capacity') is not None:
+                    self.min_capacity = int(payload['min_capacity'])
+                if payload.get('max_capacity') is not None:
+                    self.max_capacity = int(payload['max_capacity'])
+                set_desired(now, ready + pending)
+            elif kind == EVALUATE and self.target:
+                demand = in_use + len(queue)
+                desired = math.ceil(demand * 100 / float(self.target))
+                if desired > ready + pending and now - last_scale_out >= self.scale_out_cooldown:
+                    if set_desired(now, desired) == 'out':
+                        last_scale_out = now
+                elif desired < ready + pending and now - max(last_scale_in, last_scale_out) >= self.scale_in_cooldown:
+                    if set_desired(now, desired) == 'in':
+                        last_scale_in = now
+            start_sessions(now)
+            peak_capacity = max(peak_capacity, ready)
+
+        return self.report(waits, instance_seconds, peak_capacity)
+
+    def report(self, waits, instance_seconds, peak_capacity):
+        ordered = sorted(waits)
+        queued = [w for w in ordered if w > 0]
+        session_seconds = sum(d for _, d in self.trace)
+
+        def percentile(p):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 1)
+
+        return {
+            'sessions': len(ordered),
+            'queued_share': round(len(queued) / len(ordered), 4),
+            'wait_p50_seconds': percentile(0.5),
+            'wait_p95_seconds': percentile(0.95),
+            'wait_p99_seconds': percentile(0.99),
+            'wait_max_seconds': round(ordered[-1], 1),
+            'wait_mean_queued_seconds': round(statistics.mean(queued), 1) if queued else 0.0,
+            'instance_hours': round(instance_seconds / 3600, 1),
+            'session_hours': round(session_seconds / 3600, 1),
+            'utilization': round(session_seconds / instance_seconds, 4) if instance_seconds else None,
+            'peak_capacity': peak_capacity,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--policy', default=os.path.join(HERE, '..', 'cdk.json'),
+                        help='cdk.json or a JSON file with the appstream_scaling schema')
+    parser.add_argument('--trace', help='CSV of arrival,duration_seconds; a synthetic week is used otherwise')
+    parser.add_argument('--synthetic-days', type=int, default=7)
+    parser.add_argument('--peak-arrivals-per-hour', type=float, default=15.0)
+    parser.add_argument('--median-session-minutes', type=float, default=45.0)
+    parser.add_argument('--provisioning-seconds', type=int, default=600,
+                        help='time for a new fleet instance to become available')
+    parser.add_argument('--evaluation-seconds', type=int, default=60)
+    parser.add_argument('--compare-fixed', type=int, nargs='*', default=[],
+                        help='also simulate fixed fleets of these sizes')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    policy = load_policy(args.policy)
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = synthetic_trace(args.synthetic_days, args.peak_arrivals_per_hour,
+                                args.median_session_minutes, args.seed)
+    if not trace:
+        parser.error('the trace is empty')
+
+    report = {'policy': FleetSimulation(policy, trace, args.provisioning_seconds, args.evaluation_seconds).run()}
+    for size in args.compare_fixed:
+        fixed = {'desired_instances': size, 'min_capacity': size, 'max_capacity': size}
+        report[f'fixed-{size}'] = FleetSimulation(fixed, trace, args.provisioning_seconds, args.evaluation_seconds).run()
+
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
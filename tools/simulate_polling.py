@@ -0,0 +1,123 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+"""Simulate the launcher's wait for its notebook URL: fixed vs adaptive polling.
+
+The broker delivers to a response_channels.LocalChannel after a random
+log-normal delay. Clients poll that stand-in on a compressed clock:
+
+- fixed: the legacy loop, one check per second up to 300 checks.
+- adaptive: the schedule of Wait-SessionUrl in session-url-poller.ps1. It makes
+  --fast-checks checks --initial-delay-ms apart, then grows the delay by
+  --multiplier with jitter up to --max-delay-ms, until --deadline seconds.
+
+The report gives time-to-URL (from the delivery to the client noticing it) and
+the number of checks per client.
+
+    python tools/simulate_polling.py --trials 200 --median-delivery 2
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'lambda'))
+sys.path.insert(0, HERE)
+
+from bench_response_channel import Clock  # noqa: E402
+from response_channels import LocalChannel  # noqa: E402
+
+
+def fixed_schedule(args, rnd):
+    for _ in range(300):
+        yield 1.0
+
+
+def adaptive_schedule(args, rnd):
+    delay = args.initial_delay_ms
+    attempt = 0
+    while True:
+        attempt += 1
+        if attempt > args.fast_checks:
+            delay = min(args.max_delay_ms, int(delay * args.multiplier))
+        yield rnd.randint(delay // 2, delay) / 1000
+
+
+def run_trial(schedule, args, rnd, clock, channel, delivery_delay):
+    """Poll the stand-in; the broker delivers delivery_delay seconds after start.
+
+    The channel is only observed when the client checks it, so the delivery is
+    made just before the first check at or after delivery_delay.
+    """
+    start = clock.now()
+    delivered = False
+    checks = 0
+    for sleep in schedule(args, rnd):
+        elapsed = clock.now() - start
+        if elapsed >= args.deadline:
+            break
+        if not delivered and elapsed >= delivery_delay:
+            channel.deliver(None, None, 'session', 'https://notebook.local/?authToken=sim')
+            delivered = True
+        checks += 1
+        if channel.read_once('session') is not None:
+            return clock.now() - start - delivery_delay, checks
+        clock.sleep(min(sleep, max(0.0, args.deadline - (clock.now() - start))))
+    return None, checks
+
+
+def summarize(samples):
+    found = sorted(s[0] for s in samples if s[0] is not None)
+    checks = [s[1] for s in samples]
+    return {
+        'timeouts': sum(1 for s in samples if s[0] is None),
+        'time_to_url_p50_seconds': round(statistics.median(found), 3) if found else None,
+        'time_to_url_p95_seconds': round(found[min(len(found) - 1, int(len(found) * 0.95))], 3) if found else None,
+        'checks_mean': round(statistics.mean(checks), 1),
+        'checks_total': sum(checks),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trials', type=int, default=100)
+    parser.add_argument('--median-delivery', type=float, default=2.0, help='median broker latency in seconds')
+    parser.add_argument('--delivery-sigma', type=float, default=0.8, help='log-normal sigma of the broker latency')
+    parser.add_argument('--deadline', type=float, default=300.0)
+    parser.add_argument('--fast-checks', type=int, default=2)
+    parser.add_argument('--initial-delay-ms', type=int, default=500)
+    parser.add_argument('--max-delay-ms', type=int, default=5000)
+    parser.add_argument('--multiplier', type=float, default=1.5)
+    parser.add_argument('--time-scale', type=float, default=0.002, help='wall seconds per simulated second')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(args.seed)
+    delays = [rnd.lognormvariate(math.log(args.median_delivery), args.delivery_sigma) for _ in range(args.trials)]
+
+    report = {}
+    for name, schedule in (('fixed', fixed_schedule), ('adaptive', adaptive_schedule)):
+        samples = []
+        for delay in delays:
+            workdir = tempfile.mkdtemp()
+            try:
+                channel = LocalChannel(workdir, ttl_seconds=args.deadline)
+                samples.append(run_trial(schedule, args, random.Random(rnd.random()),
+                                         Clock(args.time_scale), channel, delay))
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+        report[name] = summarize(samples)
+
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
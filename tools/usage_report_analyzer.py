@@ -0,0 +1,355 @@
+#// Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#// SPDX-License-Identifier: MIT-0
+
+"""Summarize the AppStream daily usage reports into compact columnar files.
+
+The stack subscribes to the AppStream usage reports. Every day they deliver a
+sessions CSV and an applications CSV to
+
+    <prefix>sessions/schedule=DAILY/year=YYYY/month=MM/day=DD/*.csv
+    <prefix>applications/schedule=DAILY/year=YYYY/month=MM/day=DD/*.csv
+
+in the appstream-logs-* bucket. The reports are streamed row by row from S3 or
+from a local copy, and only the columns used are kept, as typed arrays. Memory
+grows with the number of sessions of one day, never with the size of a file.
+
+Each day gives one part file, day=YYYY-MM-DD.zip, with these tables:
+
+- concurrency: sessions active in each --resolution-seconds bin, per stack/fleet.
+- peaks: sessions, peak concurrent sessions and its time, session hours and
+  duration percentiles, per stack/fleet.
+- durations: histogram of session durations on DURATION_EDGES, per stack/fleet.
+- applications: launches per application and stack/fleet.
+
+Every column is stored as the raw bytes of an array.array (little-endian). The
+types are listed in schema.json, and numpy can read a column with frombuffer.
+manifest.json records the fingerprint (ETag, or size and mtime) of the reports
+behind each part. A run only processes new days and days whose reports changed.
+
+    python tools/usage_report_analyzer.py --source s3://appstream-logs-us-east-1-123456789012-abcdefgh/ --output usage-summary
+    python tools/usage_report_analyzer.py --source ./reports --output usage-summary --report
+"""
+
+import argparse
+import array
+import bisect
+import codecs
+import csv
+import datetime
+import gzip
+import json
+import math
+import os
+import re
+import sys
+import zipfile
+from collections import defaultdict
+
+REPORT_KEY_PATTERN = re.compile(
+    r'(?P<report>sessions|applications)/schedule=DAILY/'
+    r'year=(?P<year>\d{4})/month=(?P<month>\d{2})/day=(?P<day>\d{2})/[^/]+\.csv(\.gz)?$')
+
+# upper bounds of the duration histogram bins, in seconds; the last bin is open
+DURATION_EDGES = (60, 300, 900, 1800, 3600, 7200, 14400, 28800)
+
+MANIFEST_VERSION = 1
+
+SCHEMA = {
+    'concurrency': {'group': 'H', 'bin': 'H', 'sessions': 'L'},
+    'peaks': {'group': 'H', 'sessions': 'L', 'peak': 'L', 'peak_at_seconds': 'l',
+              'session_hours': 'd', 'duration_p50': 'd', 'duration_p90': 'd', 'duration_p99': 'd'},
+    'durations': {'group': 'H', 'bin': 'B', 'count': 'L'},
+    'applications': {'group': 'H', 'application': 'H', 'launches': 'L'},
+}
+
+
+class LocalSource:
+    def __init__(self, root):
+        self.root = root
+
+    def list(self):
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                stat = os.stat(path)
+                yield os.path.relpath(path, self.root).replace(os.sep, '/'), f'{stat.st_size}-{stat.st_mtime_ns}'
+
+    def open(self, key):
+        return open(os.path.join(self.root, key), 'rb')
+
+
+class S3Source:
+    def __init__(self, client, bucket, prefix=''):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def list(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'][len(self.prefix):], item['ETag'].strip('"')
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body']
+
+
+def open_source(uri):
+    if uri.startswith('s3://'):
+        import boto3
+        bucket, _, prefix = uri[len('s3://'):].partition('/')
+        return S3Source(boto3.client('s3'), bucket, prefix)
+    return LocalSource(uri)
+
+
+def discover_days(source):
+    """Return {day: {'sessions': [keys], 'applications': [keys], 'fingerprint': str}}."""
+    days = defaultdict(lambda: {'sessions': [], 'applications': [], 'fingerprints': []})
+    for key, fingerprint in source.list():
+        match = REPORT_KEY_PATTERN.search(key)
+        if not match:
+            continue
+        day = f"{match['year']}-{match['month']}-{match['day']}"
+        days[day][match['report']].append(key)
+        days[day]['fingerprints'].append(f'{key}:{fingerprint}')
+    return {day: {'sessions': sorted(entry['sessions']), 'applications': sorted(entry['applications']),
+                  'fingerprint': '|'.join(sorted(entry['fingerprints']))}
+            for day, entry in days.items()}
+
+
+def iter_rows(source, key):
+    """Stream the rows of one report as dicts, decoding the body as it is read."""
+    body = source.open(key)
+    try:
+        stream = gzip.GzipFile(fileobj=body) if key.endswith('.gz') else body
+        yield from csv.DictReader(codecs.getreader('utf-8-sig')(stream))
+    finally:
+        body.close()
+
+
+def parse_timestamp(value):
+    value = value.strip().replace('Z', '')
+    if not value:
+        return None
+    moment = datetime.datetime.fromisoformat(value.split('.')[0])
+    return moment.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+class StringTable:
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def code(self, value):
+        if value not in self.index:
+            self.index[value] = len(self.values)
+            self.values.append(value)
+        return self.index[value]
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return 0.0
+    return float(ordered[min(len(ordered) - 1, int(len(ordered) * p))])
+
+
+def peak_concurrency(starts, ends):
+    """Sweep the sorted start and end times; an end at the same instant as a start comes first."""
+    starts = sorted(starts)
+    ends = sorted(ends)
+    active = peak = 0
+    peak_at = starts[0] if starts else 0.0
+    j = 0
+    for start in starts:
+        while j < len(ends) and ends[j] <= start:
+            active -= 1
+            j += 1
+        active += 1
+        if active > peak:
+            peak, peak_at = active, start
+    return peak, peak_at
+
+
+def analyze_day(source, day, reports, resolution_seconds):
+    day_start = datetime.datetime.fromisoformat(day).replace(tzinfo=datetime.timezone.utc).timestamp()
+    day_end = day_start + 86400
+    groups = StringTable()
+    applications = StringTable()
+    # per group: clipped start and end offsets in the day, and full durations
+    starts = defaultdict(lambda: array.array('d'))
+    ends = defaultdict(lambda: array.array('d'))
+    durations = defaultdict(lambda: array.array('d'))
+    session_groups = {}
+
+    for key in reports['sessions']:
+        for row in iter_rows(source, key):
+            start = parse_timestamp(row.get('session_start_time', ''))
+            if start is None:
+                continue
+            end = parse_timestamp(row.get('session_end_time', ''))
+            duration = float(row.get('session_duration_in_seconds') or 0)
+            if end is None:
+                end = start + duration
+            duration = duration or max(0.0, end - start)
+            group = groups.code(f"{row.get('stack_name', '')}/{row.get('fleet_name', '')}")
+            session_groups[row.get('user_session_id', '')] = group
+            durations[group].append(duration)
+            clipped_start, clipped_end = max(start, day_start), min(end, day_end)
+            if clipped_end > clipped_start:
+                starts[group].append(clipped_start - day_start)
+                ends[group].append(clipped_end - day_start)
+
+    bins = math.ceil(86400 / resolution_seconds)
+    tables = {name: {column: array.array(code) for column, code in columns.items()}
+              for name, columns in SCHEMA.items()}
+
+    def append(table, **values):
+        for column, value in values.items():
+            tables[table][column].append(value)
+
+    for group in range(len(groups.values)):
+        # difference array over the bins; a session counts in every bin it overlaps
+        diff = [0] * (bins + 1)
+        for start, end in zip(starts[group], ends[group]):
+            diff[int(start // resolution_seconds)] += 1
+            diff[min(bins, math.ceil(end / resolution_seconds))] -= 1
+        active = 0
+        for index in range(bins):
+            active += diff[index]
+            append('concurrency', group=group, bin=index, sessions=active)
+
+        ordered = sorted(durations[group])
+        peak, peak_at = peak_concurrency(starts[group], ends[group])
+        append('peaks', group=group, sessions=len(ordered), peak=peak, peak_at_seconds=int(peak_at),
+               session_hours=sum(e - s for s, e in zip(starts[group], ends[group])) / 3600,
+               duration_p50=percentile(ordered, 0.5), duration_p90=percentile(ordered, 0.9),
+               duration_p99=percentile(ordered, 0.99))
+
+        histogram = [0] * (len(DURATION_EDGES) + 1)
+        for duration in ordered:
+            histogram[bisect.bisect_left(DURATION_EDGES, duration)] += 1
+        for index, count in enumerate(histogram):
+            append('durations', group=group, bin=index, count=count)
+
+    launches = defaultdict(int)
+    for key in reports['applications']:
+        for row in iter_rows(source, key):
+            group = session_groups.get(row.get('user_session_id', ''))
+            if group is None:
+                group = groups.code(f"{row.get('stack_name', '')}/{row.get('fleet_name', '')}")
+            launches[(group, applications.code(row.get('application_name', '')))] += 1
+    for (group, application), count in sorted(launches.items()):
+        append('applications', group=group, application=application, launches=count)
+
+    return tables, {'groups': groups.values, 'applications': applications.values}
+
+
+def write_part(path, day, tables, strings, resolution_seconds):
+    schema = {'day': day, 'resolution_seconds': resolution_seconds, 'duration_edges': DURATION_EDGES,
+              'tables': SCHEMA, 'strings': strings}
+    tmp = path + '.tmp'
+    with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED) as part:
+        part.writestr('schema.json', json.dumps(schema))
+        for name, columns in tables.items():
+            for column, values in columns.items():
+                if sys.byteorder == 'big':
+                    values = array.array(values.typecode, values)
+                    values.byteswap()
+                part.writestr(f'{name}/{column}', values.tobytes())
+    os.replace(tmp, path)
+
+
+def read_part(path):
+    with zipfile.ZipFile(path) as part:
+        schema = json.loads(part.read('schema.json'))
+        tables = {}
+        for name, columns in schema['tables'].items():
+            tables[name] = {}
+            for column, code in columns.items():
+                values = array.array(code)
+                values.frombytes(part.read(f'{name}/{column}'))
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                tables[name][column] = values
+    return schema, tables
+
+
+def load_manifest(output):
+    try:
+        with open(os.path.join(output, 'manifest.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'version': MANIFEST_VERSION, 'days': {}}
+
+
+def save_manifest(output, manifest):
+    tmp = os.path.join(output, 'manifest.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, os.path.join(output, 'manifest.json'))
+
+
+def update(source, output, resolution_seconds, first_day=None, last_day=None):
+    """Process the days that are new or changed since the last run; return their names."""
+    os.makedirs(output, exist_ok=True)
+    manifest = load_manifest(output)
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('resolution_seconds') != resolution_seconds:
+        manifest = {'version': MANIFEST_VERSION, 'resolution_seconds': resolution_seconds, 'days': {}}
+
+    processed = []
+    for day, reports in sorted(discover_days(source).items()):
+        if (first_day and day < first_day) or (last_day and day > last_day) or not reports['sessions']:
+            continue
+        if manifest['days'].get(day, {}).get('fingerprint') == reports['fingerprint']:
+            continue
+        tables, strings = analyze_day(source, day, reports, resolution_seconds)
+        part = f'day={day}.zip'
+        write_part(os.path.join(output, part), day, tables, strings, resolution_seconds)
+        # saved after every day, so an interrupted run resumes where it stopped
+        manifest['days'][day] = {'fingerprint': reports['fingerprint'], 'part': part}
+        save_manifest(output, manifest)
+        processed.append(day)
+    return processed
+
+
+def summarize(output):
+    """Peak concurrency and session totals per stack/fleet over all processed days."""
+    manifest = load_manifest(output)
+    summary = {}
+    for day, entry in sorted(manifest['days'].items()):
+        schema, tables = read_part(os.path.join(output, entry['part']))
+        peaks = tables['peaks']
+        for i, group in enumerate(peaks['group']):
+            name = schema['strings']['groups'][group]
+            item = summary.setdefault(name, {'days': 0, 'sessions': 0, 'session_hours': 0.0,
+                                             'peak': 0, 'peak_day': None, 'duration_p90_max': 0.0})
+            item['days'] += 1
+            item['sessions'] += peaks['sessions'][i]
+            item['session_hours'] = round(item['session_hours'] + peaks['session_hours'][i], 2)
+            item['duration_p90_max'] = max(item['duration_p90_max'], peaks['duration_p90'][i])
+            if peaks['peak'][i] > item['peak']:
+                item['peak'] = peaks['peak'][i]
+                item['peak_day'] = day
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', required=True, help='s3://bucket/prefix/ or a local directory')
+    parser.add_argument('--output', required=True, help='directory of the part files and manifest')
+    parser.add_argument('--resolution-seconds', type=int, default=60)
+    parser.add_argument('--from-day', help='first day to process, YYYY-MM-DD')
+    parser.add_argument('--to-day', help='last day to process, YYYY-MM-DD')
+    parser.add_argument('--report', action='store_true', help='print a summary of all processed days')
+    args = parser.parse_args(argv)
+
+    processed = update(open_source(args.source), args.output, args.resolution_seconds, args.from_day, args.to_day)
+    result = {'processed_days': processed}
+    if args.report:
+        result['summary'] = summarize(args.output)
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())